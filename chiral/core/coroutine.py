@@ -24,6 +24,10 @@ as the result of the yield expression. The core coroutine module defines four Wa
 classes; they should be sufficient for all uses. See the `chiral.net.tcp` module for examples
 of code that works with WaitConditions.
 
+A coroutine may also yield a generator, or a `Coroutine` that has not been started, to call it
+as a subroutine. Much like ``yield from``, the generator then runs inside the calling coroutine
+until it finishes, and its return value or exception is the result of the ``yield`` expression.
+
 If a coroutine yields any value other than a ``WaitCondition``, it behaves as though it had yielded
 a `WaitForNothing`.
 """
@@ -35,12 +39,16 @@ a `WaitForNothing`.
 
 _CHIRAL_RELOADABLE = True
 
-from decorator import decorator
 from collections import deque
 
+from chiral.core import stats
+
+import functools
 import gc
+import os
 import sys
 import traceback
+import types
 import warnings
 import weakref
 
@@ -71,35 +79,44 @@ def trim(docstring):
 	# Return a single string:
 	return '\n'.join(trimmed)
 
-@decorator
-def as_coro(gen, *args, **kwargs):
+# Whether returns_waitcondition checks return values. This costs an extra call and an isinstance()
+# on every call of a marked function, so it is off unless the CHIRAL_CHECK_WAITCONDITIONS
+# environment variable is set; it only affects functions marked after it is changed.
+CHECK_WAITCONDITIONS = bool(os.environ.get("CHIRAL_CHECK_WAITCONDITIONS"))
+
+def as_coro(gen):
 	"""
 	Create a new Coroutine with each call to the wrapped function.
 	"""
 
-	return Coroutine(gen(*args, **kwargs)) #pylint: disable-msg=W0142
+	def as_coro_wrapper(*args, **kwargs):
+		"""Call gen and wrap the generator it returns in a Coroutine."""
+		return Coroutine(gen(*args, **kwargs)) #pylint: disable-msg=W0142
+
+	return functools.update_wrapper(as_coro_wrapper, gen)
+
 
+def _check_waitcondition(func):
+	"""Wrap func so that its return value is checked; see returns_waitcondition."""
 
-@decorator
-def _returns_waitcondition_dec(func, *args, **kwargs):
-	"""Implementation of returns_waitcondition."""
-	# This is a separate function because the decorator module (@decorator) does not provide
-	# for modification of the decorated function docstring.
+	def check_waitcondition_wrapper(*args, **kwargs):
+		"""Call func, and raise a TypeError if it does not return a WaitCondition."""
+		ret = func(*args, **kwargs) #pylint: disable-msg=W0142
 
-	ret = func(*args, **kwargs) #pylint: disable-msg=W0142
+		if ret is not None and not isinstance(ret, WaitCondition):
+			raise TypeError("%s should return a WaitCondition instance; got %s" % (func, ret))
 
-	if ret is not None and not isinstance(ret, WaitCondition):
-		raise TypeError("%s should return a WaitCondition instance; got %s" % (func, ret))
+		return ret
 
-	return ret
+	return functools.update_wrapper(check_waitcondition_wrapper, func)
 
 
 def returns_waitcondition(func):
 	"""
 	Mark a function as returning a WaitCondition.
 
-	When not running in optimized mode, the return value is checked, and a TypeError is
-	thrown if it is not a WaitCondition. In optimized mode, the function is not modified.
+	If ``CHECK_WAITCONDITIONS`` is set, the return value is checked, and a TypeError is
+	thrown if it is not a WaitCondition. Otherwise, the function is not modified.
 
 	Additionally, the function docstring will be amended to indicate that its return value
 	should be expected to be a WaitCondition.
@@ -107,8 +124,8 @@ def returns_waitcondition(func):
 
 	func.__doc__ = trim(func.__doc__) + "\n\nReturns a WaitCondition."
 
-	if __debug__:
-		return _returns_waitcondition_dec(func)
+	if CHECK_WAITCONDITIONS:
+		return _check_waitcondition(func)
 	else:
 		return func
 
@@ -135,11 +152,18 @@ class CoroutineKilledException(Exception):
 	pass
 
 
+class WaitTimeoutException(Exception):
+	"""Indicates that a WaitCondition wrapped with `with_timeout` did not fire in time."""
+	pass
+
+
 class WaitCondition(object):
 	"""
 	Represents a condition for which a Coroutine may need to suspend execution.
 	"""
 
+	__slots__ = ()
+
 	def __init__(self):
 		"""Constructor.
 
@@ -172,6 +196,19 @@ class WaitCondition(object):
 		"""
 		raise NotImplementedError
 
+	def reclaim(self, value, exc):
+		"""
+		Take back a result that was never delivered.
+
+		This is called when the coroutine this WaitCondition resumed with ``(value, exc)`` is
+		killed while its resume is still queued, before it could run. WaitConditions that hand
+		over a resource, such as a `CoroutineMutex` or an item from a `CoroutineQueue`, give it
+		back here; by default, the result is simply dropped.
+
+		This should not generally be called except by `Coroutine.kill`.
+		"""
+		pass
+
 class WaitForNothing(WaitCondition):
 	"""
 	A "false" WaitCondition, which will cause execution to resume immediately.
@@ -182,12 +219,13 @@ class WaitForNothing(WaitCondition):
 	However, a WaitForNothing may carry an exception instead of a value; yielding it will
 	cause that exception to be raised.
 
-	The `returns_waitcondition` decorator wraps all non-WaitConditions that a function returns
-	in WaitForNothing objects, unless Python is running in optimized mode. This helps ensure
-	that one does not accidentally use its return values directly without yielding them from
-	inside a Coroutine.
+	The `returns_waitcondition` decorator can check that a function returns only
+	WaitConditions (see ``CHECK_WAITCONDITIONS``). This helps ensure that one does not
+	accidentally use its return values directly without yielding them from inside a Coroutine.
 	"""
 
+	__slots__ = ("data",)
+
 	def __init__(self, value=None, exc=None):
 		"""
 		Constructor.
@@ -219,6 +257,8 @@ class WaitForCallback(WaitCondition):
 	a tuple, use `WaitForCallbackArgs`.
 	"""
 
+	__slots__ = ("description", "bound_coro")
+
 	def __init__(self, description=None):
 		"""
 		Constructor.
@@ -245,8 +285,8 @@ class WaitForCallback(WaitCondition):
 	def __call__(self, value=None):
 		"""Cause ``value`` to be the return value of the WaitCondition."""
 		assert self.bound_coro
-		self.bound_coro.resume(value)
-		self.bound_coro = None
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(value)
 
 	def throw(self, exc=None):
 		"""Raise an Exception in the bound coroutine.
@@ -260,8 +300,8 @@ class WaitForCallback(WaitCondition):
 			exc = (type(exc), exc, None)
 
 		assert self.bound_coro
-		self.bound_coro.resume(None, exc)
-		self.bound_coro = None
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(None, exc)
 
 	def __repr__(self):
 		if self.description:
@@ -278,6 +318,8 @@ class WaitForCallbackArgs(WaitCondition):
 	in the waiting coroutine.
 	"""
 
+	__slots__ = ("description", "bound_coro")
+
 	def __init__(self, description=None):
 		"""
 		Constructor.
@@ -304,8 +346,8 @@ class WaitForCallbackArgs(WaitCondition):
 	def __call__(self, *args):
 		"""Cause ``args`` to be the return value of the WaitCondition."""
 		assert self.bound_coro
-		self.bound_coro.resume(args)
-		self.bound_coro = None
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(args)
 
 	def throw(self, exc=None):
 		"""Raise an Exception in the bound coroutine.
@@ -318,20 +360,722 @@ class WaitForCallbackArgs(WaitCondition):
 		elif isinstance(exc, Exception):
 			exc = (type(exc), exc, None)
 
-		assert self.bound_coro
-		self.bound_coro.resume(None, exc)
+		assert self.bound_coro
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(None, exc)
+
+	def __repr__(self):
+		if self.description:
+			return "<WaitForCallback %s>" % (self.description, )
+		else:
+			return "<WaitForCallback>"
+
+
+class _ResumeBinding(object):
+	"""
+	Stand-in for a Coroutine when binding a WaitCondition on behalf of another object.
+
+	WaitConditions only ever call ``resume(value, exc)`` on what they are bound to; this
+	forwards that call to an arbitrary function.
+	"""
+
+	__slots__ = ("resume",)
+
+	# This is an opaque helper; it should not have any public methods.
+	#pylint: disable-msg=R0903
+
+	def __init__(self, func):
+		"""Constructor."""
+		self.resume = func
+
+	def __repr__(self):
+		return "<_ResumeBinding %r>" % (self.resume, )
+
+
+class WaitForTimeout(WaitCondition):
+	"""
+	A WaitCondition that wraps another, giving up after a number of seconds.
+
+	If the inner WaitCondition fires first, its result is passed through and the timer is
+	cancelled. If the timer fires first, the inner WaitCondition is unbound (and, if it is a
+	`Coroutine`, killed), and a `WaitTimeoutException` is raised in the waiting coroutine.
+
+	Use `with_timeout` rather than creating instances directly.
+	"""
+
+	__slots__ = (
+		"wait_condition", "timeout", "reactor", "bound_coro", "timer",
+		"_inner_binding", "_timer_binding"
+	)
+
+	def __init__(self, wait_condition, timeout, reactor_instance=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `wait_condition`: The WaitCondition, Coroutine or generator to wait for.
+			- `timeout`: Number of seconds to wait before giving up.
+			- `reactor_instance`: The reactor that schedules the timer; defaults to ``chiral.net.reactor``.
+		"""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		if not isinstance(wait_condition, WaitCondition):
+			wait_condition = Coroutine(wait_condition)
+
+		if reactor_instance is None:
+			# Imported here, since chiral.net depends on this module.
+			from chiral.net import reactor as reactor_instance
+
+		self.wait_condition = wait_condition
+		self.timeout = timeout
+		self.reactor = reactor_instance
+
+		self.bound_coro = None
+		self.timer = None
+		self._inner_binding = _ResumeBinding(self._inner_fired)
+		self._timer_binding = _ResumeBinding(self._timer_fired)
+
+	def bind(self, coro):
+		"""Bind to a given coroutine, starting the timer."""
+		assert self.bound_coro is None
+
+		bind_result = self.wait_condition.bind(self._inner_binding)
+		if bind_result is not None:
+			return bind_result
+
+		self.bound_coro = coro
+		self.timer = self.reactor.schedule(self.timeout)
+		timer_result = self.timer.bind(self._timer_binding)
+		if timer_result is not None:
+			# The timer has already expired; the coroutine is still running, so don't
+			# resume it, but return the timeout like any other ready WaitCondition.
+			self.timer = None
+			self.bound_coro = None
+			return None, self._expire()
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, unbinding the inner WaitCondition and the timer."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+		self.wait_condition.unbind(self._inner_binding)
+		self._cancel_timer()
+
+	def _cancel_timer(self):
+		"""Unbind the timer, if it is still pending."""
+		if self.timer is not None:
+			self.timer.unbind(self._timer_binding)
+			self.timer = None
+
+	def _inner_fired(self, value, exc=None):
+		"""Called when the inner WaitCondition fires."""
+		self._cancel_timer()
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(value, exc)
+
+	def _timer_fired(self, _value, _exc=None):
+		"""Called when the timer fires before the inner WaitCondition."""
+		self.timer = None
+		coro, self.bound_coro = self.bound_coro, None
+		coro.resume(None, self._expire())
+
+	def _expire(self):
+		"""Give up on the inner WaitCondition, and return the exception to raise."""
+		self.wait_condition.unbind(self._inner_binding)
+		if isinstance(self.wait_condition, Coroutine):
+			self.wait_condition.add_completion_callback(swallow_kill)
+			self.wait_condition.kill()
+
+		exc = WaitTimeoutException("%r timed out after %s seconds" % (self.wait_condition, self.timeout))
+		return (WaitTimeoutException, exc, None)
+
+	def reclaim(self, value, exc):
+		"""Pass an undelivered result back to the inner WaitCondition."""
+		self.wait_condition.reclaim(value, exc)
+
+	def __repr__(self):
+		return "<WaitForTimeout %s: %r>" % (self.timeout, self.wait_condition)
+
+
+@returns_waitcondition
+def with_timeout(wait_condition, timeout):
+	"""
+	Wait for ``wait_condition``, but raise `WaitTimeoutException` after ``timeout`` seconds.
+
+	Example::
+
+		try:
+			line = yield coroutine.with_timeout(connection.read_line(), 2)
+		except coroutine.WaitTimeoutException:
+			connection.close()
+			return
+
+	See `WaitForTimeout` for details.
+	"""
+	return WaitForTimeout(wait_condition, timeout)
+
+
+class _WaitForMany(WaitCondition):
+	"""
+	Base class for `WaitForAll` and `WaitForAny`.
+
+	Binding a _WaitForMany binds each of its WaitConditions at once. Subclasses implement
+	`_child_fired`, which is called as each one fires, and call `_finish` once the combined
+	result is known; any WaitConditions still pending are then unbound, and Coroutines among
+	them killed.
+	"""
+
+	__slots__ = ("wait_conditions", "_bindings", "bound_coro", "_pending", "_binding", "_result")
+
+	def __init__(self, wait_conditions):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `wait_conditions`: A sequence of WaitConditions, Coroutines or generators.
+		"""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.wait_conditions = [
+			wait_condition if isinstance(wait_condition, WaitCondition) else Coroutine(wait_condition)
+			for wait_condition in wait_conditions
+		]
+
+		self._bindings = [
+			_ResumeBinding(self._make_callback(index))
+			for index in xrange(len(self.wait_conditions))
+		]
+
+		self.bound_coro = None
+		self._pending = set()
+		self._binding = False
+		self._result = None
+
+	def _make_callback(self, index):
+		"""Return the function to be called when the index-th WaitCondition fires."""
+		def callback(value, exc=None):
+			"""Record that the WaitCondition has fired, then pass its result on."""
+			self._pending.discard(index)
+			self._child_fired(index, value, exc)
+		return callback
+
+	def _child_fired(self, index, value, exc):
+		"""Handle the result of the index-th WaitCondition. Implemented by subclasses."""
+		raise NotImplementedError
+
+	def _release(self, index):
+		"""Unbind the index-th WaitCondition, killing it if it is a suspended Coroutine."""
+		wait_condition = self.wait_conditions[index]
+		wait_condition.unbind(self._bindings[index])
+		if isinstance(wait_condition, Coroutine) and \
+		   wait_condition.state == Coroutine.STATE_SUSPENDED:
+			wait_condition.add_completion_callback(swallow_kill)
+			wait_condition.kill()
+
+	def _finish(self, value, exc):
+		"""Release any pending WaitConditions and resume the bound coroutine."""
+		self._result = (value, exc)
+
+		pending = sorted(self._pending)
+		self._pending.clear()
+		for index in pending:
+			self._release(index)
+
+		# If this happened while bind() was still running, it returns the result itself.
+		if not self._binding:
+			coro, self.bound_coro = self.bound_coro, None
+			coro.resume(value, exc)
+
+	def bind(self, coro):
+		"""Bind to a given coroutine, binding each of the WaitConditions."""
+		assert self.bound_coro is None
+
+		self._binding = True
+		for index, wait_condition in enumerate(self.wait_conditions):
+			if self._result is not None:
+				break
+
+			bind_result = wait_condition.bind(self._bindings[index])
+			if bind_result is None:
+				self._pending.add(index)
+			else:
+				self._child_fired(index, bind_result[0], bind_result[1])
+		self._binding = False
+
+		if self._result is not None:
+			return self._result
+
+		self.bound_coro = coro
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, releasing all pending WaitConditions."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+
+		pending = sorted(self._pending)
+		self._pending.clear()
+		for index in pending:
+			self._release(index)
+
+	def __repr__(self):
+		return "<%s: %d of %d pending>" % (
+			self.__class__.__name__,
+			len(self._pending),
+			len(self.wait_conditions)
+		)
+
+
+class WaitForAll(_WaitForMany):
+	"""
+	A WaitCondition that waits for several others at once.
+
+	All of the WaitConditions (or Coroutines, or generators) are bound, and thus started, as
+	soon as the WaitForAll is yielded. Its result is a list of their results, in the order
+	they were given::
+
+		user, prefs = yield coroutine.WaitForAll([
+			cache.get("user:%d" % user_id),
+			cache.get("prefs:%d" % user_id)
+		])
+
+	By default, the first exception raised by any of them is raised in the waiting coroutine,
+	and the others are unbound (and killed, if they are Coroutines). If ``collect_exceptions``
+	is set, every WaitCondition is waited for, and the result is instead a list of
+	``(value, exc_info)`` tuples as given to completion callbacks.
+	"""
+
+	__slots__ = ("collect_exceptions", "results", "_remaining")
+
+	def __init__(self, wait_conditions, collect_exceptions=False):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `wait_conditions`: A sequence of WaitConditions, Coroutines or generators.
+			- `collect_exceptions`: Return every result and exception instead of failing fast.
+		"""
+		_WaitForMany.__init__(self, wait_conditions)
+
+		self.collect_exceptions = collect_exceptions
+		self.results = [ None ] * len(self.wait_conditions)
+		self._remaining = len(self.wait_conditions)
+
+		if not self._remaining:
+			self._result = (self.results, None)
+
+	def _child_fired(self, index, value, exc):
+		"""Store the result of the index-th WaitCondition."""
+
+		if self.collect_exceptions:
+			self.results[index] = (value, exc)
+		elif exc is not None:
+			self._finish(None, exc)
+			return
+		else:
+			self.results[index] = value
+
+		self._remaining -= 1
+		if not self._remaining:
+			self._finish(self.results, None)
+
+	def reclaim(self, value, exc):
+		"""Pass each undelivered result back to the WaitCondition that gave it."""
+		if exc is not None:
+			return
+
+		for wait_condition, result in zip(self.wait_conditions, value):
+			if self.collect_exceptions:
+				wait_condition.reclaim(*result) #pylint: disable-msg=W0142
+			else:
+				wait_condition.reclaim(result, None)
+
+
+class WaitForAny(_WaitForMany):
+	"""
+	A WaitCondition that waits for the first of several others.
+
+	All of the WaitConditions (or Coroutines, or generators) are bound at once. When the first
+	one fires, the rest are unbound (and killed, if they are Coroutines), and the result is a
+	tuple ``(index, value)`` identifying the winner. If the winner raised an exception, it is
+	raised in the waiting coroutine instead.
+	"""
+
+	__slots__ = ()
+
+	def __init__(self, wait_conditions):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `wait_conditions`: A non-empty sequence of WaitConditions, Coroutines or generators.
+		"""
+		_WaitForMany.__init__(self, wait_conditions)
+
+		if not self.wait_conditions:
+			raise ValueError("WaitForAny needs at least one WaitCondition")
+
+	def _child_fired(self, index, value, exc):
+		"""The index-th WaitCondition fired first; finish with its result."""
+		if exc is not None:
+			self._finish(None, exc)
+		else:
+			self._finish((index, value), None)
+
+	def reclaim(self, value, exc):
+		"""Pass an undelivered result back to the WaitCondition that gave it."""
+		if exc is None:
+			index, value = value
+			self.wait_conditions[index].reclaim(value, None)
+
+
+class TaskGroup(WaitCondition):
+	"""
+	A group of child coroutines that succeed or fail together.
+
+	Children are started with `spawn`. Yielding the group waits until every child spawned so
+	far has finished, and results in a list of their return values, in the order in which
+	they were spawned. If any child fails, the rest are killed at once and its exception is
+	raised in the waiting coroutine instead.
+
+	The remaining children are also killed if the group is, which happens when the
+	coroutine waiting on it is killed (or a timeout or `WaitForAny` abandons the wait), or
+	when a ``with`` block around the group is left::
+
+		with TaskGroup() as group:
+			group.spawn(fetch(first_url))
+			group.spawn(fetch(second_url))
+			first, second = yield group
+
+	Since the ``with`` block kills the group whether or not it was waited on, this ensures
+	that no child outlives a request that was abandoned part-way through.
+	"""
+
+	__slots__ = ("description", "bound_coro", "_children", "_results", "_failure")
+
+	def __init__(self, description=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `description`: The purpose of the group, to be included in ``repr()``.
+		"""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.description = description
+		self.bound_coro = None
+
+		# Children that have not finished yet, by index
+		self._children = {}
+		self._results = []
+		self._failure = None
+
+	def spawn(self, target):
+		"""
+		Start ``target``, a Coroutine or generator, as a child of this group.
+
+		Returns the child Coroutine. Raises RuntimeError if the group has already failed or
+		been killed.
+		"""
+
+		if self._failure is not None:
+			raise RuntimeError("%r has already failed" % (self, ))
+
+		if not isinstance(target, Coroutine):
+			target = Coroutine(target)
+
+		index = len(self._results)
+		self._results.append(None)
+		self._children[index] = target
+
+		# Failures are reported through the group, not as orphans.
+		target.is_watched = True
+		target.add_completion_callback(self._make_callback(index))
+
+		if target.state == Coroutine.STATE_STOPPED:
+			target.start()
+
+		return target
+
+	def _make_callback(self, index):
+		"""Return the completion callback for the index-th child."""
+		def callback(value, exc):
+			"""Record the child's result."""
+			self._child_done(index, value, exc)
+		return callback
+
+	def _child_done(self, index, value, exc):
+		"""Handle the completion of the index-th child."""
+
+		del self._children[index]
+
+		if self._failure is not None:
+			# Already failed or killed; the waiter, if any, has been told.
+			return
+
+		if exc is not None:
+			# Keep the traceback out of the group, so that the child's frames don't
+			# end up in a reference cycle with it.
+			self._failure = (exc[0], exc[1], None)
+			self._kill_children()
+			self._wake(None, exc)
+		else:
+			self._results[index] = value
+			if not self._children:
+				self._wake(list(self._results), None)
+
+	def _wake(self, value, exc):
+		"""Resume the waiting coroutine, if there is one."""
+		coro, self.bound_coro = self.bound_coro, None
+		if coro is not None:
+			coro.resume(value, exc)
+
+	def _kill_children(self):
+		"""Kill every child that has not finished yet."""
+		for index in sorted(self._children):
+			child = self._children.get(index)
+			if child is not None and child.state != Coroutine.STATE_RUNNING:
+				child.add_completion_callback(swallow_kill)
+				child.kill()
+
+	def kill(self):
+		"""
+		Kill every child that has not finished yet.
+
+		A coroutine waiting on the group gets a CoroutineKilledException, as does any that
+		waits on it later, and no more children may be spawned.
+		"""
+
+		if self._failure is None:
+			self._failure = (CoroutineKilledException, CoroutineKilledException(), None)
+
+		self._kill_children()
+		self._wake(None, self._failure)
+
+	def bind(self, coro):
+		"""Bind to a given coroutine."""
+		assert self.bound_coro is None
+
+		if self._failure is not None:
+			return None, self._failure
+
+		if not self._children:
+			return list(self._results), None
+
+		self.bound_coro = coro
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, killing the remaining children."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+		self.kill()
+
+	def __enter__(self):
+		"""Context manager entrance function: return the group."""
+		return self
+
+	def __exit__(self, _exc_type, _exc_value, _exc_tb):
+		"""Context manager exit function: kill any children that are still running."""
+		self.kill()
+
+	def __repr__(self):
+		if self.description:
+			name = "TaskGroup %s" % (self.description, )
+		else:
+			name = "TaskGroup"
+
+		return "<%s: %d of %d running>" % (name, len(self._children), len(self._results))
+
+
+class Event(WaitCondition):
+	"""
+	A WaitCondition that any number of coroutines can wait on at once.
+
+	Unlike other WaitConditions, an Event is not tied to a single coroutine; each coroutine
+	that yields it waits until it is set, and results in the value passed to `set`. Once set,
+	the Event stays set, so later waiters resume at once, until `clear` is called.
+
+	`notify_all` wakes the coroutines waiting at the time, without leaving the Event set, so
+	that they can wait again for the next notification::
+
+		while True:
+			message = yield new_messages
+			yield page.send(message)
+
+	Waiters are resumed in the order in which they started waiting, in a single pass over
+	the list. A waiter that is killed (or whose wait times out) is unbound in constant
+	time, by leaving a gap in the list.
+	"""
+
+	__slots__ = ("description", "is_set", "value", "_waiters", "_slots")
+
+	def __init__(self, description=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `description`: The purpose of the event, to be included in ``repr()``.
+		"""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.description = description
+		self.is_set = False
+		self.value = None
+
+		# Waiting coroutines, in order, with None where one has been unbound or woken; and
+		# the list and position of each. A list being woken by _wake_all is replaced by a
+		# new one, so the slot records which list the coroutine is in.
+		self._waiters = []
+		self._slots = {}
+
+	def bind(self, coro):
+		"""Add a coroutine to the waiters, or return the value at once if the Event is set."""
+		if self.is_set:
+			return self.value, None
+
+		waiters = self._waiters
+		self._slots[coro] = (waiters, len(waiters))
+		waiters.append(coro)
+
+	def unbind(self, coro):
+		"""Remove a coroutine from the waiters, unless it has already been woken."""
+		slot = self._slots.pop(coro, None)
+		if slot is not None:
+			waiters, index = slot
+			waiters[index] = None
+
+	def set(self, value=None):
+		"""Set the Event, resuming every waiting coroutine with ``value``."""
+		self.is_set = True
+		self.value = value
+		self._wake_all(value)
+
+	def clear(self):
+		"""Reset the Event, so that coroutines which yield it wait again."""
+		self.is_set = False
+		self.value = None
+
+	def notify_all(self, value=None):
+		"""Resume every coroutine waiting now with ``value``, without setting the Event."""
+		self._wake_all(value)
+
+	def _wake_all(self, value):
+		"""Resume and remove all current waiters."""
+
+		# Waiters that wait again while being resumed are kept for the next time.
+		waiters = self._waiters
+		self._waiters = []
+		slots = self._slots
+
+		# Hand off one waiter at a time, so that one which is killed by a waiter woken before
+		# it is unbound like any other, and not resumed.
+		for index, coro in enumerate(waiters):
+			if coro is None:
+				continue
+
+			waiters[index] = None
+			del slots[coro]
+			coro.resume(value)
+
+	def __len__(self):
+		"""Return the number of waiting coroutines."""
+		return len(self._slots)
+
+	def __repr__(self):
+		if self.description:
+			name = "Event %s" % (self.description, )
+		else:
+			name = "Event"
+
+		if self.is_set:
+			return "<%s: set to %r>" % (name, self.value)
+		return "<%s: %d waiting>" % (name, len(self._slots))
+
+
+class _QueuedWait(WaitCondition):
+	"""
+	A WaitCondition queued by a `CoroutineMutex`, `CoroutineSemaphore` or `CoroutineQueue`.
+
+	The owner calls `fire` once the wait is satisfied. If it is unbound first (because the
+	waiting coroutine was killed or timed out), it is marked as cancelled, and the owner skips
+	it; see `_pop_waiter`. If the coroutine is killed after `fire` but before it has run, the
+	value it was handed is passed to ``on_reclaim``, so that the owner can give it to someone
+	else.
+	"""
+
+	__slots__ = ("owner", "item", "on_reclaim", "bound_coro", "cancelled", "_result")
+
+	def __init__(self, owner, item=None, on_reclaim=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `owner`: The object this is queued on, for ``repr()``.
+			- `item`: Data for the owner, such as the item a `CoroutineQueue.put` is waiting to add.
+			- `on_reclaim`: Function to call with the value if it is never delivered.
+		"""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.owner = owner
+		self.item = item
+		self.on_reclaim = on_reclaim
 		self.bound_coro = None
+		self.cancelled = False
+		self._result = None
 
-	def __repr__(self):
-		if self.description:
-			return "<WaitForCallback %s>" % (self.description, )
+	def bind(self, coro):
+		"""Bind to a given coroutine."""
+		if self._result is not None:
+			return self._result
+		self.bound_coro = coro
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, cancelling the wait."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+		self.cancelled = True
+
+	def fire(self, value):
+		"""Resume the waiting coroutine with ``value``."""
+		self.item = None
+		coro, self.bound_coro = self.bound_coro, None
+		if coro is None:
+			# Not bound yet.
+			self._result = (value, None)
 		else:
-			return "<WaitForCallback>"
+			coro.resume(value)
+
+	def reclaim(self, value, exc):
+		"""The coroutine was killed before it could take ``value``; give it back to the owner."""
+		on_reclaim, self.on_reclaim = self.on_reclaim, None
+		if on_reclaim is not None and exc is None:
+			on_reclaim(value)
+
+	def __repr__(self):
+		return "<waiting for %r>" % (self.owner, )
+
+def _pop_waiter(waiters):
+	"""Remove and return the first `_QueuedWait` in the deque that was not cancelled, or None."""
+	while waiters:
+		waiter = waiters.popleft()
+		if not waiter.cancelled:
+			return waiter
+	return None
 
 
 class _CoroutineMutexManager(object):
 	"""Context manager for `CoroutineMutex` objects."""
 
+	__slots__ = ("mutex",)
+
 	# Context managers are opaque objects; they should not have any public methods.
 	#pylint: disable-msg=R0903
 
@@ -345,12 +1089,7 @@ class _CoroutineMutexManager(object):
 
 	def __exit__(self, _exc_type, _exc_value, _exc_tb):
 		"""Called when the with statement completes."""
-		self.mutex.current_owner = None
-		if len(self.mutex.queue) > 0:
-			# Start the next item in the queue: create a ContextManager and call it.
-			next_manager = _CoroutineMutexManager(self.mutex)
-			self.mutex.current_owner = next_manager
-			self.mutex.queue.popleft()(next_manager)
+		self.mutex.release()
 
 class CoroutineMutex(object):
 	"""
@@ -377,6 +1116,8 @@ class CoroutineMutex(object):
 	released), so it is not reccomended.
 	"""
 
+	__slots__ = ("description", "current_owner", "queue")
+
 	def __init__(self, description=None):
 		"""
 		Constructor.
@@ -396,14 +1137,14 @@ class CoroutineMutex(object):
 		result of the WaitCondition is a context manager which should immediately be invoked.
 		"""
 
-		if self.current_owner is not None:
+		if self.current_owner is None:
 			manager = _CoroutineMutexManager(self)
 			self.current_owner = manager
 			return WaitForNothing(manager)
 		else:
-			callback = WaitForCallback(description = repr(self))
-			self.queue.append(callback)
-			return callback
+			waiter = _QueuedWait(self, on_reclaim=self._reclaim)
+			self.queue.append(waiter)
+			return waiter
 
 	def release(self):
 		"""
@@ -412,17 +1153,200 @@ class CoroutineMutex(object):
 		Use with caution; the context manager produced by `acquire` is safer.
 		"""
 		self.current_owner = None
-		if len(self.queue) > 0:
-			# Start the next item in the queue: create a ContextManager and call it.
+
+		# Hand the mutex to the next waiter that is still waiting, if any.
+		waiter = _pop_waiter(self.queue)
+		if waiter is not None:
 			next_manager = _CoroutineMutexManager(self)
 			self.current_owner = next_manager
-			self.queue.popleft()(next_manager)
-	
+			waiter.fire(next_manager)
+
+	def _reclaim(self, manager):
+		"""Release the mutex, which was handed to a coroutine that was killed before it ran."""
+		if self.current_owner is manager:
+			self.release()
+
 	def __repr__(self):
 		if self.description:
-			return "<WaitForCallback %s>" % (self.description, )
+			return "<CoroutineMutex %s>" % (self.description, )
 		else:
-			return "<WaitForCallback>"
+			return "<CoroutineMutex>"
+
+
+class CoroutineSemaphore(object):
+	"""
+	A counting semaphore, for limiting the number of coroutines doing something at once.
+
+	`acquire` returns a WaitCondition which resumes the coroutine once one of ``value`` slots
+	is free. Like `CoroutineMutex`, its result should be passed to a ``with`` statement, which
+	releases the slot again::
+
+		with (yield backend_limit.acquire()):
+			result = yield backend.query(...)
+
+	A released slot is handed straight to the coroutine that has waited longest, so waiters
+	are served in order.
+	"""
+
+	__slots__ = ("description", "value", "waiters")
+
+	def __init__(self, value=1, description=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `value`: The number of coroutines that may hold the semaphore at once.
+			- `description`: Included in ``repr()``; it is not otherwise used.
+		"""
+		self.description = description
+		self.value = value
+		self.waiters = deque()
+
+	@returns_waitcondition
+	def acquire(self):
+		"""
+		Acquire a slot.
+
+		Returns a WaitCondition which resumes the coroutine once a slot is claimed. The result
+		of the WaitCondition is a context manager which releases the slot on exit.
+		"""
+
+		if self.value > 0:
+			self.value -= 1
+			return WaitForNothing(self)
+		else:
+			waiter = _QueuedWait(self, on_reclaim=self._reclaim)
+			self.waiters.append(waiter)
+			return waiter
+
+	def release(self):
+		"""Release a slot, handing it to the next waiter if there is one."""
+
+		waiter = _pop_waiter(self.waiters)
+		if waiter is not None:
+			waiter.fire(self)
+		else:
+			self.value += 1
+
+	def _reclaim(self, _value):
+		"""Release a slot that was handed to a coroutine that was killed before it ran."""
+		self.release()
+
+	def __enter__(self):
+		"""Context manager entrance function; the slot has already been acquired."""
+		return self
+
+	def __exit__(self, _exc_type, _exc_value, _exc_tb):
+		"""Context manager exit function: release the slot."""
+		self.release()
+
+	def __repr__(self):
+		if self.description:
+			name = "CoroutineSemaphore %s" % (self.description, )
+		else:
+			name = "CoroutineSemaphore"
+
+		return "<%s: %d free>" % (name, self.value)
+
+
+class CoroutineQueue(object):
+	"""
+	A FIFO queue for passing items between coroutines.
+
+	`get` returns a WaitCondition which results in the next item, suspending the coroutine
+	while the queue is empty. If ``maxsize`` is nonzero, `put` likewise suspends while the
+	queue holds ``maxsize`` items, so that a fast producer is held back to the pace of its
+	consumers::
+
+		yield log_queue.put(line)
+		...
+		line = yield log_queue.get()
+
+	Each operation takes constant time. Items are handed directly to waiting consumers, and
+	waiting producers are woken in order as space becomes free. An item handed to a consumer
+	that is killed before it gets to run is put back at the front of the queue.
+	"""
+
+	__slots__ = ("description", "maxsize", "items", "getters", "putters")
+
+	def __init__(self, maxsize=0, description=None):
+		"""
+		Constructor.
+
+		:Parameters:
+			- `maxsize`: The most items the queue may hold; 0 means no limit.
+			- `description`: Included in ``repr()``; it is not otherwise used.
+		"""
+		self.description = description
+		self.maxsize = maxsize
+		self.items = deque()
+		self.getters = deque()
+		self.putters = deque()
+
+	def __len__(self):
+		return len(self.items)
+
+	@returns_waitcondition
+	def put(self, item):
+		"""
+		Add ``item`` to the queue.
+
+		Returns a WaitCondition which resumes the coroutine once the item has been added.
+		"""
+
+		# Consumers only wait while the queue is empty.
+		getter = _pop_waiter(self.getters)
+		if getter is not None:
+			getter.fire(item)
+			return WaitForNothing()
+
+		if not self.maxsize or len(self.items) < self.maxsize:
+			self.items.append(item)
+			return WaitForNothing()
+
+		putter = _QueuedWait(self, item)
+		self.putters.append(putter)
+		return putter
+
+	@returns_waitcondition
+	def get(self):
+		"""
+		Remove an item from the queue.
+
+		Returns a WaitCondition which results in the item once one is available.
+		"""
+
+		if self.items:
+			item = self.items.popleft()
+
+			# Make room for the first waiting producer's item.
+			putter = _pop_waiter(self.putters)
+			if putter is not None:
+				self.items.append(putter.item)
+				putter.fire(None)
+
+			return WaitForNothing(item)
+
+		getter = _QueuedWait(self, on_reclaim=self._reclaim)
+		self.getters.append(getter)
+		return getter
+
+	def _reclaim(self, item):
+		"""Return an item that was handed to a consumer that was killed before it ran."""
+		getter = _pop_waiter(self.getters)
+		if getter is not None:
+			getter.fire(item)
+		else:
+			# It was taken first, so it goes back at the front.
+			self.items.appendleft(item)
+
+	def __repr__(self):
+		if self.description:
+			name = "CoroutineQueue %s" % (self.description, )
+		else:
+			name = "CoroutineQueue"
+
+		return "<%s: %d items>" % (name, len(self.items))
 
 
 
@@ -469,10 +1393,192 @@ class CoroutineRestart(Exception):
 		self.gen = gen
 
 
-# Store a global list of all current coroutines. The __reload_update__
-# magic prevents xreload.xreload() from wiping out the list.
-_COROUTINES = weakref.WeakValueDictionary()
-setattr(_COROUTINES, "__reload_update__", lambda oldobj: oldobj)
+REGISTRY_OFF, REGISTRY_SAMPLED, REGISTRY_FULL = range(3)
+
+class _CoroutineRegistry(object):
+	"""
+	Registry of live coroutines, used by the introspector.
+
+	Adding every coroutine to a WeakValueDictionary is expensive when short-lived
+	coroutines are created for each read and write, so by default nothing is recorded and
+	the introspector finds coroutines by scanning the garbage collector's object list
+	instead. See `set_registry_mode`.
+	"""
+
+	__slots__ = "mode", "sample_interval", "countdown", "coroutines"
+
+	def __init__(self):
+		self.mode = REGISTRY_OFF
+		self.sample_interval = 1
+		self.countdown = 1
+		self.coroutines = weakref.WeakValueDictionary()
+
+	def add(self, coro):
+		"""Record coro, if the current mode calls for it."""
+		if self.mode == REGISTRY_SAMPLED:
+			self.countdown -= 1
+			if self.countdown > 0:
+				return
+			self.countdown = self.sample_interval
+
+		self.coroutines[id(coro)] = coro
+
+	def live_coroutines(self):
+		"""Return all live coroutines: recorded ones, or every one on the heap if none are."""
+		if self.mode != REGISTRY_OFF:
+			return self.coroutines.values()
+
+		return [ obj for obj in gc.get_objects() if isinstance(obj, Coroutine) ]
+
+	def lookup(self, coro_id):
+		"""Return the live coroutine with the given id, or None."""
+		coro = self.coroutines.get(coro_id)
+		if coro is not None:
+			return coro
+
+		# Not recorded; it may still be alive, though.
+		for obj in gc.get_objects():
+			if id(obj) == coro_id and isinstance(obj, Coroutine):
+				return obj
+
+		return None
+
+	def __reload_update__(self, oldobj):
+		"""Keep the existing registry, and its settings, across xreload.xreload()."""
+		return oldobj
+
+_REGISTRY = _CoroutineRegistry()
+
+def set_registry_mode(mode, sample_interval=100):
+	"""
+	Choose which coroutines are recorded for the introspector.
+
+	REGISTRY_OFF
+		Record nothing; this is the default. The introspector scans the heap instead.
+
+	REGISTRY_SAMPLED
+		Record one of every ``sample_interval`` coroutines created.
+
+	REGISTRY_FULL
+		Record every coroutine.
+
+	Coroutines recorded before the mode changes stay recorded until they are freed.
+	"""
+
+	if mode not in (REGISTRY_OFF, REGISTRY_SAMPLED, REGISTRY_FULL):
+		raise ValueError("unknown registry mode %r" % (mode, ))
+
+	if sample_interval < 1:
+		raise ValueError("sample_interval must be at least 1")
+
+	_REGISTRY.mode = mode
+	_REGISTRY.sample_interval = sample_interval
+	_REGISTRY.countdown = sample_interval
+
+def _generator_name(gen):
+	"""Return the name of the function that created the generator gen."""
+	code = getattr(gen, "gi_code", None)
+	if code is None:
+		# Python 2.5 has no gi_code, and a finished generator has no frame.
+		frame = getattr(gen, "gi_frame", None)
+		if frame is None:
+			return repr(gen)
+		code = frame.f_code
+	return code.co_name
+
+
+
+class _PendingResume(WaitCondition):
+	"""
+	The wait condition of a coroutine whose resume() has been queued by the `_Dispatcher`.
+
+	If the coroutine is killed before it runs, unbinding this gives the result it was to be
+	resumed with back to the WaitCondition that delivered it; see `WaitCondition.reclaim`.
+	"""
+
+	__slots__ = ("source", "value", "exc")
+
+	def __init__(self, source, value, exc):
+		"""Constructor."""
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+		self.source = source
+		self.value = value
+		self.exc = exc
+
+	def bind(self, _coro):
+		"""Bind to a given coroutine."""
+		raise AssertionError("_PendingResume instances cannot be bound.")
+
+	def unbind(self, _coro):
+		"""The coroutine was killed before it could run; hand the result back."""
+		source, self.source = self.source, None
+		if source is not None:
+			source.reclaim(self.value, self.exc)
+		self.value = self.exc = None
+
+	def __repr__(self):
+		return "<resume from %r pending>" % (self.source, )
+
+
+class _Dispatcher(object):
+	"""
+	Run queue for `Coroutine.resume`.
+
+	A coroutine that completes calls its completion callbacks, which are often the resume()
+	methods of coroutines waiting for it; if those ran directly, every link of a chain of
+	coroutines waiting on each other would add to the stack. Instead, resume() only queues the
+	coroutine if another is already running, and the outermost resume() runs the queue in
+	order.
+
+	The dispatcher also holds the optional `chiral.core.profiler.CoroutineProfiler`, which
+	`Coroutine._run` reports to when it is set, and the reactor whose ``run()`` is active, if
+	any, on which coroutines that use up their ``RESUME_BUDGET`` are requeued.
+	"""
+
+	__slots__ = "running", "queue", "profiler", "reactor"
+
+	def __init__(self):
+		self.running = False
+		self.queue = deque()
+		self.profiler = None
+		self.reactor = None
+
+	def dispatch(self, coro, next_value, next_exception):
+		"""Run coro, then every coroutine queued in the meantime."""
+
+		self.running = True
+		queue = self.queue
+		try:
+			coro._run(next_value, next_exception)
+
+			while queue:
+				coro, pending = queue.popleft()
+
+				# Skip coroutines that were killed, or resumed some other way, while queued.
+				if coro.wait_condition is not pending:
+					continue
+
+				# The caller that started the drain has nothing to do with this coroutine,
+				# so don't pass an error up to it, or leave the rest of the queue waiting.
+				try:
+					coro._run(pending.value, pending.exc)
+				except Exception: #pylint: disable-msg=W0703
+					warnings.warn("Queued coro %s raised: %s" % (
+						coro, traceback.format_exc()
+					))
+		finally:
+			self.running = False
+
+			# As in Coroutine._run, don't keep tracebacks in this frame.
+			coro = pending = next_value = next_exception = None
+
+	def __reload_update__(self, oldobj):
+		"""Keep the existing queue across xreload.xreload()."""
+		return oldobj
+
+_DISPATCHER = _Dispatcher()
 
 
 class Coroutine(WaitCondition):
@@ -485,7 +1591,8 @@ class Coroutine(WaitCondition):
 		Created and ready to run, but has not been started.
 
 	STATE_RUNNING
-		Currently executing code.
+		Currently executing code. A coroutine that is being run inline by another (see
+		`_delegate`) is also in this state, with that coroutine as ``self.wait_condition``.
 
 	STATE_SUSPENDED
 		Waiting on a `WaitCondition`, which will be assigned to ``self.wait_condition``.
@@ -494,7 +1601,9 @@ class Coroutine(WaitCondition):
 		Completed successfully. ``self.result`` will be a tuple ``(result, None)``.
 
 	STATE_FAILED
-		Failed with an exception. ``self.result`` will be a tuple ``(None, (type, value, traceback))``.
+		Failed with an exception. ``self.result`` will be a tuple ``(None, (type, value, None))``;
+		the traceback is only passed to the completion callbacks (and so to any coroutines
+		waiting for this one), since keeping it would keep the coroutine in a reference cycle.
 
 	A coroutine is itself a `WaitCondition`, which other coroutines can ``yield`` to wait
 	for completion. Coroutine objects also implement the context manager protocol from PEP 342;
@@ -514,8 +1623,20 @@ class Coroutine(WaitCondition):
 			coro.kill()
 	"""
 
+	__slots__ = (
+		"state", "result", "completion_callbacks", "gen", "_gen_name", "_delegators",
+		"_delegate_killed", "wait_condition", "is_watched", "__weakref__"
+	)
+
 	STATE_STOPPED, STATE_RUNNING, STATE_SUSPENDED, STATE_COMPLETED, STATE_FAILED = range(5)
 
+	# The number of generator steps `resume` may take before the coroutine is put back on
+	# the reactor's ready queue, so that one whose wait conditions are always ready already
+	# (e.g. a connection with a backlog of pipelined requests) can't starve the rest of the
+	# loop. This only applies while a reactor's run() is active; outside of one, there is no
+	# loop to starve. None disables the limit.
+	RESUME_BUDGET = 200
+
 	__state_names = "stopped", "running", "suspended", "completed", "failed"
 
 	def __init__(self, generator, default_callback=None, autostart=False, is_watched=False):
@@ -538,13 +1659,15 @@ class Coroutine(WaitCondition):
 		self.completion_callbacks = [ default_callback ] if default_callback else [ ]
 
 		self.gen = generator
-		self._gen_name = self.gen.gi_frame.f_code.co_name
+		self._delegators = None
+		self._delegate_killed = False
 
 		self.wait_condition = None
 
 		self.is_watched = is_watched
 
-		_COROUTINES[id(self)] = self
+		if _REGISTRY.mode != REGISTRY_OFF:
+			_REGISTRY.add(self)
 
 		if autostart:
 			self.start()
@@ -556,7 +1679,8 @@ class Coroutine(WaitCondition):
 
 		self.result = (result, failure)
 
-		# Remove reference for GC
+		# Remove reference for GC, keeping the name for __repr__
+		self._gen_name = _generator_name(self.gen)
 		self.gen = None
 
 		for callback in self.completion_callbacks:
@@ -583,99 +1707,326 @@ class Coroutine(WaitCondition):
 		callback = None
 		del self.completion_callbacks[:]
 
-		if self.result[1] is not None and not self.is_watched:
-			# The exception was not handled, so log a warning.
+		if self.result[1] is not None:
 			exc_type, exc_obj, exc_traceback = self.result[1]
-			warnings.warn("Orphan coro %s failed: %s" % (
-				self, ''.join(traceback.format_exception(
-					exc_type, exc_obj, exc_traceback
+
+			if not self.is_watched:
+				# The exception was not handled, so log a warning.
+				warnings.warn("Orphan coro %s failed: %s" % (
+					self, ''.join(traceback.format_exception(
+						exc_type, exc_obj, exc_traceback
+					))
 				))
-			))
+
+			# The callbacks have seen the traceback; don't keep it. Its frames include
+			# resume()'s, which refers back to this coroutine, so keeping it would make a
+			# reference cycle that only the garbage collector could free.
+			self.result = (self.result[0], (exc_type, exc_obj, None))
+			del exc_traceback
 
 
 	def resume(self, next_value, next_exception=None):
 		"""
 		Run the coroutine as long as possible.
 
-		This may only be called when the coroutine is in ``STATE_SUSPENDED``.
+		This may only be called when the coroutine is in ``STATE_SUSPENDED``. If another
+		coroutine is already being run (when one coroutine's completion resumes the next, for
+		example), this coroutine is queued instead, and runs once that one has suspended.
 		"""
 
 		assert self.state == self.STATE_SUSPENDED
 
+		if _DISPATCHER.running:
+			# The wait is over, so kill() must not unbind it again; but if the coroutine is
+			# killed before it runs, the result is handed back.
+			pending = _PendingResume(self.wait_condition, next_value, next_exception)
+			self.wait_condition = pending
+			_DISPATCHER.queue.append((self, pending))
+		else:
+			_DISPATCHER.dispatch(self, next_value, next_exception)
+
+	def _run(self, next_value, next_exception):
+		"""Implementation of resume: run until the coroutine suspends or terminates."""
+
 		self.state = self.STATE_RUNNING
 		self.wait_condition = None
 
-		while True:
-			try:
-				# Pass whatever value is available into the exception
-				if next_exception:
-					exc_type, exc_value, exc_tb = next_exception
-					gen_result = self.gen.throw(exc_type, exc_value, exc_tb)
-					del exc_type, exc_value, exc_tb
-				elif next_value is not None:
-					gen_result = self.gen.send(next_value)
-				else:
-					gen_result = self.gen.next()
-
-			except StopIteration, exc:
-				# The coroutine completed successfully
-				self.state = self.STATE_COMPLETED
+		profiler = _DISPATCHER.profiler
+		if profiler is not None:
+			profiler.enter(self)
 
-				if exc.args:
-					result = exc.args[0]
-				else:
-					result = None
+		try:
+			reactor = _DISPATCHER.reactor
+			if reactor is not None:
+				budget = self.RESUME_BUDGET
+			else:
+				budget = None
 
-				self._terminate(result, None)
-				break
+			while True:
+				if self._delegate_killed:
+					next_value, next_exception = self._unwind_killed_delegate()
+
+				if budget is not None:
+					budget -= 1
+					if budget < 0:
+						self._requeue(reactor, next_value, next_exception)
+						break
+
+				try:
+					# Pass whatever value is available into the exception
+					if next_exception:
+						exc_type, exc_value, exc_tb = next_exception
+						gen_result = self.gen.throw(exc_type, exc_value, exc_tb)
+						del exc_type, exc_value, exc_tb
+					elif next_value is not None:
+						gen_result = self.gen.send(next_value)
+					else:
+						gen_result = self.gen.next()
+
+				except StopIteration, exc:
+					if exc.args:
+						result = exc.args[0]
+					else:
+						result = None
+
+					if self._delegators:
+						# A delegated generator finished; pass its result to its caller.
+						next_value, next_exception = self._return_to_delegator(result, None)
+						continue
+
+					# The coroutine completed successfully
+					self.state = self.STATE_COMPLETED
+					self._terminate(result, None)
+					break
 
-			except CoroutineRestart, exc:
-				# Restart with a new Coroutine or generator
+				except CoroutineRestart, exc:
+					# Restart with a new Coroutine or generator
+
+					if isinstance(exc.gen, Coroutine):
+						assert exc.gen.state == self.STATE_STOPPED
+						self.gen = exc.gen.gen
+
+						# The callbacks belong to whichever coroutine is restarting, which may
+						# be one inlined by _delegate.
+						owner = self
+						if self._delegators and self._delegators[-1][1] is not None:
+							owner = self._delegators[-1][1]
+						owner.completion_callbacks.extend(exc.gen.completion_callbacks)
+					else:
+						self.gen = exc.gen
+
+					next_value, next_exception = None, None
+					continue
+
+				except Exception: #pylint: disable-msg=W0703
+					if self._delegators:
+						# Raise the exception in the delegated generator's caller.
+						next_value, next_exception = self._return_to_delegator(
+							None, sys.exc_info()
+						)
+						continue
+
+					# An (unexpected) exception was thrown; terminate the coroutine.
+					self.state = self.STATE_FAILED
+					self._terminate(None, sys.exc_info())
+					break
 
-				if isinstance(exc.gen, Coroutine):
-					assert exc.gen.state == self.STATE_STOPPED
-					self.gen = exc.gen.gen
-					self.completion_callbacks.extend(exc.gen.completion_callbacks)
+				if gen_result is None:
+					# Optimize handling None
+					next_value, next_exception = None, None
+					continue
+
+				result_type = type(gen_result)
+				if result_type is types.GeneratorType or (
+					result_type is Coroutine
+					and gen_result.state == self.STATE_STOPPED
+					and not gen_result.completion_callbacks
+				):
+					# Run the generator (or the generator of a coroutine nobody else is
+					# waiting for) in this coroutine, like "yield from", rather than
+					# starting a separate Coroutine and waiting for it.
+					self._delegate(gen_result)
+					del gen_result
+					next_value, next_exception = None, None
+					continue
+
+				if self._delegate_killed:
+					# What was yielded belongs to a generator that has been abandoned.
+					del gen_result
+					next_value, next_exception = self._unwind_killed_delegate()
+					continue
+
+				if not isinstance(gen_result, WaitCondition):
+					# The generator yielded a value that was not a WaitCondition
+					# instance. Treat it as another coroutine.
+					gen_result = Coroutine(gen_result, autostart=True)
+
+				bind_result = gen_result.bind(self)
+
+				if bind_result is not None:	
+
+					# Delete the reference to gen_result here, to ensure prompt GC
+					del gen_result
+
+					# The WaitCondition was already ready; use whatever value
+					# or exception it gave, and loop around.
+					next_value, next_exception = bind_result
+					continue
 				else:
-					self.gen = exc.gen
+					# There's nothing else we can do now.
+					self.state = self.STATE_SUSPENDED
+					self.wait_condition = gen_result
+					break
+		finally:
+			if profiler is not None:
+				profiler.leave(self)
 
-				next_value, next_exception = None, None
-				continue
+		# Tracebacks refer back to this frame, so don't leave one in a local variable.
+		next_exception = exc_tb = None
+		del self
 
-			except Exception: #pylint: disable-msg=W0703
-				# An (unexpected) exception was thrown; terminate the coroutine.
-				self.state = self.STATE_FAILED
-				self._terminate(None, sys.exc_info())
-				break
+	def _delegate(self, target):
+		"""
+		Suspend the current generator and run target, a generator or stopped Coroutine, in its
+		place until it finishes.
 
-			if gen_result is None:
-				# Optimize handling None
-				next_value, next_exception = None, None
-				continue
+		A Coroutine's state and result are still updated as though it had run by itself.
+		"""
+
+		if self._delegators is None:
+			self._delegators = []
 
-			if not isinstance(gen_result, WaitCondition):
-				# The generator yielded a value that was not a WaitCondition
-				# instance. Treat it as another coroutine.
-				gen_result = Coroutine(gen_result, autostart=True)
+		if type(target) is Coroutine:
+			target.state = self.STATE_RUNNING
+			target.wait_condition = self
+			target.is_watched = True
+			self._delegators.append((self.gen, target))
+			self.gen = target.gen
+		else:
+			self._delegators.append((self.gen, None))
+			self.gen = target
 
-			bind_result = gen_result.bind(self)
+	def _return_to_delegator(self, result, failure):
+		"""
+		Return from a delegated generator to its caller.
 
-			if bind_result is not None:	
+		Returns the ``(value, exception)`` pair with which to resume the caller.
+		"""
 
-				# Delete the reference to gen_result here, to ensure prompt GC
-				del gen_result
+		self.gen, target = self._delegators.pop()
 
-				# The WaitCondition was already ready; use whatever value
-				# or exception it gave, and loop around.
-				next_value, next_exception = bind_result
-				continue
+		if target is not None:
+			target.wait_condition = None
+			if failure is None:
+				target.state = self.STATE_COMPLETED
 			else:
-				# There's nothing else we can do now.
-				self.state = self.STATE_SUSPENDED
-				self.wait_condition = gen_result
-				break
+				target.state = self.STATE_FAILED
 
-		del self
+			if target.completion_callbacks:
+				# Let callbacks added while the coroutine ran see and modify the result.
+				target._terminate(result, failure)
+				result, failure = target.result
+			else:
+				target.result = (result, failure)
+				target._gen_name = _generator_name(target.gen)
+				target.gen = None
+
+		return result, failure
+
+	def _unwind_delegators(self, failure):
+		"""Abandon all delegated generators, failing any inlined coroutines with failure."""
+
+		delegators = self._delegators
+		self._delegators = None
+
+		self.gen = delegators[0][0]
+
+		for _gen, target in reversed(delegators):
+			if target is not None:
+				target.wait_condition = None
+				target.state = self.STATE_FAILED
+				target._terminate(None, failure)
+
+	def _kill_delegated(self, target, failure):
+		"""
+		Kill target, a Coroutine being run inline by this one, and raise failure in its caller.
+
+		Any generators and inlined coroutines that target has itself delegated to are abandoned,
+		as in `_unwind_delegators`. If this coroutine is running, because target was killed by
+		code running inside it, target is only marked as failed; `_run` unwinds it as soon as
+		the running generator yields or returns.
+		"""
+
+		if self.state == self.STATE_RUNNING:
+			target.state = self.STATE_FAILED
+			target.result = (None, failure)
+			self._delegate_killed = True
+			return
+
+		# What we were waiting for belongs to a generator that is being abandoned.
+		self.wait_condition.unbind(self)
+		self.wait_condition = None
+
+		# Resume the caller as if it had been waiting for target as a separate coroutine.
+		self.resume(*self._abandon_delegated(target, failure)) #pylint: disable-msg=W0142
+
+	def _unwind_killed_delegate(self):
+		"""
+		Abandon the outermost inlined coroutine marked as killed by `_kill_delegated`.
+
+		Returns the ``(value, exception)`` pair with which to resume its caller.
+		"""
+
+		self._delegate_killed = False
+
+		for _gen, target in self._delegators:
+			if target is not None and target.state == self.STATE_FAILED:
+				return self._abandon_delegated(target, target.result[1])
+
+	def _abandon_delegated(self, target, failure):
+		"""
+		Remove target, an inlined Coroutine, and everything above it from the delegation stack,
+		failing them with failure. Returns target's result.
+		"""
+
+		delegators = self._delegators
+		index = len(delegators) - 1
+		while delegators[index][1] is not target:
+			index -= 1
+
+		abandoned = delegators[index:]
+		del delegators[index:]
+		self.gen = abandoned[0][0]
+
+		for _gen, inner in reversed(abandoned[1:]):
+			if inner is not None:
+				inner_failure = failure
+				if inner.state == self.STATE_FAILED:
+					# It was killed itself, while this coroutine was running.
+					inner_failure = inner.result[1]
+
+				inner.wait_condition = None
+				inner.state = self.STATE_FAILED
+				inner._terminate(None, inner_failure)
+
+		target.wait_condition = None
+		target.state = self.STATE_FAILED
+		target._terminate(None, failure)
+
+		return target.result
+
+	def _requeue(self, reactor, next_value, next_exception):
+		"""
+		Suspend until reactor's next loop, then resume with the given value or exception.
+
+		This is called by `resume` once the coroutine has used up ``RESUME_BUDGET``.
+		"""
+
+		stats.increment("chiral.core.coroutine.resume_budget_exhausted")
+
+		self.wait_condition = reactor.ready_with(next_value, next_exception)
+		self.wait_condition.bind(self)
+		self.state = self.STATE_SUSPENDED
 
 	def start(self):
 		"""Begin running the coroutine.
@@ -685,7 +2036,12 @@ class Coroutine(WaitCondition):
 
 		assert self.state == self.STATE_STOPPED
 		self.state = self.STATE_SUSPENDED
-		self.resume(None)
+
+		# Unlike resume(), run the first step now even if another coroutine is running.
+		if _DISPATCHER.running:
+			self._run(None, None)
+		else:
+			_DISPATCHER.dispatch(self, None, None)
 
 	def bind(self, coro):
 		"""Bind to another coroutine (`WaitCondition`).
@@ -743,27 +2099,45 @@ class Coroutine(WaitCondition):
 		"""
 		Forcefully stop running this coroutine.
 
-		If the coroutine is not in ``STATE_RUNNING`` or ``STATE_SUSPENDED``, this does nothing.
 		A suspended coroutine will have its current wait condition unbound; its completion
-		callback will then be called with a CoroutineKilledException.
+		callback will then be called with a CoroutineKilledException. A coroutine that has not
+		been started yet is killed the same way, without running at all. If the coroutine has
+		already terminated, this does nothing.
 		"""
 
-		if self.state == self.STATE_SUSPENDED:
-			self.wait_condition.unbind(self)
-			self.wait_condition = None
+		if self.state in (self.STATE_SUSPENDED, self.STATE_STOPPED):
+			# The wait condition is None if the coroutine has not been started.
+			if self.wait_condition is not None:
+				self.wait_condition.unbind(self)
+				self.wait_condition = None
 			self.state = self.STATE_FAILED
 
+			if _DISPATCHER.profiler is not None:
+				_DISPATCHER.profiler.forget(self)
+
 			# XXX: Dirty hack to get a traceback to the current point. 
 			try:
 				raise CoroutineKilledException()
 			except CoroutineKilledException:
 				pass
 
+			if self._delegators:
+				self._unwind_delegators(sys.exc_info())
+
 			self._terminate(None, sys.exc_info())
 
 		elif self.state == self.STATE_RUNNING:
-			# XXX kill self while running?
-			raise NotImplementedError
+			if self.wait_condition is None:
+				# XXX kill self while running?
+				raise NotImplementedError
+
+			# This coroutine is being run inline by another; see _delegate.
+			try:
+				raise CoroutineKilledException()
+			except CoroutineKilledException:
+				pass
+
+			self.wait_condition._kill_delegated(self, sys.exc_info())
 
 	def __enter__(self):
 		"""Context manager entrance function: start this coroutine."""
@@ -783,7 +2157,12 @@ class Coroutine(WaitCondition):
 
 		name = self.__class__.__name__
 		if name == "Coroutine":
-			name = "\"%s\"" % (self._gen_name, )
+			if self._delegators:
+				name = "\"%s\"" % (_generator_name(self._delegators[0][0]), )
+			elif self.gen is not None:
+				name = "\"%s\"" % (_generator_name(self.gen), )
+			else:
+				name = "\"%s\"" % (self._gen_name, )
 
 		return "<Coroutine %s: %s, %s%s%s>" % (
 			id(self),
@@ -798,6 +2177,18 @@ class Coroutine(WaitCondition):
 
 		return "coroutine", id(self)
 
+	def _attributes(self):
+		"""Return a dict of this coroutine's attributes, both slots and ``__dict__`` entries."""
+
+		attributes = {}
+		for cls in type(self).__mro__:
+			for name in getattr(cls, "__slots__", ()):
+				if name != "__weakref__" and hasattr(self, name):
+					attributes[name] = getattr(self, name)
+
+		attributes.update(getattr(self, "__dict__", {}))
+		return attributes
+
 	def introspection_info(self):
 		"""Returns the introspection information for this coroutine.
 
@@ -806,7 +2197,7 @@ class Coroutine(WaitCondition):
 
 		return (
 			self,
-			( "Attributes:", self.__dict__ ),
+			( "Attributes:", self._attributes() ),
 			( "Referrers: ", [ repr(x) for x in gc.get_referrers(self) ] ),
 			( "dir():", dir(self) ),
 		)
@@ -814,33 +2205,67 @@ class Coroutine(WaitCondition):
 class _chiral_introspection(object):
 	"""Module-level introspection routines."""
 
+	_MODE_NAMES = { REGISTRY_OFF: "off", REGISTRY_SAMPLED: "sampled", REGISTRY_FULL: "full" }
+
 	@staticmethod
 	def main():
-		"""main info: return a list of all current coroutines."""
-		coro_list = _COROUTINES.values()
+		"""main info: return the registry mode and a list of all current coroutines."""
+		if _REGISTRY.mode == REGISTRY_OFF:
+			mode = "Registry off; coroutines found by heap scan - "
+		elif _REGISTRY.mode == REGISTRY_SAMPLED:
+			mode = "Registry sampling 1 in %d coroutines - " % (_REGISTRY.sample_interval, )
+		else:
+			mode = "Registry recording all coroutines - "
+
+		coro_list = _REGISTRY.live_coroutines()
 		coro_list.sort(key = id)
-		return coro_list
+		return [ (
+			mode,
+			"@chiral.core.coroutine:registry:off:Off",
+			"@chiral.core.coroutine:registry:sampled:Sample",
+			"@chiral.core.coroutine:registry:full:Record All"
+		) ] + coro_list
 
 	@staticmethod
 	def coroutine(coro_id):
 		"""Look up the coroutine with the given id and return its introspection_info()."""
-		try:
-			coro = _COROUTINES[int(coro_id)]
-		except KeyError:
+		coro = _REGISTRY.lookup(int(coro_id))
+		if coro is None:
 			return None
 
 		return coro.introspection_info()
 
+	@staticmethod
+	def cmd_registry(mode_name):
+		"""Change the registry mode."""
+		for mode, name in _chiral_introspection._MODE_NAMES.iteritems():
+			if name == mode_name:
+				set_registry_mode(mode)
+		return ""
+
 __all__ = [
 	"as_coro",
 	"returns_waitcondition",
 	"swallow_kill",
 	"CoroutineKilledException",
+	"WaitTimeoutException",
 	"WaitCondition",
 	"WaitForNothing",
 	"WaitForCallback",
 	"WaitForCallbackArgs",
+	"WaitForTimeout",
+	"WaitForAll",
+	"WaitForAny",
+	"TaskGroup",
+	"with_timeout",
+	"set_registry_mode",
+	"REGISTRY_OFF",
+	"REGISTRY_SAMPLED",
+	"REGISTRY_FULL",
+	"Event",
 	"CoroutineMutex",
+	"CoroutineSemaphore",
+	"CoroutineQueue",
 	"CoroutineRestart",
 	"Coroutine"
 ]
@@ -0,0 +1,227 @@
+"""
+Result caching for coroutine functions.
+
+The `memoize` decorator wraps a function that returns a WaitCondition, such as an `as_coro`
+function or a `chiral.net.memcache` lookup, so that its results are cached by arguments::
+
+	@memoize(max_size = 10000, ttl = 60)
+	@as_coro
+	def get_user(user_id):
+		row = yield threadpool.run_in_thread(db.fetch_user, user_id)
+		raise StopIteration(User(row))
+
+	user = yield get_user(42)
+
+A cached result is returned in a `WaitForNothing`, without calling the function. On a miss, the
+function is called once, and every coroutine that asks for the same arguments before it
+finishes waits for that same call, so a burst of requests for an uncached key causes only
+one backend request. Failures are passed to every waiting caller, but not cached.
+
+Arguments must be hashable. Cached values are shared between callers, so they should not be
+modified.
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+import functools
+import time
+
+from chiral.core.coroutine import Coroutine, WaitForNothing
+
+# Fields of the entries in _MemoCache's linked list
+_PREV, _NEXT, _KEY, _VALUE, _EXPIRES = range(5)
+
+# Key of the sentinel entry at both ends of _MemoCache's linked list
+_ROOT = object()
+
+def _make_key(args, kwargs):
+	"""Return the cache key for a call with the given arguments."""
+	if kwargs:
+		return args, tuple(sorted(kwargs.iteritems()))
+	return args
+
+def _wait_for(wait_condition):
+	"""Generator which returns the result of wait_condition."""
+	result = yield wait_condition
+	raise StopIteration(result)
+
+class _MemoCache(object):
+	"""
+	Cache and in-flight calls for one memoized function.
+
+	Entries are kept in a dict, and also in a circular doubly-linked list in order of use,
+	so that both lookups and LRU eviction take constant time. The list links entries by key,
+	through the dict, rather than referring to them directly, so that the cache holds no
+	reference cycles and is freed as soon as it is no longer used. The sentinel entry at
+	both ends of the list is kept in the dict under `_ROOT`.
+	"""
+
+	__slots__ = ("func", "max_size", "ttl", "entries", "root", "in_flight", "hits", "misses")
+
+	def __init__(self, func, max_size, ttl):
+		"""Constructor."""
+		self.func = func
+		self.max_size = max_size
+		self.ttl = ttl
+
+		self.root = [ _ROOT, _ROOT, _ROOT, None, None ]
+		self.entries = { _ROOT: self.root }
+
+		# Coroutines running the function, by key
+		self.in_flight = {}
+
+		self.hits = 0
+		self.misses = 0
+
+	def __call__(self, *args, **kwargs):
+		"""Return a WaitCondition for the result of func(*args, **kwargs)."""
+
+		key = _make_key(args, kwargs)
+		link = self.entries.get(key)
+		if link is not None:
+			expires = link[_EXPIRES]
+			if expires is None or expires > time.time():
+				self.hits += 1
+				self._move_to_end(link)
+				return WaitForNothing(link[_VALUE])
+
+			self._remove(link)
+
+		self.misses += 1
+
+		fetch = self.in_flight.get(key)
+		if fetch is None:
+			wait_condition = self.func(*args, **kwargs) #pylint: disable-msg=W0142
+			if isinstance(wait_condition, Coroutine) and \
+			   wait_condition.state == Coroutine.STATE_STOPPED:
+				fetch = wait_condition
+			else:
+				fetch = Coroutine(_wait_for(wait_condition))
+
+			# Failures are passed on to the callers.
+			fetch.is_watched = True
+			self.in_flight[key] = fetch
+			fetch.add_completion_callback(self._make_callback(key, fetch))
+			fetch.start()
+
+			if fetch.state == Coroutine.STATE_COMPLETED:
+				return WaitForNothing(fetch.result[0])
+
+		# Each caller waits through a coroutine of its own, so that killing one (on a
+		# timeout, say) doesn't kill the call that the others are waiting for.
+		return Coroutine(_wait_for(fetch))
+
+	def _make_callback(self, key, fetch):
+		"""Return the completion callback for the call of func that will fill key."""
+		def callback(value, exc):
+			"""Cache the result, unless the key was invalidated in the meantime."""
+			if self.in_flight.get(key) is fetch:
+				del self.in_flight[key]
+				if exc is None:
+					self._store(key, value)
+		return callback
+
+	def _store(self, key, value):
+		"""Add or replace the entry for key, evicting the least recently used if full."""
+
+		if self.ttl is None:
+			expires = None
+		else:
+			expires = time.time() + self.ttl
+
+		link = self.entries.get(key)
+		if link is not None:
+			link[_VALUE] = value
+			link[_EXPIRES] = expires
+			self._move_to_end(link)
+			return
+
+		entries = self.entries
+		root = self.root
+		last = root[_PREV]
+		entries[key] = [ last, _ROOT, key, value, expires ]
+		entries[last][_NEXT] = root[_PREV] = key
+
+		if len(self) > self.max_size:
+			self._remove(entries[root[_NEXT]])
+
+	def _move_to_end(self, link):
+		"""Mark an entry as the most recently used."""
+		entries = self.entries
+		root = self.root
+		key = link[_KEY]
+		entries[link[_PREV]][_NEXT] = link[_NEXT]
+		entries[link[_NEXT]][_PREV] = link[_PREV]
+		last = root[_PREV]
+		entries[last][_NEXT] = root[_PREV] = key
+		link[_PREV] = last
+		link[_NEXT] = _ROOT
+
+	def _remove(self, link):
+		"""Remove an entry."""
+		entries = self.entries
+		entries[link[_PREV]][_NEXT] = link[_NEXT]
+		entries[link[_NEXT]][_PREV] = link[_PREV]
+		del entries[link[_KEY]]
+
+	def invalidate(self, *args, **kwargs):
+		"""
+		Discard the cached result for the given arguments.
+
+		A call already running for them will not have its result cached; the next request
+		starts a new one.
+		"""
+
+		key = _make_key(args, kwargs)
+		self.in_flight.pop(key, None)
+		link = self.entries.get(key)
+		if link is not None:
+			self._remove(link)
+
+	def clear(self):
+		"""Discard all cached results."""
+
+		self.root[:] = [ _ROOT, _ROOT, _ROOT, None, None ]
+		self.entries = { _ROOT: self.root }
+		self.in_flight.clear()
+
+	def __len__(self):
+		# Don't count the sentinel.
+		return len(self.entries) - 1
+
+	def __repr__(self):
+		return "<memoize cache for %r: %d entries, %d hits, %d misses>" % (
+			self.func, len(self), self.hits, self.misses
+		)
+
+def memoize(max_size=1000, ttl=None):
+	"""
+	Decorator: cache the results of a function that returns a WaitCondition.
+
+	:Parameters:
+		- `max_size`: The most results to keep; the least recently used is evicted first.
+		- `ttl`: How long, in seconds, a result stays valid; None means forever.
+
+	The decorated function has a ``cache`` attribute, whose ``invalidate(*args, **kwargs)``
+	and ``clear()`` methods discard cached results, and ``hits`` and ``misses`` attributes
+	count lookups. See the module documentation.
+	"""
+
+	def decorate(func):
+		"""Wrap func."""
+		cache = _MemoCache(func, max_size, ttl)
+
+		def memoized(*args, **kwargs):
+			"""Return a WaitCondition for the (possibly cached) result of func."""
+			return cache(*args, **kwargs) #pylint: disable-msg=W0142
+
+		memoized = functools.update_wrapper(memoized, func)
+		memoized.cache = cache
+		return memoized
+
+	return decorate
+
+__all__ = [ "memoize" ]
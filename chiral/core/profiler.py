@@ -0,0 +1,292 @@
+"""
+Per-coroutine profiling.
+
+cProfile attributes time to the generator frames that happen to be running, which says little
+about which logical task used it, and nothing about how long each task spent waiting. When
+enabled, the coroutine profiler instead records, for each kind of coroutine:
+
+- how many times it was resumed, and how much time it spent running;
+- how long it spent suspended, broken down by the class of `WaitCondition` it waited on.
+
+A coroutine's kind is its class, for subclasses of `Coroutine` such as the connections of a
+`chiral.net.tcp.TCPServer`, or the name of its generator function otherwise. Generators called
+as subroutines run inside their caller, so their time is counted as the caller's.
+
+Run time is measured with `time.time`, so it is the time the coroutine kept the reactor's thread
+busy: CPU time, plus any time spent blocked in calls that should not have blocked. Time spent
+in coroutines started or resumed from inside another coroutine is only counted once, for the
+inner one. Wait times include the time a resumed coroutine spent in the run queue.
+
+Profiling is off by default, and costs almost nothing when off::
+
+	from chiral.core import profiler
+	prof = profiler.enable()
+	...
+	print "\\n".join(prof.summary())
+
+The results are also shown, and can be sorted, in the introspector.
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+from chiral.core import coroutine
+
+import time
+import weakref
+
+_CHIRAL_RELOADABLE = True
+
+class ProfileEntry(object):
+	"""Statistics for one kind of coroutine."""
+
+	__slots__ = "name", "resumes", "run_time", "max_run_time", "waits"
+
+	def __init__(self, name):
+		self.name = name
+		self.resumes = 0
+		self.run_time = 0.0
+		self.max_run_time = 0.0
+
+		# WaitCondition class name -> [ count, total time ]
+		self.waits = {}
+
+	@property
+	def wait_time(self):
+		"""Total time spent suspended."""
+		return sum(total for _count, total in self.waits.itervalues())
+
+	def summary(self):
+		"""Return a one-line summary of the entry."""
+		return "%s: %d resumes, %.3f ms running (%.3f ms mean, %.3f ms max), %.3f s waiting" % (
+			self.name,
+			self.resumes,
+			self.run_time * 1000,
+			self.run_time * 1000 / (self.resumes or 1),
+			self.max_run_time * 1000,
+			self.wait_time
+		)
+
+	def wait_summary(self):
+		"""Return a dict of wait statistics lines, by WaitCondition class."""
+		return dict(
+			(name, "%d waits, %.3f s total, %.3f ms mean" % (count, total, total * 1000 / count))
+			for name, (count, total)
+			in self.waits.iteritems()
+		)
+
+
+def _coroutine_name(coro):
+	"""Return the name under which coro's statistics are kept."""
+
+	if type(coro) is not coroutine.Coroutine:
+		return coro.__class__.__name__
+
+	# Report a coroutine that is running a delegated generator under its outermost one.
+	if coro._delegators:
+		return coroutine._generator_name(coro._delegators[0][0])
+
+	return coroutine._generator_name(coro.gen)
+
+
+class CoroutineProfiler(object):
+	"""
+	Per-coroutine statistics.
+
+	A CoroutineProfiler is attached by `enable`. `Coroutine._run` then calls `enter` and
+	`leave` around each time a coroutine runs, and `Coroutine.kill` calls `forget`.
+	"""
+
+	# Sort orders for `sorted_entries`: key function, and whether to sort in descending order.
+	SORT_KEYS = {
+		"name": (lambda entry: entry.name, False),
+		"resumes": (lambda entry: entry.resumes, True),
+		"run": (lambda entry: entry.run_time, True),
+		"mean": (lambda entry: entry.run_time / (entry.resumes or 1), True),
+		"max": (lambda entry: entry.max_run_time, True),
+		"wait": (lambda entry: entry.wait_time, True)
+	}
+
+	def __init__(self, clock = time.time):
+		"""
+		Constructor.
+
+		:param clock: Function returning the current time in seconds; tests may replace it.
+		"""
+
+		self.clock = clock
+		self.reset()
+
+		# Stack of [ entry, start time ] for the coroutines currently running; there is more
+		# than one when a coroutine starts another.
+		self.running = []
+
+		# coroutine -> (suspend time, WaitCondition class name), for suspended coroutines. Weak,
+		# so that coroutines abandoned while suspended don't stay here.
+		self.suspended = weakref.WeakKeyDictionary()
+
+	def reset(self):
+		"""Clear all statistics."""
+		self.entries = {}
+		self.started = self.clock()
+
+	def enter(self, coro):
+		"""Record that coro is about to run. This should only be called by `Coroutine`."""
+
+		now = self.clock()
+
+		running = self.running
+		if running:
+			# Stop the clock for the coroutine that is starting or resuming this one.
+			outer = running[-1]
+			outer[0].run_time += now - outer[1]
+
+		name = _coroutine_name(coro)
+		entry = self.entries.get(name)
+		if entry is None:
+			entry = self.entries[name] = ProfileEntry(name)
+
+		entry.resumes += 1
+
+		suspended = self.suspended.pop(coro, None)
+		if suspended is not None:
+			since, wait_name = suspended
+			wait = entry.waits.get(wait_name)
+			if wait is None:
+				wait = entry.waits[wait_name] = [ 0, 0.0 ]
+			wait[0] += 1
+			wait[1] += now - since
+
+		running.append([ entry, now ])
+
+	def leave(self, coro):
+		"""Record that coro has suspended or terminated. This should only be called by `Coroutine`."""
+
+		now = self.clock()
+
+		entry, since = self.running.pop()
+		elapsed = now - since
+		entry.run_time += elapsed
+		if elapsed > entry.max_run_time:
+			entry.max_run_time = elapsed
+
+		if self.running:
+			self.running[-1][1] = now
+
+		wait_condition = coro.wait_condition
+		if coro.state == coro.STATE_SUSPENDED and wait_condition is not None:
+			self.suspended[coro] = (now, wait_condition.__class__.__name__)
+
+	def forget(self, coro):
+		"""Discard the wait of a coroutine that was killed. This should only be called by `Coroutine`."""
+		self.suspended.pop(coro, None)
+
+	def sorted_entries(self, sort_key = "run"):
+		"""Return the `ProfileEntry` objects, sorted by one of `SORT_KEYS`."""
+		key, reverse = self.SORT_KEYS[sort_key]
+		return sorted(self.entries.itervalues(), key = key, reverse = reverse)
+
+	def summary(self, sort_key = "run", limit = None):
+		"""Return a list of human-readable statistics lines, sorted by one of `SORT_KEYS`."""
+
+		lines = [ "Profiling for %.1f s, %d coroutine types" % (
+			self.clock() - self.started, len(self.entries)
+		) ]
+
+		for entry in self.sorted_entries(sort_key)[:limit]:
+			lines.append(entry.summary())
+			for name, line in sorted(entry.wait_summary().iteritems()):
+				lines.append("    %s: %s" % (name, line))
+
+		return lines
+
+	def __repr__(self):
+		return "<CoroutineProfiler: %d coroutine types>" % (len(self.entries), )
+
+	def _chiral_introspect(self):
+		"""Returns access information for _chiral_introspection for this object."""
+		return "profile", "run"
+
+
+def enable(clock = time.time):
+	"""
+	Start profiling coroutines, discarding any previous profile.
+
+	Returns the `CoroutineProfiler`. See the module documentation; ``clock`` is passed to
+	`CoroutineProfiler`.
+	"""
+
+	coroutine._DISPATCHER.profiler = CoroutineProfiler(clock)
+	return coroutine._DISPATCHER.profiler
+
+
+def disable():
+	"""Stop profiling coroutines."""
+	coroutine._DISPATCHER.profiler = None
+
+
+class _chiral_introspection(object):
+	"""Module-level introspection routines."""
+
+	def main(self):
+		"""Show whether profiling is enabled, and a link to the results if it is."""
+
+		profiler = coroutine._DISPATCHER.profiler
+		if profiler is None:
+			return [ ( "Coroutine profiling disabled - ", "@chiral.core.profiler:enable:0:Enable" ) ]
+
+		return [ (
+			profiler,
+			" - ",
+			"@chiral.core.profiler:reset:0:Reset",
+			"@chiral.core.profiler:disable:0:Disable"
+		) ]
+
+	def profile(self, sort_key):
+		"""Show the statistics, sorted by sort_key."""
+
+		profiler = coroutine._DISPATCHER.profiler
+		if profiler is None or sort_key not in CoroutineProfiler.SORT_KEYS:
+			return None
+
+		buttons = [ "Sort by: " ]
+		for key in sorted(CoroutineProfiler.SORT_KEYS):
+			buttons.append("@chiral.core.profiler:sort:%s:%s" % (key, key.capitalize()))
+
+		rows = []
+		for entry in profiler.sorted_entries(sort_key):
+			if entry.waits:
+				rows.append((entry.summary(), entry.wait_summary()))
+			else:
+				rows.append(entry.summary())
+
+		return (
+			"Profiling for %.1f s" % (profiler.clock() - profiler.started, ),
+			tuple(buttons),
+			rows
+		)
+
+	def cmd_sort(self, sort_key):
+		"""Show the statistics sorted by sort_key."""
+		return "chiral.core.profiler/profile/" + sort_key
+
+	def cmd_enable(self, _item):
+		"""Start profiling."""
+		enable()
+		return ""
+
+	def cmd_disable(self, _item):
+		"""Stop profiling."""
+		disable()
+		return ""
+
+	def cmd_reset(self, _item):
+		"""Clear the statistics."""
+		profiler = coroutine._DISPATCHER.profiler
+		if profiler is not None:
+			profiler.reset()
+		return ""
+
+__all__ = [ "CoroutineProfiler", "ProfileEntry", "enable", "disable" ]
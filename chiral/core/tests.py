@@ -1,13 +1,20 @@
-"""Tests for chiral.core.coroutine"""
+"""Tests for chiral.core.coroutine, chiral.core.memoize and chiral.core.profiler"""
 
 # Chiral, copyright (c) 2007 Jacob Potter
 # This program is free software; you can redistribute it and/or modify
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, version 2.
 
-from chiral.core import coroutine
+from __future__ import with_statement
 
+from chiral.core import coroutine, profiler
+from chiral.core.memoize import memoize
+
+import gc
+import sys
+import time
 import unittest
+import warnings
 
 class TestException(Exception):
 	"""Subclass of Exception for test purposes"""
@@ -34,6 +41,18 @@ def coroutine_gen_yielding(callback):
 	res = yield callback
 	raise StopIteration(res)
 
+class FakeReactor(object):
+	"""Stand-in for the reactor, whose timers are fired by hand."""
+
+	def __init__(self):
+		self.timers = []
+
+	def schedule(self, delay):
+		"""Return a WaitForCallback to be called by the test."""
+		timer = coroutine.WaitForCallback("timer %s" % (delay, ))
+		self.timers.append(timer)
+		return timer
+
 # Yes, CoroutineTests will have a lot of public methods.
 #pylint: disable-msg=R0904
 
@@ -101,6 +120,25 @@ class CoroutineTests(unittest.TestCase):
 		coro.start()
 		self.check_completed(coro, 42)
 
+	def test_decorator_metadata(self):
+		"""Check that as_coro keeps the wrapped function's name and docstring"""
+
+		self.assertEqual(coroutine_with_decorator.__name__, "coroutine_with_decorator")
+		self.assertEqual(coroutine_with_decorator.__doc__, "Test of coroutine.task")
+
+	def test_check_waitcondition(self):
+		"""Check that checked returns_waitcondition functions reject other return values"""
+
+		def returning(value):
+			"""Return value."""
+			return value
+
+		checked = coroutine._check_waitcondition(returning)
+		wait = coroutine.WaitForNothing(42)
+		self.assertEqual(checked(wait), wait)
+		self.assertEqual(checked(None), None)
+		self.assertRaises(TypeError, checked, 42)
+
 	def test_wc_not_implemented(self):
 		"""Check that attempting to instantiate the WaitCondition base class will fail."""
 
@@ -177,5 +215,881 @@ class CoroutineTests(unittest.TestCase):
 		self.check_completed(inner_coro, 42)
 		self.check_completed(coro, 42)
 
+	def test_timeout_not_reached(self):
+		"""Check that WaitForTimeout passes through a result that arrives in time."""
+
+		fake_reactor = FakeReactor()
+		inner_cb = coroutine.WaitForCallback()
+		wait = coroutine.WaitForTimeout(inner_cb, 2, fake_reactor)
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait))
+		coro.start()
+
+		self.check_suspended(coro, wait)
+		timer, = fake_reactor.timers
+		self.assert_(timer.bound_coro is not None)
+
+		inner_cb(42)
+
+		self.check_completed(coro, 42)
+		self.assertEqual(timer.bound_coro, None)
+
+	def test_timeout_reached(self):
+		"""Check that WaitForTimeout raises WaitTimeoutException and unbinds the inner condition."""
+
+		fake_reactor = FakeReactor()
+		inner_cb = coroutine.WaitForCallback()
+		inner_coro = coroutine.Coroutine(coroutine_gen_yielding(inner_cb))
+		wait = coroutine.WaitForTimeout(inner_coro, 2, fake_reactor)
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait), is_watched=True)
+		coro.start()
+
+		self.check_suspended(coro, wait)
+
+		fake_reactor.timers[0]()
+
+		self.assertEqual(coro.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(coro.result[1][0], coroutine.WaitTimeoutException)
+		self.assertEqual(inner_coro.state, coroutine.Coroutine.STATE_COMPLETED)
+		self.assertEqual(inner_cb.bound_coro, None)
+
+	def test_timeout_immediate(self):
+		"""Check that WaitForTimeout does not start a timer for a condition that is already ready."""
+
+		fake_reactor = FakeReactor()
+		wait = coroutine.WaitForTimeout(coroutine.WaitForNothing(42), 2, fake_reactor)
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait))
+		coro.start()
+
+		self.check_completed(coro, 42)
+		self.assertEqual(fake_reactor.timers, [])
+
+	def test_timeout_already_expired(self):
+		"""Check that WaitForTimeout raises at once if the timer has expired when it is bound."""
+
+		class ExpiredReactor(object):
+			"""Stand-in for a reactor whose timers have already fired."""
+			def schedule(self, _delay):
+				"""Return a timer that is already ready."""
+				return coroutine.WaitForNothing()
+
+		inner_cb = coroutine.WaitForCallback()
+		wait = coroutine.WaitForTimeout(inner_cb, 0, ExpiredReactor())
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait), is_watched=True)
+		coro.start()
+
+		self.assertEqual(coro.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(coro.result[1][0], coroutine.WaitTimeoutException)
+		self.assertEqual(inner_cb.bound_coro, None)
+
+	def test_wait_for_all(self):
+		"""Check that WaitForAll returns every result, in order."""
+
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(3) ]
+		wait = coroutine.WaitForAll(callbacks + [ coroutine.WaitForNothing(4) ])
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait))
+		coro.start()
+
+		self.check_suspended(coro, wait)
+
+		callbacks[2](3)
+		callbacks[0](1)
+		self.check_suspended(coro, wait)
+		callbacks[1](2)
+
+		self.check_completed(coro, [ 1, 2, 3, 4 ])
+
+	def test_wait_for_all_exception(self):
+		"""Check that WaitForAll raises the first exception and unbinds the rest."""
+
+		exc = TestException(42)
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(2) ]
+		inner_coro = coroutine.Coroutine(coroutine_gen_yielding(callbacks[1]))
+		wait = coroutine.WaitForAll([ callbacks[0], inner_coro ])
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait), is_watched=True)
+		coro.start()
+
+		callbacks[0].throw(exc)
+
+		self.check_failed(coro, exc)
+		self.assertEqual(callbacks[1].bound_coro, None)
+		self.assertEqual(inner_coro.state, coroutine.Coroutine.STATE_COMPLETED)
+
+	def test_wait_for_all_collect(self):
+		"""Check that WaitForAll with collect_exceptions returns exceptions as results."""
+
+		exc = TestException(42)
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(2) ]
+		wait = coroutine.WaitForAll(callbacks, collect_exceptions=True)
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait))
+		coro.start()
+
+		callbacks[0].throw(exc)
+		self.check_suspended(coro, wait)
+		callbacks[1](2)
+
+		self.assertEqual(coro.state, coroutine.Coroutine.STATE_COMPLETED)
+		(first_value, first_exc), second = coro.result[0]
+		self.assertEqual((first_value, first_exc[1]), (None, exc))
+		self.assertEqual(second, (2, None))
+
+	def test_wait_for_any(self):
+		"""Check that WaitForAny returns the first result and unbinds the losers."""
+
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(3) ]
+		wait = coroutine.WaitForAny(callbacks)
+		coro = coroutine.Coroutine(coroutine_gen_yielding(wait))
+		coro.start()
+
+		self.check_suspended(coro, wait)
+		callbacks[1](42)
+
+		self.check_completed(coro, (1, 42))
+		self.assertEqual([ callback.bound_coro for callback in callbacks ], [ None ] * 3)
+
+	def test_delegation(self):
+		"""Check that yielded generators and stopped coroutines run inside the caller."""
+
+		callback = coroutine.WaitForCallback()
+		exc = TestException(42)
+		helper = coroutine.Coroutine(coroutine_gen_yielding(callback))
+
+		def caller():
+			"""Call each kind of subroutine and collect the results."""
+			results = []
+			results.append((yield coroutine_gen_returning(1)))
+			results.append((yield helper))
+			try:
+				yield coroutine_gen_raising(exc)
+			except TestException, caught:
+				results.append(caught)
+			raise StopIteration(results)
+
+		coro = coroutine.Coroutine(caller())
+		coro.start()
+
+		# The helper runs as part of coro, which waits on its callback directly.
+		self.check_suspended(coro, callback)
+		self.assertEqual(helper.state, coroutine.Coroutine.STATE_RUNNING)
+		self.assert_('"caller"' in repr(coro))
+
+		callback(2)
+		self.check_completed(coro, [ 1, 2, exc ])
+		self.check_completed(helper, 2)
+
+	def test_delegation_kill(self):
+		"""Check that killing a coroutine also fails the coroutines it has inlined."""
+
+		callback = coroutine.WaitForCallback()
+		helper = coroutine.Coroutine(coroutine_gen_yielding(callback))
+		coro = coroutine.Coroutine(coroutine_gen_yielding(helper), is_watched = True)
+		coro.start()
+		self.check_suspended(coro, callback)
+
+		coro.kill()
+		self.check_failed(coro, coro.result[1][1])
+		self.assertEqual(coro.result[1][0], coroutine.CoroutineKilledException)
+		self.assertEqual(helper.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(callback.bound_coro, None)
+
+	def test_delegation_kill_inlined(self):
+		"""Check that killing an inlined coroutine raises in its caller, which keeps running."""
+
+		callback = coroutine.WaitForCallback()
+		helper = coroutine.Coroutine(coroutine_gen_yielding(callback))
+
+		def caller():
+			"""Call the helper, and return what it raised."""
+			try:
+				yield helper
+			except coroutine.CoroutineKilledException, caught:
+				raise StopIteration(caught)
+
+		coro = coroutine.Coroutine(caller())
+		coro.start()
+		self.check_suspended(coro, callback)
+		self.assertEqual(helper.state, coroutine.Coroutine.STATE_RUNNING)
+
+		def killer():
+			"""Kill the helper from another coroutine."""
+			helper.kill()
+			yield
+
+		coroutine.Coroutine(killer()).start()
+
+		self.assertEqual(helper.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(helper.result[1][0], coroutine.CoroutineKilledException)
+		self.assertEqual(callback.bound_coro, None)
+		self.assertEqual(coro.state, coroutine.Coroutine.STATE_COMPLETED)
+		self.assert_(isinstance(coro.result[0], coroutine.CoroutineKilledException))
+
+	def test_delegation_kill_from_inside(self):
+		"""Check that an inlined coroutine killed by code it runs is unwound once it yields."""
+
+		callback = coroutine.WaitForCallback()
+		log = []
+
+		def inner():
+			"""Kill the helper this runs inside, then yield something it must not wait for."""
+			helper.kill()
+			log.append("after kill")
+			yield callback
+			log.append("resumed")
+
+		helper = coroutine.Coroutine(inner())
+
+		def caller():
+			"""Call the helper, and return what it raised."""
+			try:
+				yield helper
+			except coroutine.CoroutineKilledException, caught:
+				raise StopIteration(caught)
+
+		coro = coroutine.Coroutine(caller())
+		coro.start()
+
+		self.assertEqual(log, [ "after kill" ])
+		self.assertEqual(callback.bound_coro, None)
+		self.assertEqual(helper.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(helper.result[1][0], coroutine.CoroutineKilledException)
+		self.assertEqual(coro.state, coroutine.Coroutine.STATE_COMPLETED)
+		self.assert_(isinstance(coro.result[0], coroutine.CoroutineKilledException))
+
+	def test_long_synchronous_run(self):
+		"""Check that a coroutine that never blocks runs to completion outside the reactor."""
+
+		def counter():
+			"""Take more steps than the resume budget allows."""
+			total = 0
+			for index in xrange(coroutine.Coroutine.RESUME_BUDGET * 3):
+				total += yield coroutine.WaitForNothing(index)
+			raise StopIteration(total)
+
+		steps = coroutine.Coroutine.RESUME_BUDGET * 3
+		coro = coroutine.Coroutine(counter())
+		coro.start()
+		self.check_completed(coro, steps * (steps - 1) // 2)
+
+	def test_completion_chain(self):
+		"""Check that completing a long chain of waiting coroutines does not recurse."""
+
+		callback = coroutine.WaitForCallback()
+		chain = [ coroutine.Coroutine(coroutine_gen_yielding(callback)) ]
+		chain[0].start()
+		for _index in xrange(sys.getrecursionlimit() * 2):
+			coro = coroutine.Coroutine(coroutine_gen_yielding(chain[-1]))
+			coro.start()
+			chain.append(coro)
+
+		callback(42)
+		for coro in chain:
+			self.check_completed(coro, 42)
+
+	def test_kill_queued(self):
+		"""Check that a coroutine killed after its resume() was queued does not run."""
+
+		callback = coroutine.WaitForCallback()
+		victim = coroutine.Coroutine(coroutine_gen_yielding(callback), is_watched = True)
+		victim.start()
+
+		def killer():
+			"""Complete the victim's wait, then kill it before it can run."""
+			callback(1)
+			victim.kill()
+			yield
+
+		coroutine.Coroutine(killer()).start()
+		self.assertEqual(victim.state, coroutine.Coroutine.STATE_FAILED)
+		self.assertEqual(victim.result[1][0], coroutine.CoroutineKilledException)
+
+	def test_kill_queued_reclaim(self):
+		"""Check that a result queued for a coroutine that is killed is handed back."""
+
+		reclaimed = []
+
+		class ReclaimingCallback(coroutine.WaitForCallback):
+			"""WaitForCallback that records the results it gets back."""
+			__slots__ = ()
+			def reclaim(self, value, exc):
+				reclaimed.append((value, exc))
+
+		callbacks = [ ReclaimingCallback() for _index in xrange(2) ]
+		victims = [
+			coroutine.Coroutine(coroutine_gen_yielding(callbacks[0]), is_watched = True),
+			coroutine.Coroutine(coroutine_gen_yielding(
+				coroutine.WaitForTimeout(callbacks[1], 10, FakeReactor())
+			), is_watched = True)
+		]
+		for victim in victims:
+			victim.start()
+
+		def killer():
+			"""Complete the victims' waits, then kill them before they can run."""
+			callbacks[0](1)
+			callbacks[1](2)
+			for victim in victims:
+				victim.kill()
+			yield
+
+		coroutine.Coroutine(killer()).start()
+		self.assertEqual(reclaimed, [ (1, None), (2, None) ])
+
+	def test_task_group(self):
+		"""Check that a TaskGroup collects its children's results in order."""
+
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(2) ]
+		group = coroutine.TaskGroup()
+		for callback in callbacks:
+			group.spawn(coroutine_gen_yielding(callback))
+		group.spawn(coroutine_gen_returning(3))
+
+		coro = coroutine.Coroutine(coroutine_gen_yielding(group))
+		coro.start()
+		self.check_suspended(coro, group)
+
+		callbacks[1](2)
+		self.check_suspended(coro, group)
+		callbacks[0](1)
+		self.check_completed(coro, [ 1, 2, 3 ])
+
+	def test_task_group_failure(self):
+		"""Check that a failing child kills the rest of its TaskGroup."""
+
+		exc = TestException(42)
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(2) ]
+		group = coroutine.TaskGroup()
+		children = [ group.spawn(coroutine_gen_yielding(callback)) for callback in callbacks ]
+
+		coro = coroutine.Coroutine(coroutine_gen_yielding(group), is_watched = True)
+		coro.start()
+
+		callbacks[0].throw(exc)
+		self.check_failed(coro, exc)
+		self.assertEqual(children[1].state, coroutine.Coroutine.STATE_COMPLETED)
+		self.assertEqual(children[1].result, (None, None))
+		self.assertEqual(callbacks[1].bound_coro, None)
+		self.assertRaises(RuntimeError, group.spawn, coroutine_gen_returning(1))
+
+	def test_task_group_kill(self):
+		"""Check that killing the coroutine waiting on a TaskGroup kills its children."""
+
+		callback = coroutine.WaitForCallback()
+
+		def parent():
+			"""Spawn a child in a group, then wait for it."""
+			with coroutine.TaskGroup() as group:
+				group.spawn(coroutine_gen_yielding(callback))
+				yield group
+
+		coro = coroutine.Coroutine(parent(), is_watched = True)
+		coro.start()
+		self.assertNotEqual(callback.bound_coro, None)
+
+		coro.kill()
+		self.assertEqual(callback.bound_coro, None)
+
+	def test_mutex(self):
+		"""Check that a CoroutineMutex is held by one coroutine at a time, skipping killed waiters."""
+
+		mutex = coroutine.CoroutineMutex()
+		callback = coroutine.WaitForCallback()
+		log = []
+
+		def locker(name):
+			"""Hold the mutex until the callback is called."""
+			with (yield mutex.acquire()):
+				log.append(name)
+				yield callback
+			log.append("-" + name)
+
+		first = coroutine.Coroutine(locker("first"))
+		first.start()
+		victim = coroutine.Coroutine(locker("victim"), is_watched = True)
+		victim.start()
+		second = coroutine.Coroutine(locker("second"))
+		second.start()
+		self.assertEqual(log, [ "first" ])
+
+		victim.kill()
+		callback()
+		self.assertEqual(log, [ "first", "-first", "second" ])
+		callback()
+		self.assertEqual(log, [ "first", "-first", "second", "-second" ])
+		self.assertEqual(mutex.current_owner, None)
+
+	def test_semaphore(self):
+		"""Check that a CoroutineSemaphore admits at most value coroutines at once."""
+
+		semaphore = coroutine.CoroutineSemaphore(2)
+		callbacks = [ coroutine.WaitForCallback() for _index in xrange(3) ]
+		holders = []
+
+		def user(index):
+			"""Hold a slot until the index-th callback is called."""
+			with (yield semaphore.acquire()):
+				holders.append(index)
+				yield callbacks[index]
+				holders.remove(index)
+
+		for index in xrange(3):
+			coroutine.Coroutine(user(index)).start()
+		self.assertEqual(holders, [ 0, 1 ])
+
+		callbacks[1]()
+		self.assertEqual(holders, [ 0, 2 ])
+		callbacks[0]()
+		callbacks[2]()
+		self.assertEqual(holders, [])
+		self.assertEqual(semaphore.value, 2)
+
+	def test_queue(self):
+		"""Check that a bounded CoroutineQueue suspends producers when full and consumers when empty."""
+
+		queue = coroutine.CoroutineQueue(maxsize = 2)
+		received = []
+
+		def producer():
+			"""Put five items."""
+			for index in xrange(5):
+				yield queue.put(index)
+			raise StopIteration("done")
+
+		def consumer(count):
+			"""Get count items."""
+			for _index in xrange(count):
+				received.append((yield queue.get()))
+
+		producer_coro = coroutine.Coroutine(producer())
+		producer_coro.start()
+		self.check_suspended(producer_coro, producer_coro.wait_condition)
+		self.assertEqual(len(queue), 2)
+
+		coroutine.Coroutine(consumer(1)).start()
+		self.assertEqual(received, [ 0 ])
+		self.assertEqual(len(queue), 2)
+
+		consumer_coro = coroutine.Coroutine(consumer(5))
+		consumer_coro.start()
+		self.check_completed(producer_coro, "done")
+		self.assertEqual(received, [ 0, 1, 2, 3, 4 ])
+		self.check_suspended(consumer_coro, consumer_coro.wait_condition)
+
+		coroutine.Coroutine(producer()).start()
+		self.check_completed(consumer_coro, None)
+
+	def test_mutex_handoff_killed(self):
+		"""Check that a mutex handed to a coroutine killed before it ran is passed on."""
+
+		mutex = coroutine.CoroutineMutex()
+		callback = coroutine.WaitForCallback()
+		log = []
+
+		def failing_holder():
+			"""Take the mutex, then release it by failing."""
+			with (yield mutex.acquire()):
+				yield callback
+				raise TestException()
+
+		def locker(name):
+			"""Take the mutex and release it again."""
+			with (yield mutex.acquire()):
+				log.append(name)
+
+		# The first child's failure hands the mutex to the second, and the group kills the
+		# second before it gets to run.
+		group = coroutine.TaskGroup()
+		group.spawn(failing_holder())
+		group.spawn(locker("child"))
+		parent = coroutine.Coroutine(locker("parent"))
+		parent.start()
+
+		callback()
+		self.check_completed(parent, None)
+		self.assertEqual(log, [ "parent" ])
+		self.assertEqual(mutex.current_owner, None)
+
+	def test_semaphore_handoff_killed(self):
+		"""Check that a semaphore slot handed to a coroutine killed before it ran is passed on."""
+
+		semaphore = coroutine.CoroutineSemaphore(1)
+		holders = []
+
+		def user(name):
+			"""Take a slot and wait."""
+			with (yield semaphore.acquire()):
+				holders.append(name)
+				yield coroutine.WaitForCallback()
+
+		def releaser():
+			"""Release the held slot, then kill the waiter it was handed to."""
+			yield semaphore.acquire()
+			victim = coroutine.Coroutine(user("victim"), is_watched = True)
+			victim.start()
+			semaphore.release()
+			victim.kill()
+
+		coroutine.Coroutine(releaser()).start()
+		self.assertEqual(semaphore.value, 1)
+
+		coroutine.Coroutine(user("next")).start()
+		self.assertEqual(holders, [ "next" ])
+		self.assertEqual(semaphore.value, 0)
+
+	def test_queue_handoff_killed(self):
+		"""Check that an item handed to a consumer killed before it ran goes back on the queue."""
+
+		queue = coroutine.CoroutineQueue()
+		received = []
+
+		def consumer():
+			"""Get one item."""
+			received.append((yield queue.get()))
+
+		victim = coroutine.Coroutine(consumer(), is_watched = True)
+		victim.start()
+
+		def producer():
+			"""Put two items, killing the consumer the first was handed to."""
+			yield queue.put(1)
+			victim.kill()
+			yield queue.put(2)
+
+		coroutine.Coroutine(producer()).start()
+		self.assertEqual(received, [])
+		self.assertEqual(list(queue.items), [ 1, 2 ])
+
+		coroutine.Coroutine(consumer()).start()
+		self.assertEqual(received, [ 1 ])
+
+	def test_dispatch_error(self):
+		"""Check that an error from one queued coroutine does not stop the others running."""
+
+		class BrokenWaitCondition(coroutine.WaitCondition):
+			"""A WaitCondition that cannot be bound."""
+			def __init__(self):
+				pass
+			def bind(self, coro):
+				raise TestException()
+
+		first = coroutine.WaitForCallback()
+		second = coroutine.WaitForCallback()
+
+		def broken():
+			"""Yield a WaitCondition whose bind() raises."""
+			yield first
+			yield BrokenWaitCondition()
+
+		def firer():
+			"""Resume both waiters, which are queued until this coroutine suspends."""
+			first()
+			second(42)
+			yield
+
+		broken_coro = coroutine.Coroutine(broken(), is_watched = True)
+		broken_coro.start()
+		waiter = coroutine.Coroutine(coroutine_gen_yielding(second), is_watched = True)
+		waiter.start()
+
+		with warnings.catch_warnings(record = True) as caught:
+			warnings.simplefilter("always")
+			firer_coro = coroutine.Coroutine(firer())
+			firer_coro.start()
+
+		self.check_completed(firer_coro, None)
+		self.check_completed(waiter, 42)
+		self.assertEqual(len(caught), 1)
+		self.assert_("TestException" in str(caught[0].message))
+
+	def test_event(self):
+		"""Check that an Event resumes all of its waiters, except killed ones."""
+
+		event = coroutine.Event()
+		waiters = [
+			coroutine.Coroutine(coroutine_gen_yielding(event), is_watched = True)
+			for _index in xrange(3)
+		]
+		for coro in waiters:
+			coro.start()
+			self.check_suspended(coro, event)
+
+		waiters[1].kill()
+		self.assertEqual(len(event), 2)
+
+		event.set(42)
+		self.check_completed(waiters[0], 42)
+		self.check_completed(waiters[2], 42)
+
+		# Still set
+		late = coroutine.Coroutine(coroutine_gen_yielding(event))
+		late.start()
+		self.check_completed(late, 42)
+
+		event.clear()
+		late = coroutine.Coroutine(coroutine_gen_yielding(event))
+		late.start()
+		self.check_suspended(late, event)
+
+	def test_event_waiter_killed_by_waiter(self):
+		"""Check that a waiter killed by another waiter woken by the same Event is not resumed."""
+
+		event = coroutine.Event()
+		received = []
+
+		def killer():
+			"""Kill the second waiter once woken."""
+			received.append(("killer", (yield event)))
+			victim.kill()
+
+		def waiter():
+			"""Record the value."""
+			received.append(("victim", (yield event)))
+
+		killer_coro = coroutine.Coroutine(killer(), is_watched = True)
+		killer_coro.start()
+		victim = coroutine.Coroutine(waiter(), is_watched = True)
+		victim.start()
+
+		event.set(1)
+		self.check_completed(killer_coro, None)
+		self.check_failed(victim, victim.result[1][1])
+		self.assert_(isinstance(victim.result[1][1], coroutine.CoroutineKilledException))
+		self.assertEqual(received, [ ("killer", 1) ])
+		self.assertEqual(len(event), 0)
+
+	def test_event_notify_all(self):
+		"""Check that notify_all wakes the current waiters without setting the Event."""
+
+		event = coroutine.Event()
+		received = []
+
+		def listener():
+			"""Record two notifications."""
+			for _index in xrange(2):
+				received.append((yield event))
+
+		coro = coroutine.Coroutine(listener())
+		coro.start()
+
+		event.notify_all("first")
+		self.assertEqual(received, [ "first" ])
+		self.check_suspended(coro, event)
+
+		event.notify_all("second")
+		self.check_completed(coro, None)
+		self.assertEqual(received, [ "first", "second" ])
+		self.failIf(event.is_set)
+
+	def test_registry_modes(self):
+		"""Check that the coroutine registry records nothing, a sample, or everything."""
+
+		registry = coroutine._REGISTRY
+		introspection = coroutine._chiral_introspection
+
+		try:
+			coroutine.set_registry_mode(coroutine.REGISTRY_OFF)
+			coros = [ coroutine.Coroutine(coroutine_gen_returning(i)) for i in xrange(10) ]
+			self.failIf(any(id(coro) in registry.coroutines for coro in coros))
+			# The introspector still finds them.
+			self.assert_(coros[3] in introspection.main())
+			self.assertNotEqual(introspection.coroutine(str(id(coros[3]))), None)
+
+			coroutine.set_registry_mode(coroutine.REGISTRY_SAMPLED, sample_interval = 5)
+			coros = [ coroutine.Coroutine(coroutine_gen_returning(i)) for i in xrange(10) ]
+			recorded = [ coro for coro in coros if id(coro) in registry.coroutines ]
+			self.assertEqual(recorded, [ coros[4], coros[9] ])
+			self.assertNotEqual(introspection.coroutine(str(id(coros[0]))), None)
+
+			coroutine.set_registry_mode(coroutine.REGISTRY_FULL)
+			coros = [ coroutine.Coroutine(coroutine_gen_returning(i)) for i in xrange(10) ]
+			self.failUnless(all(id(coro) in registry.coroutines for coro in coros))
+			self.assert_(coros[3] in introspection.main())
+
+			self.assertRaises(ValueError, coroutine.set_registry_mode, 42)
+		finally:
+			coroutine.set_registry_mode(coroutine.REGISTRY_OFF)
+
+	def test_profiler(self):
+		"""Check that the profiler counts resumes, run time and waits per coroutine type."""
+
+		callback = coroutine.WaitForCallback()
+
+		# A clock that only moves when the test says so.
+		now = [ 0.0 ]
+
+		def busy_child():
+			"""Keep the thread busy for two seconds while the parent is running."""
+			now[0] += 2.0
+			yield
+
+		def parent():
+			"""Start the child, then wait for the callback twice."""
+			coroutine.Coroutine(busy_child(), autostart = True)
+			yield callback
+			yield callback
+
+		prof = profiler.enable(clock = lambda: now[0])
+		try:
+			coro = coroutine.Coroutine(parent(), autostart = True)
+			now[0] += 1.0
+			callback()
+			now[0] += 0.5
+			callback()
+			self.assertEqual(coro.state, coro.STATE_COMPLETED)
+
+			victim = coroutine.Coroutine(parent())
+			victim.start()
+			victim.add_completion_callback(coroutine.swallow_kill)
+			victim.kill()
+		finally:
+			profiler.disable()
+
+		parent_entry, child_entry = prof.entries["parent"], prof.entries["busy_child"]
+		self.assertEqual((parent_entry.resumes, child_entry.resumes), (4, 2))
+
+		# The children's run time is not counted as the parents'.
+		self.assertEqual((child_entry.run_time, child_entry.max_run_time), (4.0, 2.0))
+		self.assertEqual((parent_entry.run_time, parent_entry.max_run_time), (0.0, 0.0))
+
+		self.assertEqual(parent_entry.waits, { "WaitForCallback": [ 2, 1.5 ] })
+		self.assertEqual(parent_entry.wait_time, 1.5)
+		self.assertEqual(len(prof.suspended), 0)
+
+		self.assertEqual([ entry.name for entry in prof.sorted_entries("name") ], [ "busy_child", "parent" ])
+		self.assertEqual(prof.sorted_entries("run")[0], child_entry)
+		self.assertEqual(prof.sorted_entries("wait")[0], parent_entry)
+		self.assertEqual(prof.summary()[0], "Profiling for 5.5 s, 2 coroutine types")
+
+	def test_profiler_abandoned(self):
+		"""Check that the profiler forgets abandoned coroutines, and stays balanced on errors."""
+
+		class BrokenWaitCondition(coroutine.WaitCondition):
+			"""A WaitCondition that cannot be bound."""
+			def __init__(self):
+				pass
+			def bind(self, coro):
+				raise TestException()
+
+		def broken():
+			"""Yield a WaitCondition whose bind() raises."""
+			yield BrokenWaitCondition()
+
+		prof = profiler.enable()
+		try:
+			coro = coroutine.Coroutine(coroutine_gen_yielding(coroutine.WaitForCallback()))
+			coro.start()
+			self.assertEqual(len(prof.suspended), 1)
+
+			# The coroutine and its WaitCondition refer to each other, so collect the cycle.
+			del coro
+			gc.collect()
+			self.assertEqual(len(prof.suspended), 0)
+
+			self.assertRaises(TestException, coroutine.Coroutine(broken()).start)
+			self.assertEqual(prof.running, [])
+		finally:
+			profiler.disable()
+
+class MemoizeTests(unittest.TestCase):
+	"""Tests for the memoize decorator"""
+
+	def setUp(self):
+		"""Create a memoized function whose calls wait for callbacks."""
+		self.calls = []
+
+		@memoize(max_size = 2, ttl = 0.05)
+		def lookup(key):
+			"""Return a WaitForCallback, to be called by the test."""
+			callback = coroutine.WaitForCallback()
+			self.calls.append((key, callback))
+			return callback
+
+		self.lookup = lookup
+
+	def fetch(self, key):
+		"""Start a coroutine that looks up key, and return it."""
+		coro = coroutine.Coroutine(coroutine_gen_yielding(self.lookup(key)), is_watched = True)
+		coro.start()
+		return coro
+
+	def test_in_flight(self):
+		"""Check that concurrent misses share one call, and its result is then cached."""
+
+		first, second = self.fetch("a"), self.fetch("a")
+		self.assertEqual(len(self.calls), 1)
+
+		self.calls[0][1]("value")
+		self.assertEqual(first.result, ("value", None))
+		self.assertEqual(second.result, ("value", None))
+
+		self.assertEqual(self.fetch("a").result, ("value", None))
+		self.assertEqual(len(self.calls), 1)
+		self.assertEqual(self.lookup.cache.hits, 1)
+
+	def test_failure(self):
+		"""Check that a failed call is passed to every waiter but not cached."""
+
+		exc = TestException(42)
+		first, second = self.fetch("a"), self.fetch("a")
+		self.calls[0][1].throw(exc)
+		self.assertEqual(first.result[1][1], exc)
+		self.assertEqual(second.result[1][1], exc)
+
+		self.fetch("a")
+		self.assertEqual(len(self.calls), 2)
+
+	def test_kill_waiter(self):
+		"""Check that killing one waiter doesn't affect the others."""
+
+		first, second = self.fetch("a"), self.fetch("a")
+		first.kill()
+		self.calls[0][1]("value")
+		self.assertEqual(second.result, ("value", None))
+
+	def test_eviction(self):
+		"""Check LRU eviction, expiry and invalidation."""
+
+		for key in "a", "b", "a", "c":
+			coro = self.fetch(key)
+			if coro.state == coro.STATE_SUSPENDED:
+				self.calls[-1][1](key)
+
+		# "b" was least recently used when "c" was added.
+		self.assertEqual(sorted(key for key, _callback in self.calls), [ "a", "b", "c" ])
+		self.fetch("a")
+		self.fetch("b")
+		self.assertEqual(len(self.calls), 4)
+
+		self.lookup.cache.invalidate("a")
+		self.fetch("a")
+		self.assertEqual(len(self.calls), 5)
+
+		time.sleep(0.06)
+		self.fetch("c")
+		self.assertEqual(len(self.calls), 6)
+
+	def test_no_cyclic_garbage(self):
+		"""Check that a cache is freed without the cyclic garbage collector."""
+
+		gc.collect()
+		gc.disable()
+		try:
+			@memoize(max_size = 2)
+			def double(value):
+				"""Return twice value."""
+				return coroutine.WaitForNothing(value * 2)
+
+			for value in 1, 2, 3, 3, 1:
+				coro = coroutine.Coroutine(coroutine_gen_yielding(double(value)))
+				coro.start()
+				self.assertEqual(coro.result, (value * 2, None))
+
+			self.assertEqual(len(double.cache), 2)
+			double.cache.invalidate(3)
+			self.assertEqual(len(double.cache), 1)
+
+			del double, coro
+			self.assertEqual(gc.collect(), 0)
+		finally:
+			gc.enable()
+
 if __name__ == '__main__':
 	unittest.main()
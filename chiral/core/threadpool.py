@@ -18,68 +18,13 @@ from __future__ import with_statement
 
 import collections
 import threading
-import socket
 import sys
-import signal
 
 from chiral.core.coroutine import returns_waitcondition, WaitForCallback
-from chiral.net import tcp
+from chiral.net import reactor
 
 _CHIRAL_RELOADABLE = True
 
-class ThreadPoolWatcher(tcp.TCPConnection):
-	"""
-	Helper coroutine that dispatches thread pool results to wherever they were called from.
-
-	See `ThreadPool` for more information.
-	"""
-
-	def __init__(self):
-		"""Constructor."""
-
-		# Prevent replacement on reload.
-		setattr(self, "__reload_update__", lambda oldobj: oldobj)
-
-		read_socket, self.write_socket = socket.socketpair()
-
-		tcp.TCPConnection.__init__(self, None, read_socket)
-
-		# Don't actually start until restart() is called the first time.
-
-	def restart(self):
-		"""Restart the ThreadPoolWatcher.
-
-		After an operation is added to the thread pool's input queue, the adder (generally
-		`run_in_thread`) should see if watcher.restart is null; if not, it should call
-		restart(), which will ensure that the watcher is functional.
-		"""
-
-		self.restart = None
-		self.start()
-
-	def connection_handler(self):
-		"""Main event processing loop."""
-		while True:
-			incoming = yield self.recv(128)
-			for _index in incoming:
-				# Each received byte indicates one result in the output queue.
-				result, exc, recipient = ThreadPool.output_queue.popleft()
-				if exc is not None:
-					recipient.throw(exc)
-				else:
-					recipient(result)
-
-			# If there are any operations still in process, continue the loop.
-			with ThreadPool.queue_lock:
-				ops = len(ThreadPool.input_queue) + ThreadPool.active_workers \
-				      + len(ThreadPool.output_queue)
-
-			if not ops:
-				self.restart = WaitForCallback("ThreadPoolWatcher restart")
-				yield self.restart
-				self.restart = None
-
-
 class ThreadPool(object):
 	"""Thread pool singleton object.
 
@@ -95,16 +40,12 @@ class ThreadPool(object):
 	The worker threads, when not active, block on the input queue semaphore. The semaphore
 	ensures that each time an item is added to the input queue, exactly one worker thread
 	will be woken up. It then retrieves the operation from the queue, runs it with the
-	args and kwargs that were passed to `run_in_thread`, and pushes the result onto the
-	`ThreadPool`'s output queue.
-
-	A separate helper coroutine, the `ThreadPoolWatcher`, is responsible for returning results
-	to the main thread. The watcher is initialized from `run_in_thread` the first time the thread
-	pool is used. It creates a socketpair, and uses the reactor's socket event handling to wait on
-	the read end. Whenever a worker thread pushes a result onto the output queue, it writes a single
-	byte to the watcher's write socket. This will awaken the `ThreadPoolWatcher` coroutine in the
-	main thread, which ``recv``-s as many bytes as are available, and pops and dispatches that many
-	results from the output queue.
+	args and kwargs that were passed to `run_in_thread`, and hands the result back to the main
+	thread with `Reactor.call_from_thread`.
+
+	`run_in_thread` registers a thread waiter with the reactor for each operation, which keeps
+	the reactor listening for its cross-thread wakeups until the result has been delivered.
+	Results that finish while the reactor is busy are delivered together, in one wakeup.
 	"""
  
 	# queue_lock regulates access to all the queues, and must be
@@ -119,12 +60,9 @@ class ThreadPool(object):
 	input_queue_sem = threading.Semaphore(0)
 
 	active_workers = 0
-	output_queue = collections.deque()
 
 	worker_threads = {}
 
-	watcher = ThreadPoolWatcher()
-
 	@staticmethod
 	def __reload_update__(newobj):
 		"""Prevent the class from being reinitialized by `xreload`."""
@@ -174,9 +112,9 @@ class WorkerThread(threading.Thread):
 			self.state = 2
 
 			with pool.queue_lock:
-				pool.output_queue.append((result, exc, recipient))
 				pool.active_workers -= 1
-				pool.watcher.write_socket.send("x")
+
+			reactor.call_from_thread(_deliver_result, result, exc, recipient)
 
 			self.state = 0
 
@@ -193,13 +131,23 @@ class WorkerThread(threading.Thread):
 		return "thread", id(self)
 
 
+def _deliver_result(result, exc, recipient):
+	"""Pass an operation's result to its caller. This runs in the reactor's thread."""
+
+	reactor.remove_thread_waiter()
+
+	if exc is not None:
+		recipient.throw(exc)
+	else:
+		recipient(result)
+
+
 @returns_waitcondition
 def run_in_thread(operation, *args, **kwargs):
 	"""Run operation in a thread, returning the result."""
 
-	# Restart the ThreadPoolWatcher if it wasn't listening already
-	if ThreadPool.watcher.restart:
-		ThreadPool.watcher.restart()
+	# Keep the reactor listening for the result.
+	reactor.add_thread_waiter()
 
 	# XXX need a good algorithm for managing thread pool size
 	if not ThreadPool.worker_threads or \
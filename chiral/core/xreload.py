@@ -166,7 +166,11 @@ def _update_class(oldclass, newclass):
 		setattr(oldclass, name, newdict[name])
 	for name in oldnames - newnames:
 		delattr(oldclass, name)
-	for name in oldnames & newnames - set(("__dict__", "__doc__")):
+	for name in oldnames & newnames - set(("__dict__", "__doc__", "__weakref__", "__slots__")):
+		# Slot descriptors only work on instances of the class that created them, and
+		# a class's instance layout can't change anyway; keep the old ones.
+		if isinstance(olddict[name], types.MemberDescriptorType):
+			continue
 		setattr(oldclass, name,  _update(olddict[name], newdict[name]))
 	return oldclass
 
@@ -0,0 +1,201 @@
+"""
+Multi-process servers.
+
+A single Chiral process runs one reactor on one CPU. To use more, the process can be forked into
+a number of worker processes once the application has been loaded and its servers created, so
+that the workers share the loaded code copy-on-write. Instead of calling ``reactor.run()``::
+
+	HTTPServer(
+		bind_addr = ('', 8080),
+		application = wsgi_app,
+		reuse_port = True
+	).start()
+
+	cluster.run(workers = 16)
+
+The calling process becomes a supervisor: it forks the workers, restarts any that die, and on
+``SIGTERM`` or ``SIGINT`` tells them to shut down and waits for them to exit. Each worker gets
+its own reactor (see `Reactor.after_fork`) and runs it until it is told to stop.
+
+A `TCPServer` created with ``reuse_port`` gives each worker a listening socket of its own, bound
+with ``SO_REUSEPORT``, and the kernel balances connections between them. Otherwise, all workers
+accept from the listening socket they inherited.
+
+On ``SIGTERM``, a worker stops accepting new connections, and exits once its existing
+connections have finished, or after ``shutdown_timeout`` seconds, whichever comes first.
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+from chiral.core import coroutine
+from chiral.net import reactor, tcp
+
+import errno
+import gc
+import math
+import os
+import signal
+import sys
+import time
+import traceback
+
+def cpu_count():
+	"""Return the number of online CPUs, or 1 if it cannot be determined."""
+	try:
+		return max(int(os.sysconf("SC_NPROCESSORS_ONLN")), 1)
+	except (AttributeError, ValueError, OSError):
+		return 1
+
+
+class Cluster(object):
+	"""
+	Supervisor for a set of forked worker processes.
+
+	See the module documentation for an overview; `run` is a shortcut for the common case.
+	"""
+
+	def __init__(self, workers = None, shutdown_timeout = 30, respawn_delay = 1):
+		"""
+		Constructor.
+
+		:param workers: Number of worker processes; defaults to the number of CPUs.
+		:param shutdown_timeout: Seconds a stopping worker may spend finishing its connections.
+		:param respawn_delay:
+			A worker that dies less than this many seconds after starting is not restarted
+			until this long has passed, to avoid a tight fork loop if workers crash on startup.
+		"""
+
+		self.workers = workers or cpu_count()
+		self.shutdown_timeout = shutdown_timeout
+		self.respawn_delay = respawn_delay
+
+		# pid -> start time
+		self.worker_pids = {}
+		self.stopping = False
+
+	def _spawn_worker(self):
+		"""Fork a new worker process."""
+
+		pid = os.fork()
+		if pid:
+			self.worker_pids[pid] = time.time()
+			return
+
+		# In the child. Never return into the supervisor's code.
+		status = 1
+		try:
+			try:
+				self._run_worker()
+				status = 0
+			except SystemExit, exc:
+				status = exc.code or 0
+			except:
+				traceback.print_exc()
+		finally:
+			sys.stdout.flush()
+			sys.stderr.flush()
+			os._exit(status)
+
+	def _run_worker(self):
+		"""Main function of a worker process."""
+
+		# The supervisor handles Control-C for the whole process group.
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		signal.signal(signal.SIGTERM, self._worker_sigterm)
+
+		for server in tcp.listening_servers():
+			server.after_fork()
+
+		reactor.after_fork()
+		reactor.run()
+
+	def _worker_sigterm(self, _signum, _frame):
+		"""SIGTERM handler for workers: stop accepting, and exit once idle."""
+
+		# If connections are still open after shutdown_timeout, the default SIGALRM
+		# action terminates the process.
+		signal.signal(signal.SIGTERM, signal.SIG_IGN)
+		signal.alarm(int(math.ceil(self.shutdown_timeout)))
+
+		# Signal handlers may run in the middle of reactor code; do the real work
+		# from the reactor loop.
+		reactor.call_soon(self._stop_servers)
+
+	def _stop_servers(self):
+		"""Kill every TCPServer in this process, closing its listening socket."""
+		for server in tcp.listening_servers():
+			if server.state == server.STATE_SUSPENDED:
+				server.add_completion_callback(coroutine.swallow_kill)
+				server.kill()
+
+	def _supervisor_signal(self, _signum, _frame):
+		"""SIGTERM/SIGINT handler for the supervisor: stop all workers."""
+		self.stop()
+
+	def stop(self):
+		"""Ask all workers to shut down, and stop restarting them."""
+
+		self.stopping = True
+		for pid in self.worker_pids.keys():
+			try:
+				os.kill(pid, signal.SIGTERM)
+			except OSError, exc:
+				if exc.errno != errno.ESRCH:
+					raise
+
+	def run(self):
+		"""Fork the workers, and supervise them until they have all exited."""
+
+		signal.signal(signal.SIGTERM, self._supervisor_signal)
+		signal.signal(signal.SIGINT, self._supervisor_signal)
+
+		# Collect garbage now rather than in each worker, where it would
+		# unshare copy-on-write pages.
+		gc.collect()
+
+		# The workers accept on their own sockets. Stop listening before forking them, so
+		# that connections are not queued on this socket only to be reset.
+		for server in tcp.listening_servers():
+			if server.reuse_port:
+				server.stop_listening()
+
+		for _index in xrange(self.workers):
+			self._spawn_worker()
+
+		while self.worker_pids:
+			try:
+				pid, status = os.wait()
+			except OSError, exc:
+				if exc.errno == errno.EINTR:
+					continue
+				elif exc.errno == errno.ECHILD:
+					break
+				raise
+
+			started = self.worker_pids.pop(pid, None)
+			if started is None or self.stopping:
+				continue
+
+			print "Worker %d exited with status %d; restarting." % (pid, status)
+
+			lifetime = time.time() - started
+			if lifetime < self.respawn_delay:
+				time.sleep(self.respawn_delay - lifetime)
+
+			if not self.stopping:
+				self._spawn_worker()
+
+
+def run(workers = None, **kwargs):
+	"""
+	Fork ``workers`` worker processes and supervise them until they exit.
+
+	Extra keyword arguments are passed to `Cluster`. This is the multi-process
+	replacement for ``reactor.run()``.
+	"""
+	Cluster(workers, **kwargs).run()
+
+__all__ = [ "Cluster", "run", "cpu_count" ]
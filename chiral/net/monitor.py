@@ -0,0 +1,251 @@
+"""
+Reactor loop health monitoring.
+
+When enabled, the reactor records, for each iteration of its loop, how many socket events it
+woke up for, how long it spent dispatching them, running timers, and running `Reactor.call_soon`
+calls, and how late the most overdue timer was (the loop's lag). Iteration times are kept in a
+histogram. Monitoring is off by default, and costs nothing when off::
+
+	from chiral.net import monitor
+	monitor.enable(watchdog_threshold = 0.5)
+
+If ``watchdog_threshold`` is given, a watchdog thread also checks on the loop. When a single
+iteration runs for longer than the threshold, which generally means that some coroutine is doing
+blocking I/O or a long computation, the watchdog logs the Python stack of the loop's thread and
+the `Coroutine` that was running. Recent reports, and the statistics, are shown in the
+introspector.
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+from chiral.core import coroutine
+from chiral.net import reactor
+
+import sys
+import thread
+import threading
+import time
+import traceback
+
+_CHIRAL_RELOADABLE = True
+
+class LoopMonitor(object):
+	"""
+	Statistics about a reactor's loop, and the optional watchdog thread.
+
+	A LoopMonitor is attached to a reactor by setting its ``monitor`` attribute; `enable` does
+	this for the default reactor. `Reactor._run_once` then calls `record` once per iteration.
+	"""
+
+	# Upper bounds, in seconds, of the iteration time histogram buckets. The last bucket
+	# counts everything slower.
+	HISTOGRAM_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+
+	# Number of watchdog reports to keep.
+	MAX_REPORTS = 20
+
+	def __init__(self, watchdog_threshold = None):
+		"""
+		Constructor.
+
+		:param watchdog_threshold:
+			If not None, start a watchdog thread that reports iterations taking longer than
+			this many seconds.
+		"""
+
+		self.reset()
+
+		# Set by the reactor while it is dispatching events, and None while it is waiting.
+		self.busy_since = None
+
+		# The reactor is assumed to run in the thread that creates the monitor.
+		self.thread_id = thread.get_ident()
+
+		self.watchdog_threshold = watchdog_threshold
+		self.reports = []
+		self.stopped = False
+		self._watchdog = None
+		if watchdog_threshold is not None:
+			self._watchdog = threading.Thread(target = self._watchdog_loop, name = "chiral watchdog")
+			self._watchdog.setDaemon(True)
+			self._watchdog.start()
+
+	def reset(self):
+		"""Clear all statistics."""
+		self.iterations = 0
+		self.events = 0
+		self.max_events = 0
+		self.dispatch_time = 0.0
+		self.timer_time = 0.0
+		self.ready_time = 0.0
+		self.max_iteration_time = 0.0
+		self.total_lag = 0.0
+		self.max_lag = 0.0
+		self.histogram = [ 0 ] * (len(self.HISTOGRAM_BUCKETS) + 1)
+
+	def record(self, events, lag, dispatch_time, timer_time, ready_time):
+		"""Record one loop iteration. This should only be called by the reactor."""
+
+		self.iterations += 1
+		self.events += events
+		self.max_events = max(self.max_events, events)
+		self.dispatch_time += dispatch_time
+		self.timer_time += timer_time
+		self.ready_time += ready_time
+		self.total_lag += lag
+		self.max_lag = max(self.max_lag, lag)
+
+		iteration_time = dispatch_time + timer_time + ready_time
+		self.max_iteration_time = max(self.max_iteration_time, iteration_time)
+
+		for index, bound in enumerate(self.HISTOGRAM_BUCKETS):
+			if iteration_time <= bound:
+				self.histogram[index] += 1
+				break
+		else:
+			self.histogram[-1] += 1
+
+	def _watchdog_loop(self):
+		"""Main function of the watchdog thread."""
+
+		reported = None
+		while not self.stopped:
+			time.sleep(self.watchdog_threshold / 2.0)
+
+			busy_since, iteration = self.busy_since, self.iterations
+			if busy_since is None or iteration == reported:
+				continue
+
+			stalled = time.time() - busy_since
+			if stalled > self.watchdog_threshold:
+				reported = iteration
+				self._report(stalled)
+
+	def stop(self):
+		"""Stop the watchdog thread, if any."""
+		self.stopped = True
+
+	def _report(self, stalled):
+		"""Log the stack and running coroutine of the stalled reactor thread."""
+
+		frame = sys._current_frames().get(self.thread_id)
+		if frame is None:
+			return
+
+		stack = traceback.format_stack(frame)
+		running = find_running_coroutine(frame)
+		del frame
+
+		report = "Reactor blocked for %.3f s at %s in %r:\n%s" % (
+			stalled,
+			time.strftime("%Y-%m-%d %H:%M:%S"),
+			running,
+			"".join(stack)
+		)
+
+		self.reports.append(report)
+		del self.reports[:-self.MAX_REPORTS]
+
+		print >> sys.stderr, report
+
+	def summary(self):
+		"""Return a list of human-readable statistics lines."""
+
+		iterations = self.iterations or 1
+		lines = [
+			"Iterations: %d" % (self.iterations, ),
+			"Events per wakeup: %.2f average, %d max" % (float(self.events) / iterations, self.max_events),
+			"Time per iteration: %.3f ms dispatch, %.3f ms timers, %.3f ms ready calls; %.3f ms max" % (
+				self.dispatch_time * 1000 / iterations,
+				self.timer_time * 1000 / iterations,
+				self.ready_time * 1000 / iterations,
+				self.max_iteration_time * 1000
+			),
+			"Timer lag: %.3f ms average, %.3f ms max" % (
+				self.total_lag * 1000 / iterations,
+				self.max_lag * 1000
+			),
+		]
+
+		lower = 0
+		for bound, count in zip(self.HISTOGRAM_BUCKETS + (None, ), self.histogram):
+			if bound is None:
+				lines.append("  > %g ms: %d" % (lower * 1000, count))
+			else:
+				lines.append("  %g - %g ms: %d" % (lower * 1000, bound * 1000, count))
+				lower = bound
+
+		return lines
+
+
+def find_running_coroutine(frame):
+	"""Return the innermost Coroutine that is running on the stack ending at frame, or None."""
+
+	resume_code = coroutine.Coroutine._run.im_func.func_code
+	while frame is not None:
+		if frame.f_code is resume_code:
+			return frame.f_locals.get("self")
+		frame = frame.f_back
+	return None
+
+
+def enable(watchdog_threshold = None, reactor_instance = None):
+	"""
+	Start monitoring ``reactor_instance`` (by default, ``chiral.net.reactor``).
+
+	Returns the `LoopMonitor`. See the module documentation.
+	"""
+
+	if reactor_instance is None:
+		reactor_instance = reactor
+
+	disable(reactor_instance)
+	reactor_instance.monitor = LoopMonitor(watchdog_threshold)
+	return reactor_instance.monitor
+
+
+def disable(reactor_instance = None):
+	"""Stop monitoring ``reactor_instance`` (by default, ``chiral.net.reactor``)."""
+
+	if reactor_instance is None:
+		reactor_instance = reactor
+
+	if reactor_instance.monitor is not None:
+		reactor_instance.monitor.stop()
+		reactor_instance.monitor = None
+
+
+class _chiral_introspection(object):
+	"""Module-level introspection routines."""
+
+	def main(self):
+		"""Show the loop statistics, if monitoring is enabled."""
+
+		if reactor.busy_poll:
+			busy_poll = [ "Busy poll: %d spins, %d found events" % (
+				reactor.busy_poll_spins, reactor.busy_poll_hits) ]
+		else:
+			busy_poll = []
+
+		monitor = reactor.monitor
+		if monitor is None:
+			return busy_poll + [ "Loop monitoring disabled." ]
+
+		out = busy_poll + monitor.summary()
+		out.append(("Watchdog reports: %d " % len(monitor.reports), "@chiral.net.monitor:reset:0:Reset"))
+		out.extend(monitor.reports)
+		return out
+
+	def cmd_reset(self, _item):
+		"""Clear the statistics and watchdog reports."""
+
+		monitor = reactor.monitor
+		if monitor is not None:
+			monitor.reset()
+			del monitor.reports[:]
+		return ""
+
+__all__ = [ "LoopMonitor", "enable", "disable", "find_running_coroutine" ]
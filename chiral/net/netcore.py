@@ -10,6 +10,10 @@ events have occured. The event loop is as such:
 3. Perform a system call that waits for socket activity or a timeout, whichever comes first.
 4. Dispatch all incoming socket events.
 5. Dispatch all timer events that are ready to run. 
+6. Run the calls that were queued with `Reactor.call_soon` before this iteration began.
+
+Other threads may queue calls with `Reactor.call_from_thread`; these are run at the start of
+the next iteration, and wake the reactor up from step (3) if necessary.
 
 These steps are performed by `Reactor._run_once`. The main `Reactor.run` function simply calls
 ``_run_once`` until it indicates that there are no more events to process.
@@ -22,10 +26,13 @@ and ``kqueue`` (FreeBSD 4.1+, Mac OS X 10.3+) have been introduced. These have t
 step (2) is performed implicitly, when it is determined that the socket is "interesting", and not at
 each event loop. They therefore scale O(1) with respect to the number of open, idle sockets.
 
-Python does not include ``epoll()`` or ``kqueue()`` in its standard library, so ctypes-based bindings
-are provided in `chiral.os`. When `chiral.net.netcore` is loaded, it automatically checks for the
-availability of the platform-specific Reactor classes, and falls back to `SelectReactor` if they are not
-available.
+Python 2.6 and later include ``epoll()`` in the standard ``select`` module; for older versions, and for
+``kqueue()``, ctypes-based bindings are provided in `chiral.os`. When `chiral.net.netcore` is loaded, it
+automatically checks for the availability of the platform-specific Reactor classes, preferring the standard
+library's ``epoll``, and falls back to `PollReactor` or `SelectReactor` if they are not available. The
+ctypes bindings are only imported when they are needed, since loading them probes for the C library.
+The experimental `IoUringReactor` is only used if requested with the ``CHIRAL_REACTOR`` environment
+variable.
 
 Chiral automatically instantiates a `Reactor` instance and makes it available as ``chiral.net.reactor``.
 Users should not create new Reactors themselves.
@@ -38,14 +45,23 @@ See the documentation for the `Reactor` class for information on its specific me
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, version 2.
 
+from __future__ import with_statement
+
 from chiral.core import coroutine, stats
 
+from collections import deque
+
+import os
+import fcntl
+import threading
 import time
 import heapq
 import select
+import sys
 import traceback
 import weakref
 import errno
+import socket
 
 class ConnectionException(Exception):
 	"""Indicates that the connection has failed and will be closed."""
@@ -53,14 +69,288 @@ class ConnectionException(Exception):
 class ConnectionClosedException(ConnectionException):
 	"""Indicates that the connection was closed by the remote end."""
 
+class WaitForTimer(coroutine.WaitCondition):
+	"""
+	WaitCondition returned by `Reactor.schedule`, which fires at a given time.
+
+	If the waiting coroutine is killed, the timer is cancelled. If it fires before it has been
+	bound, yielding it later returns immediately.
+	"""
+
+	__slots__ = ("reactor", "callbacktime", "bound_coro", "fired", "cancelled")
+
+	def __init__(self, reactor_instance, callbacktime):
+		"""Constructor. This should only be called by `Reactor.schedule`."""
+
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.reactor = reactor_instance
+		self.callbacktime = callbacktime
+		self.bound_coro = None
+		self.fired = False
+		self.cancelled = False
+
+	def bind(self, coro):
+		"""Bind to a given coroutine."""
+		if self.fired:
+			return (None, None)
+
+		assert self.bound_coro is None
+		self.bound_coro = coro
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, cancelling the timer."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+		self.reactor._cancel_timer(self)
+
+	def fire(self):
+		"""Resume the bound coroutine. This should only be called by the reactor."""
+		self.fired = True
+		coro = self.bound_coro
+		if coro is not None:
+			self.bound_coro = None
+			coro.resume(None)
+
+	def __repr__(self):
+		return "<WaitForTimer reactor.schedule(callbacktime=%s)>" % (self.callbacktime, )
+
+
+class WaitForReady(coroutine.WaitCondition):
+	"""
+	WaitCondition returned by `Reactor.ready`, which resumes the coroutine on the next loop.
+
+	The coroutine is resumed with ``value`` and ``exception``. If it is unbound first, the
+	queued call is left in the ready queue, and does nothing when it runs.
+	"""
+
+	__slots__ = ("reactor", "args", "bound_coro")
+
+	def __init__(self, reactor_instance, value=None, exception=None):
+		"""Constructor."""
+
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.reactor = reactor_instance
+		self.args = value, exception
+		self.bound_coro = None
+
+	def bind(self, coro):
+		"""Bind to a given coroutine, queueing it to be resumed."""
+		assert self.bound_coro is None
+		self.bound_coro = coro
+		self.reactor._ready.append((self._fire, ()))
+
+	def unbind(self, coro):
+		"""Unbind from a given coroutine, so that the queued call does nothing."""
+		assert self.bound_coro is coro
+		self.bound_coro = None
+
+	def _fire(self):
+		"""Resume the bound coroutine, unless it has been unbound."""
+		coro = self.bound_coro
+		if coro is not None:
+			self.bound_coro = None
+			coro.resume(*self.args)
+
+	def __repr__(self):
+		return "<WaitForReady>"
+
+
+class WaitForFuture(coroutine.WaitCondition):
+	"""
+	WaitCondition returned by `Reactor.wait_for_future`.
+
+	This accepts any object implementing the ``Future`` protocol shared by
+	``concurrent.futures``, its backports and asyncio-style libraries: ``done()``,
+	``result()`` (which raises the future's exception, if it failed) and
+	``add_done_callback(fn)``. Futures may be completed from any thread; the coroutine is
+	resumed in the reactor's thread with `Reactor.call_from_thread`.
+	"""
+
+	__slots__ = ("reactor", "future", "bound_coro", "callback_added")
+
+	def __init__(self, reactor_instance, future):
+		"""Constructor."""
+
+		# Don't call WaitCondition.__init__; it raises NotImplementedError to prevent
+		# it from being instantiated directly.
+		#pylint: disable-msg=W0231
+
+		self.reactor = reactor_instance
+		self.future = future
+		self.bound_coro = None
+		self.callback_added = False
+
+	@staticmethod
+	def _outcome(future):
+		"""Return the (value, exception) result of a completed future."""
+		try:
+			return future.result(), None
+		except Exception: #pylint: disable-msg=W0703
+			return None, sys.exc_info()
+
+	def bind(self, coro):
+		"""Bind to a coroutine, returning the result right away if the future is done."""
+
+		assert self.bound_coro is None
+
+		if self.future.done():
+			return self._outcome(self.future)
+
+		self.bound_coro = coro
+		self.reactor.add_thread_waiter()
+
+		# Futures can't forget their callbacks, so only one is ever added.
+		if not self.callback_added:
+			self.callback_added = True
+			self.future.add_done_callback(self._future_done)
+
+	def unbind(self, coro):
+		"""Unbind from a coroutine. The future itself is not cancelled."""
+
+		assert self.bound_coro is coro
+		self.bound_coro = None
+		self.reactor.remove_thread_waiter()
+
+	def _future_done(self, future):
+		"""Done callback for the future, which may be called in any thread."""
+		try:
+			self.reactor.call_from_thread(self._resume, future)
+		except RuntimeError:
+			# The coroutine has stopped waiting, and removed its thread waiter.
+			pass
+
+	def _resume(self, future):
+		"""Resume the bound coroutine, if there still is one."""
+
+		coro = self.bound_coro
+		if coro is None:
+			return
+
+		self.bound_coro = None
+		self.reactor.remove_thread_waiter()
+		coro.resume(*self._outcome(future))
+
+	def __repr__(self):
+		return "<WaitForFuture %r>" % (self.future, )
+
+
+class _Waker(object):
+	"""
+	A descriptor that other threads can make readable to wake the reactor.
+
+	An eventfd is used if available, since any number of wakeups can be consumed with one
+	``read()``; otherwise, a nonblocking pipe.
+	"""
+
+	def __init__(self):
+		"""Constructor."""
+
+		try:
+			from chiral.os import eventfd
+			self._eventfd = eventfd.EventFD()
+		except (ImportError, OSError):
+			self._eventfd = None
+			self._read_fd, self._write_fd = os.pipe()
+			for fd in self._read_fd, self._write_fd:
+				fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+				fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+		else:
+			self._read_fd = self._write_fd = self._eventfd.fileno()
+
+	def fileno(self):
+		"""Return the descriptor to wait for readability on."""
+		return self._read_fd
+
+	def wake(self):
+		"""Make the descriptor readable. This may be called from any thread."""
+
+		if self._eventfd is not None:
+			self._eventfd.write()
+			return
+
+		try:
+			os.write(self._write_fd, "x")
+		except OSError, exc:
+			# The pipe is full, so it's readable anyway.
+			if exc.errno != errno.EAGAIN:
+				raise
+
+	def drain(self):
+		"""Consume all pending wakeups."""
+
+		if self._eventfd is not None:
+			self._eventfd.read()
+			return
+
+		try:
+			while len(os.read(self._read_fd, 4096)) == 4096:
+				pass
+		except OSError, exc:
+			if exc.errno != errno.EAGAIN:
+				raise
+
+	def close(self):
+		"""Close the descriptors."""
+		if self._eventfd is not None:
+			self._eventfd.close()
+		else:
+			os.close(self._read_fd)
+			os.close(self._write_fd)
+
+
 class Reactor(object):
-	"""Base class for Reactor objects."""
+	"""
+	Base class for Reactor objects.
+
+	Scheduled events are kept in a heap of ``(time, sequence, WaitForTimer)`` entries. Cancelled
+	timers are not removed from the heap immediately, which would be O(n); they are skipped when
+	they reach the top, and the heap is rebuilt without them if they come to make up more than
+	half of it.
+	"""
+
+	# Don't bother compacting the heap until it has at least this many cancelled entries.
+	MIN_TIMER_COMPACTION = 64
 
 	def __init__(self):
 		self._events = []
+		self._event_sequence = 0
+		self._cancelled_timers = 0
+
+		# The time at which scheduled events were last checked; updated once per loop.
+		self.loop_time = time.time()
+
+		# Calls queued by call_soon(), as (function, args) tuples.
+		self._ready = deque()
+
+		# Calls queued by call_from_thread(), and the lock protecting them. _wakeup_pending
+		# is set once the waker has been written to for the current batch.
+		self._thread_calls = deque()
+		self._thread_lock = threading.Lock()
+		self._wakeup_pending = False
+
+		# The waker is created and watched only while add_thread_waiter() is in effect.
+		self._waker = None
+		self._waker_wait = None
+		self._waker_binding = coroutine._ResumeBinding(self._waker_fired)
+		self._thread_waiters = 0
 
 		self._close_list = weakref.WeakValueDictionary()
 
+		# Loop instrumentation; see chiral.net.monitor.
+		self.monitor = None
+
+		# Busy polling; see set_busy_poll.
+		self.busy_poll = 0
+		self.socket_busy_poll = None
+		self.busy_poll_spins = 0
+		self.busy_poll_hits = 0
+
 	def close_on_exit(self, sock):
 		"""Add `sock` to a list of sockets to be closed when the reactor terminates."""
 		self._close_list[id(sock)] = sock
@@ -72,22 +362,224 @@ class Reactor(object):
 		This should only be called by `Reactor._run_once`.
 		"""
 
-		while len(self._events) > 0:
-			next_event_time, next_event_cb = self._events[0][:2]
-			if next_event_time > time.time():
+		events = self._events
+		now = self.loop_time = time.time()
+
+		while events:
+			if events[0][0] > now:
 				break
 
-			next_event_cb()
+			timer = heapq.heappop(events)[2]
+
+			if timer.cancelled:
+				self._cancelled_timers -= 1
+				continue
+
+			timer.fire()
+
+	def _handle_ready_calls(self):
+		"""
+		Run the calls queued with `call_soon`.
+
+		Only calls that were queued before this method started are run; anything they queue
+		waits for the next loop iteration, so that sockets and timers are not starved.
+
+		This should only be called by `Reactor._run_once`.
+		"""
+
+		ready = self._ready
+		for _index in xrange(len(ready)):
+			func, args = ready.popleft()
+
+			# Yes, we really do want to catch /all/ Exceptions
+			# pylint: disable-msg=W0703
+			try:
+				func(*args)
+			except Exception:
+				print "Unhandled exception in call_soon %s:" % (func, )
+				traceback.print_exc()
+
+	def call_soon(self, func, *args):
+		"""
+		Call ``func(*args)`` during the next iteration of the reactor loop.
+
+		Calls are made in the order they were queued, after socket and timer events.
+		"""
+		self._ready.append((func, args))
+
+	def ready(self):
+		"""
+		Return a WaitCondition that resumes the coroutine during the next reactor loop.
+
+		This is the cheapest way for a coroutine to let other events be handled, i.e. during
+		a potentially CPU-intensive operation::
+
+			yield reactor.ready()
+		"""
+		return WaitForReady(self)
+
+	def ready_with(self, value=None, exception=None):
+		"""
+		Return a WaitCondition that resumes the coroutine during the next reactor loop with
+		``value``, or with ``exception``, a ``(type, value, traceback)`` tuple.
+
+		This is used by `Coroutine` to requeue a coroutine that has used up its resume budget.
+		"""
+		return WaitForReady(self, value, exception)
+
+	def wait_for_future(self, future):
+		"""
+		Return a WaitCondition for the completion of ``future``; see `WaitForFuture`.
+
+		This lets coroutines use libraries built on futures::
+
+			result = yield reactor.wait_for_future(executor.submit(func))
+		"""
+		return WaitForFuture(self, future)
+
+	def _cancel_timer(self, timer):
+		"""
+		Mark ``timer`` as cancelled, so that it is skipped when it comes due.
+
+		This should only be called by `WaitForTimer.unbind`.
+		"""
+
+		if timer.cancelled or timer.fired:
+			return
 
-			del self._events[0]
+		timer.cancelled = True
+		self._cancelled_timers += 1
+
+		events = self._events
+		if self._cancelled_timers > max(len(events) // 2, self.MIN_TIMER_COMPACTION):
+			# Compact in place: this may be called from a timer callback, while
+			# _handle_scheduled_events is popping from the same list.
+			events[:] = [ entry for entry in events if not entry[2].cancelled ]
+			heapq.heapify(events)
+			self._cancelled_timers = 0
+
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets. Implemented by subclasses."""
+		raise NotImplementedError
+
+	def _wait_for_events(self, delay):
+		"""
+		Wait up to ``delay`` seconds (or indefinitely, if None) for socket events.
+
+		Returns the events in a form understood by `_handle_events`. Implemented by subclasses.
+		"""
+		raise NotImplementedError
+
+	def _handle_events(self, events):
+		"""Resume the coroutines waiting on the sockets in ``events``. Implemented by subclasses."""
+		raise NotImplementedError
+
+	def _event_count(self, events):
+		"""Return the number of socket events in ``events``."""
+		return len(events)
 
 	def _run_once(self):
 		"""
 		Run one iteration of the main event handling loop.
 
-		This should only be called by `Reactor.run`.
+		This should only be called by `Reactor.run`. Returns False once there is nothing
+		left to wait for.
 		"""
-		raise NotImplementedError
+
+		if self._thread_calls:
+			self._handle_thread_calls()
+
+		delay = self.time_to_next_event()
+
+		if delay is None and not self._has_waiters():
+			return False
+
+		try:
+			if self.busy_poll and delay != 0:
+				events = self._busy_wait_for_events(delay)
+			else:
+				events = self._wait_for_events(delay)
+		except KeyboardInterrupt:
+			# Just return.
+			return False
+
+		monitor = self.monitor
+		if monitor is None:
+			self._handle_events(events)
+			self._handle_scheduled_events()
+			self._handle_ready_calls()
+		else:
+			self._run_monitored(monitor, events)
+
+		return True
+
+	def set_busy_poll(self, usecs, socket_usecs = None):
+		"""
+		Trade CPU time for latency by spinning before blocking.
+
+		Each time the reactor would block waiting for events, it first polls without a timeout
+		for up to ``usecs`` microseconds, and only then blocks for the rest of the delay. An
+		event arriving during the spin is handled without the wakeup latency of a blocking
+		``epoll_wait()``. ``busy_poll_spins`` counts the spins, and ``busy_poll_hits`` the
+		spins that found events. Pass 0 to turn spinning off.
+
+		If ``socket_usecs`` is given, sockets accepted by `chiral.net.tcp.TCPServer` also get
+		the ``SO_BUSY_POLL`` option, which makes the kernel busy-poll the network device when
+		they are read; raising it above ``net.core.busy_read`` needs ``CAP_NET_ADMIN``.
+		"""
+
+		self.busy_poll = usecs / 1e6
+		self.socket_busy_poll = socket_usecs
+
+	def _busy_wait_for_events(self, delay):
+		"""Poll without blocking for up to ``busy_poll`` seconds, then wait for the rest of ``delay``."""
+
+		self.busy_poll_spins += 1
+		start = time.time()
+		spin = self.busy_poll
+		if delay is not None:
+			spin = min(spin, delay)
+
+		while True:
+			events = self._wait_for_events(0)
+			if self._event_count(events):
+				self.busy_poll_hits += 1
+				stats.increment("chiral.net.netcore.busy_poll.hits")
+				return events
+
+			elapsed = time.time() - start
+			if elapsed >= spin:
+				break
+
+		stats.increment("chiral.net.netcore.busy_poll.misses")
+
+		if delay is not None:
+			delay = max(delay - elapsed, 0)
+		return self._wait_for_events(delay)
+
+	def _run_monitored(self, monitor, events):
+		"""Dispatch ``events``, timers and ready calls, recording timings with ``monitor``."""
+
+		woke = time.time()
+		monitor.busy_since = woke
+
+		# Every due timer was scheduled no later than the first, so its lateness
+		# is the loop's lag.
+		if self._events and self._events[0][0] <= woke:
+			lag = woke - self._events[0][0]
+		else:
+			lag = 0.0
+
+		self._handle_events(events)
+		dispatched = time.time()
+		self._handle_scheduled_events()
+		timers_done = time.time()
+		self._handle_ready_calls()
+		done = time.time()
+
+		monitor.busy_since = None
+		monitor.record(self._event_count(events), lag,
+			dispatched - woke, timers_done - dispatched, done - timers_done)
 
 	def run(self):
 		"""Run the main event processing loop."""
@@ -95,11 +587,18 @@ class Reactor(object):
 		# Because this is the main event processing loop, it cannot
 		# be replaced when the module is reloaded. Therefore, as
 		# little logic as possible should happen here.
-		while True:
-			stats.increment("chiral.net.netcore.%s.loops" % self.__class__.__name__)
-			res = self._run_once()
-			if not res:
-				break
+
+		# Coroutines that use up their resume budget are requeued on this reactor.
+		dispatcher = coroutine._DISPATCHER
+		previous_reactor, dispatcher.reactor = dispatcher.reactor, self
+		try:
+			while True:
+				stats.increment("chiral.net.netcore.%s.loops" % self.__class__.__name__)
+				res = self._run_once()
+				if not res:
+					break
+		finally:
+			dispatcher.reactor = previous_reactor
 
 		close_list = list(self._close_list.itervalues())
 		for sock in close_list:
@@ -110,12 +609,9 @@ class Reactor(object):
 		"""
 		Return a WaitCondition that will fire at some point in the future.
 
-		If both ``time`` and ``delay`` are None, the WaitCondition will fire as soon as
-		possible, during the next reactor loop. Since the reactor handles socket events
-		before scheduled calls, one can yield control to the Reactor to handle incoming
-		events (i.e. during a potentially CPU-intensive operation) with::
-
-			yield reactor.schedule()
+		If both ``time`` and ``delay`` are None, this is the same as `ready`: the coroutine
+		is resumed during the next reactor loop, after socket events have been handled.
+		Otherwise, if the coroutine waiting on it is killed, the timer is cancelled.
 
 		:param callbacktime: An absolute time or UNIX timestamp.
 		:type callbacktime: datetime.datetime, int, float
@@ -123,6 +619,9 @@ class Reactor(object):
 		:type delay: datetime.timedelta, int, float
 		"""
 
+		if not delay and not callbacktime:
+			return WaitForReady(self)
+
 		now = time.time()
 
 		if delay:
@@ -139,7 +638,7 @@ class Reactor(object):
 			# Convert to timestamp if necessary
 			if hasattr(callbacktime, "timetuple"):
 				callbacktime = time.mktime(callbacktime.timetuple()) + \
-					(callbacktime.microseconds / 1e6)
+					(callbacktime.microsecond / 1e6)
 
 			else:
 				try:
@@ -147,15 +646,14 @@ class Reactor(object):
 				except TypeError:
 					raise TypeError("callbacktime must be a number or datetime")
 
-		else:
-			callbacktime = now
-
-		callback = coroutine.WaitForCallback("reactor.schedule(callbacktime=%s)" % (callbacktime, ))
+		timer = WaitForTimer(self, callbacktime)
 
-		# Now the time is normalized; just add it to the queue.
-		heapq.heappush(self._events, (callbacktime, callback))
+		# Now the time is normalized; just add it to the queue. The sequence number keeps
+		# timers with equal times in FIFO order, and keeps heapq from comparing them.
+		self._event_sequence += 1
+		heapq.heappush(self._events, (callbacktime, self._event_sequence, timer))
 
-		return callback
+		return timer
 
 	def wait_for_readable(self, sock):
 		"""Return a WaitCondition for readability on a socket.
@@ -176,11 +674,139 @@ class Reactor(object):
 		"""
 		raise NotImplementedError
 
+	def call_from_thread(self, func, *args):
+		"""
+		Call ``func(*args)`` in the reactor's thread, at the start of its next loop.
+
+		Unlike every other Reactor method, this may be called from any thread. Calls are queued
+		in a batch, and only the first call in each batch wakes the reactor, so a burst of calls
+		costs one write to the waker descriptor.
+
+		The reactor only watches that descriptor, and `run` only keeps going, while a thread
+		waiter is registered with `add_thread_waiter`. A call made without one could wait
+		indefinitely, or never run at all, so it raises RuntimeError instead.
+		"""
+
+		with self._thread_lock:
+			if not self._thread_waiters:
+				raise RuntimeError("call_from_thread requires a thread waiter; see add_thread_waiter")
+
+			self._thread_calls.append((func, args))
+			if self._wakeup_pending or self._waker is None:
+				return
+			self._wakeup_pending = True
+
+		self._waker.wake()
+
+	def add_thread_waiter(self):
+		"""
+		Register an outstanding `call_from_thread` call.
+
+		Until a matching `remove_thread_waiter`, the reactor watches its waker descriptor,
+		and `run` won't return for lack of anything to wait for. This must be called from the
+		reactor's thread.
+		"""
+
+		self._thread_waiters += 1
+		if self._waker_wait is None:
+			self._arm_waker()
+
+	def remove_thread_waiter(self):
+		"""Unregister a thread waiter added by `add_thread_waiter`."""
+
+		assert self._thread_waiters > 0
+		self._thread_waiters -= 1
+		if not self._thread_waiters and self._waker_wait is not None:
+			self._waker_wait.unbind(self._waker_binding)
+			self._waker_wait = None
+
+	def _arm_waker(self):
+		"""Wait for the waker to become readable, creating it if necessary."""
+
+		if self._waker is None:
+			self._waker = _Waker()
+
+		self._waker_wait = self.wait_for_readable(self._waker)
+		self._waker_wait.bind(self._waker_binding)
+
+	def _waker_fired(self, _value, _exc=None):
+		"""Run the calls that woke the reactor, then watch the waker again if still needed."""
+
+		self._waker_wait = None
+
+		# Consume the wakeup before taking the batch, so that a call queued after the batch
+		# is taken always writes to the waker again.
+		self._waker.drain()
+		self._handle_thread_calls()
+
+		if self._thread_waiters and self._waker_wait is None:
+			self._arm_waker()
+
+	def _handle_thread_calls(self):
+		"""Run the calls queued by `call_from_thread`."""
+
+		with self._thread_lock:
+			calls = self._thread_calls
+			self._thread_calls = deque()
+			self._wakeup_pending = False
+
+		for func, args in calls:
+			# Yes, we really do want to catch /all/ Exceptions
+			# pylint: disable-msg=W0703
+			try:
+				func(*args)
+			except Exception:
+				print "Unhandled exception in call from thread %s:" % (func, )
+				traceback.print_exc()
+
+	def after_fork(self):
+		"""
+		Reinitialize the reactor in a newly forked child process.
+
+		Reactors whose kernel state is shared with, or lost across, ``fork()`` recreate it here,
+		re-arming any pending socket waits, and then call this. The base implementation gives
+		the child its own waker descriptor. See `chiral.net.cluster`.
+		"""
+
+		if self._waker is None:
+			return
+
+		waker = self._waker
+		if self._waker_wait is not None:
+			self._waker_wait.unbind(self._waker_binding)
+			self._waker_wait = None
+		self.unregister(waker)
+		waker.close()
+
+		self._waker = None
+		self._wakeup_pending = False
+		if self._thread_waiters:
+			self._arm_waker()
+
+	def unregister(self, sock):
+		"""
+		Discard any state the reactor keeps for ``sock``.
+
+		Reactors that keep sockets registered with the kernel between waits release them
+		here; this should be called just before the socket is closed. The default does nothing.
+		"""
+		pass
+
 	def time_to_next_event(self):
 		"""Return the time, in seconds, until the next scheduled event."""
-		if len(self._events) > 0:
-			next_event_time = self._events[0][0]
-			return max(next_event_time - time.time(), 0)
+
+		if self._ready:
+			return 0
+
+		# Discard cancelled timers from the top of the heap, so that they neither wake
+		# the reactor early nor keep it running.
+		events = self._events
+		while events and events[0][2].cancelled:
+			heapq.heappop(events)
+			self._cancelled_timers -= 1
+
+		if events:
+			return max(events[0][0] - time.time(), 0)
 		else:
 			return None
 
@@ -199,6 +825,8 @@ class SelectReactor(Reactor):
 		the reactor's select() loop.
 		"""
 
+		__slots__ = ("sock", "reactor", "event_list", "bound_coro")
+
 		def __init__(self, sock, reactor_instance, event_list):
 			"""
 			Constructor.
@@ -213,7 +841,7 @@ class SelectReactor(Reactor):
 		def bind(self, coro):
 			"""Bind to coro, adding the socket to the select list."""
 			assert self.bound_coro is None
-			assert coro not in self.event_list
+			assert self.sock not in self.event_list
 			self.event_list[self.sock] = coro
 			self.bound_coro = coro
 
@@ -235,32 +863,34 @@ class SelectReactor(Reactor):
 		"""Return a WaitCondition for writeability on ``sock``."""
 		return self.WaitForEvent(sock, self, self._write_sockets)
 
-	def _run_once(self):
-		"""Run one iteration of the event handler."""
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets."""
+		return bool(self._read_sockets or self._write_sockets)
 
-		stats.increment("chiral.net.netcore.select_calls")
+	def _wait_for_events(self, delay):
+		"""Call select(), returning a (readable, writeable) tuple of lists."""
 
-		delay = self.time_to_next_event()
-
-		if delay is None and len(self._read_sockets) == 0 and len(self._write_sockets) == 0:
-			return False
+		stats.increment("chiral.net.netcore.select_calls")
 
 		try:
-			rlist, wlist = select.select(
+			return select.select(
 				self._read_sockets.keys(),
 				self._write_sockets.keys(),
 				(),
 				delay
 			)[:2]
-		except KeyboardInterrupt:
-			# Just return.
-			return False
+		except select.error, exc:
+			# Interrupted by a signal; its handler may have queued work.
+			if exc.args[0] != errno.EINTR:
+				raise
+			return (), ()
 
+	def _handle_events(self, events):
+		"""Resume the coroutines waiting on each readable or writeable socket."""
 
-		def _handle_events(items, event_list):
+		def _handle_event_list(items, event_list):
 			"""
 			For each item in items: resume the coroutine in event_list whose key is that item.
-			key is that item.
 			"""
 			for key in items:
 				if key not in event_list:
@@ -277,29 +907,206 @@ class SelectReactor(Reactor):
 					print "Unhandled exception in TCP event %s:" % (coro, )
 					traceback.print_exc() 
 
+		rlist, wlist = events
+		_handle_event_list(rlist, self._read_sockets)
+		_handle_event_list(wlist, self._write_sockets)
 
-		_handle_events(rlist, self._read_sockets)
-		_handle_events(wlist, self._write_sockets)
+	def _event_count(self, events):
+		"""Return the number of socket events in ``events``."""
+		return len(events[0]) + len(events[1])
 
-		self._handle_scheduled_events()
 
-		return True
+class PollReactor(Reactor):
+	"""
+	Reactor using poll()
+
+	This is used where neither epoll() nor kqueue() is available. Unlike select(), poll() has no
+	limit on descriptor numbers, and ``select.poll`` keeps its descriptor list between calls,
+	so registering and unregistering a socket costs no system call.
+
+	Each fd has separate read and write slots, so one coroutine may wait for a socket to
+	become readable while another waits for it to become writeable; the descriptor is
+	polled for the union of both.
+	"""
+
+	# Flags that wake both directions; the next read or write will report the error.
+	ERROR_FLAGS = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+	def __init__(self):
+		Reactor.__init__(self)
+
+		self.poll = select.poll()
+
+		# Bound WaitForEvents, by fd, for each direction.
+		self._readers = {}
+		self._writers = {}
+
+	class WaitForEvent(coroutine.WaitCondition):
+		"""Wait for an event."""
+
+		__slots__ = ("fd", "reactor", "event", "slots", "bound_coro")
+
+		def __init__(self, sock, reactor_instance, event):
+			"""
+			Constructor.
+
+			sock will be passed to poll.register(); reactor must be a PollReactor.
+			"""
+
+			self.fd = sock.fileno()
+			self.reactor = reactor_instance
+			self.event = event
+			if event == select.POLLIN:
+				self.slots = reactor_instance._readers
+			else:
+				self.slots = reactor_instance._writers
+			self.bound_coro = None
+
+		def bind(self, coro):
+			"""Bind to coro, adding the socket to the poll list."""
+			assert self.bound_coro is None
+			assert self.fd not in self.slots
+			self.slots[self.fd] = self
+			self.bound_coro = coro
+			self.reactor._update(self.fd)
+
+		def unbind(self, coro):
+			"""Unbind from coro and remove the socket from the poll list."""
+			assert self.bound_coro is coro
+			assert self.slots.get(self.fd) is self
+			del self.slots[self.fd]
+			self.bound_coro = None
+			self.reactor._update(self.fd)
+
+		def __repr__(self):
+			return "<PollReactor.WaitForEvent: fd %r>" % (self.fd, )
+
+	def _update(self, fd):
+		"""Poll ``fd`` for whichever directions have a waiter, or remove it if neither does."""
+
+		mask = 0
+		if fd in self._readers:
+			mask |= select.POLLIN
+		if fd in self._writers:
+			mask |= select.POLLOUT
+
+		if mask:
+			# register() replaces the mask of an fd that's already in the list.
+			self.poll.register(fd, mask)
+		else:
+			try:
+				self.poll.unregister(fd)
+			except KeyError:
+				pass
+
+	def wait_for_readable(self, sock):
+		"""Return a WaitCondition for readability on ``sock``."""
+		return self.WaitForEvent(sock, self, select.POLLIN)
+
+	def wait_for_writeable(self, sock):
+		"""Return a WaitCondition for writeability on ``sock``."""
+		return self.WaitForEvent(sock, self, select.POLLOUT)
+
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets."""
+		return bool(self._readers or self._writers)
+
+	def _wait_for_events(self, delay):
+		"""Call poll(), returning a list of (fd, events) tuples."""
+
+		if delay is not None:
+			# poll() takes milliseconds
+			delay = delay * 1000
+
+		try:
+			return self.poll.poll(delay)
+		except select.error, exc:
+			# Interrupted by a signal; its handler may have queued work.
+			if exc.args[0] != errno.EINTR:
+				raise
+			return ()
+
+	def _handle_events(self, events):
+		"""Resume the coroutines waiting on each ready fd."""
+
+		for event_fd, event_flags in events:
+			fired = []
+			if event_flags & (select.POLLIN | self.ERROR_FLAGS) and event_fd in self._readers:
+				fired.append(self._readers.pop(event_fd))
+			if event_flags & (select.POLLOUT | self.ERROR_FLAGS) and event_fd in self._writers:
+				fired.append(self._writers.pop(event_fd))
+
+			if not fired:
+				continue
+
+			self._update(event_fd)
+
+			for condition in fired:
+				coro = condition.bound_coro
+				condition.bound_coro = None
+
+				# Yes, we really do want to catch /all/ Exceptions
+				# pylint: disable-msg=W0703
+				try:
+					coro.resume(None)
+				except Exception:
+					print "Unhandled exception in TCP event %s:" % (coro, )
+					traceback.print_exc() 
 
 
 class EpollReactor(Reactor):
 	"""
 	Reactor using epoll()
+
+	The standard library's ``select.epoll`` is used if available; otherwise the ctypes bindings
+	in `chiral.os.epoll`, which provide the same interface, are used instead.
+
+	Each socket is added to the epoll set the first time a coroutine waits on it, and stays
+	there until `unregister` is called (generally by `TCPConnection.close`). Interest is
+	registered with ``EPOLLONESHOT``, so once an event fires the descriptor is disarmed by
+	the kernel, and the next wait only needs a single ``EPOLL_CTL_MOD`` to re-arm it rather
+	than an ``EPOLL_CTL_ADD``/``EPOLL_CTL_DEL`` pair.
+
+	Each fd has separate read and write slots, so one coroutine may wait for a socket to
+	become readable while another waits for it to become writeable. The descriptor is armed
+	for the union of both directions; since a one-shot notification disarms the whole fd, it
+	is armed again if a waiter in the other direction is left over.
+
+	Up to ``max_events`` events are retrieved per call to ``epoll_wait()``. If ``adaptive`` is
+	set, ``max_events`` is doubled (up to ``MAX_EVENTS_LIMIT``) whenever a call fills the whole
+	batch, since more events were probably left waiting in the kernel.
 	"""
 
-	def __init__(self, default_size = 10):
+	MAX_EVENTS_LIMIT = 4096
+
+	def __init__(self, max_events = 64, adaptive = True):
 		Reactor.__init__(self)
 
-		self.epoll = epoll.Epoll(default_size)
+		self.epoll = _Epoll()
+		self.max_events = max_events
+		self.adaptive = adaptive
 
-		self._sockets = {}
+		# Bound WaitForEvents, by fd, for each direction.
+		self._readers = {}
+		self._writers = {}
+
+		# Sockets currently in the epoll set, by fd.
+		self._registered = weakref.WeakValueDictionary()
+
+		# The event mask each fd in the epoll set is currently armed for. This is 0 once
+		# a notification has disarmed it.
+		self._armed = {}
+
+		# Cached WaitForEvent instances: socket -> { event: WaitForEvent }
+		self._wait_conditions = weakref.WeakKeyDictionary()
 
 	class WaitForEvent(coroutine.WaitCondition):
-		"""Wait for an event."""
+		"""Wait for an event.
+
+		One WaitForEvent is created per socket and direction, and reused for each wait.
+		"""
+
+		__slots__ = ("sock_ref", "fd", "reactor", "event", "slots", "bound_coro")
 
 		def __init__(self, sock, reactor_instance, event):
 			"""
@@ -308,96 +1115,356 @@ class EpollReactor(Reactor):
 			sock will be passed to epoll_ctl(); reactor must be an EpollReactor.
 			"""
 
-			self.sock = sock
+			# Only a weak reference is kept to the socket, since the reactor caches
+			# WaitForEvents by socket.
+			self.sock_ref = weakref.ref(sock)
+			self.fd = sock.fileno()
 			self.reactor = reactor_instance
 			self.event = event
+			if event == epoll.EPOLLIN:
+				self.slots = reactor_instance._readers
+			else:
+				self.slots = reactor_instance._writers
 			self.bound_coro = None
 
 		def bind(self, coro):
-			"""Bind to coro, adding the socket to the epoll list."""
+			"""Bind to coro, arming the socket in the epoll set."""
 			assert self.bound_coro is None
-			assert self.sock.fileno() not in self.reactor._sockets
-			self.reactor._sockets[self.sock.fileno()] = self.sock, coro, self.event
-			self.reactor.epoll.ctl(epoll.EPOLL_CTL_ADD, self.sock.fileno(), self.event)
+			assert self.fd not in self.slots
+			self.slots[self.fd] = self
 			self.bound_coro = coro
+			self.reactor._arm(self.sock_ref(), self.fd)
 
 		def unbind(self, coro):
-			"""Unbind from coro and remove the socket from the select list."""
-			assert self.bound_coro is coro
-			assert self.sock.fileno() in self.reactor._sockets
-			del self.reactor._sockets[self.sock.fileno()]
-			try:
-				self.reactor.epoll.ctl(epoll.EPOLL_CTL_DEL, self.sock.fileno(), 0)
-			except OSError, exc:
-				if exc.errno == errno.ENOENT:
-					# The fd isn't in the list anymore anyway; fine.
-					pass
-				else:
-					raise exc
+			"""Unbind from coro.
 
+			The socket stays in the epoll set; if its event fires anyway, it will be ignored.
+			"""
+			assert self.bound_coro is coro
+			assert self.slots.get(self.fd) is self
+			del self.slots[self.fd]
 			self.bound_coro = None
 
 		def __repr__(self):
-			return "<EpollReactor.WaitForEvent: fd %r>" % (self.sock.fileno(), )
+			return "<EpollReactor.WaitForEvent: fd %r>" % (self.fd, )
+
+	def _arm(self, sock, fd):
+		"""Register interest in every direction with a waiter on ``sock`` for one notification."""
+
+		mask = 0
+		if fd in self._readers:
+			mask |= epoll.EPOLLIN
+		if fd in self._writers:
+			mask |= epoll.EPOLLOUT
+
+		registered = self._registered.get(fd) is sock
+		if registered and self._armed.get(fd) == mask:
+			return
+
+		flags = mask | epoll.EPOLLONESHOT
+		self._armed[fd] = mask
+
+		if registered:
+			try:
+				self.epoll.modify(fd, flags)
+				return
+			except EnvironmentError, exc:
+				# The fd was closed and reused behind our back; add it again below.
+				if exc.errno != errno.ENOENT:
+					raise
+
+		try:
+			self.epoll.register(fd, flags)
+		except EnvironmentError, exc:
+			# Another socket object, since closed without being unregistered, left
+			# the same fd number in the set.
+			if exc.errno != errno.EEXIST:
+				raise
+			self.epoll.modify(fd, flags)
+
+		self._registered[fd] = sock
+
+	def unregister(self, sock):
+		"""Remove ``sock`` from the epoll set. This should be called just before closing it."""
+
+		self._wait_conditions.pop(sock, None)
+
+		try:
+			fd = sock.fileno()
+		except socket.error:
+			# Already closed.
+			return
+
+		if self._registered.get(fd) is not sock:
+			return
+
+		del self._registered[fd]
+		self._armed.pop(fd, None)
+		try:
+			self.epoll.unregister(fd)
+		except EnvironmentError, exc:
+			if exc.errno not in (errno.ENOENT, errno.EBADF):
+				raise
+
+	def after_fork(self):
+		"""
+		Give this process its own epoll set.
+
+		A forked child shares its parent's epoll instance, so registrations made by one
+		process would affect the other. The child's reference is dropped, and every pending
+		wait is armed again in a new epoll set.
+		"""
+
+		self.epoll.close()
+		self.epoll = _Epoll()
+		self._registered.clear()
+		self._armed.clear()
+		self._wait_conditions.clear()
+
+		for slots in (self._readers, self._writers):
+			for fd, condition in slots.items():
+				self._arm(condition.sock_ref(), fd)
+
+		Reactor.after_fork(self)
+
+	def _wait_for_event(self, sock, event):
+		"""Return the cached WaitForEvent for ``sock`` and ``event``, creating it if needed."""
+
+		conditions = self._wait_conditions.get(sock)
+		if conditions is None:
+			conditions = self._wait_conditions[sock] = {}
+
+		condition = conditions.get(event)
+		if condition is None:
+			condition = conditions[event] = self.WaitForEvent(sock, self, event)
+
+		return condition
 
 	def wait_for_readable(self, sock):
 		"""Return a WaitCondition for readability on ``sock``."""
-		return self.WaitForEvent(sock, self, epoll.EPOLLIN)
+		return self._wait_for_event(sock, epoll.EPOLLIN)
 
 	def wait_for_writeable(self, sock):
 		"""Return a WaitCondition for writeability on ``sock``."""
-		return self.WaitForEvent(sock, self, epoll.EPOLLOUT)
+		return self._wait_for_event(sock, epoll.EPOLLOUT)
 
-	def _run_once(self):
-		"""Run one iteration of the event handler."""
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets."""
+		return bool(self._readers or self._writers)
 
-		delay = self.time_to_next_event()
+	def _wait_for_events(self, delay):
+		"""Call epoll_wait(), returning a list of (fd, events) tuples."""
 
-		if delay is None and len(self._sockets) == 0:
-			return False
+		if delay is None:
+			delay = -1
 
 		try:
-			events = self.epoll.wait(10, delay)
-		except KeyboardInterrupt:
-			# Just return.
+			events = self.epoll.poll(delay, self.max_events)
+		except EnvironmentError, exc:
+			# Interrupted by a signal; its handler may have queued work.
+			if exc.errno != errno.EINTR:
+				raise
+			return ()
+
+		if len(events) == self.max_events and self.adaptive \
+		   and self.max_events < self.MAX_EVENTS_LIMIT:
+			self.max_events = min(self.max_events * 2, self.MAX_EVENTS_LIMIT)
+			stats.increment("chiral.net.netcore.epoll.max_events_increased")
+
+		return events
+
+	def _handle_events(self, events):
+		"""Resume the coroutines waiting on each ready fd."""
+
+		error_flags = epoll.EPOLLERR | epoll.EPOLLHUP
+
+		for event_fd, event_flags in events:
+			# The notification disarmed the fd.
+			if event_fd in self._armed:
+				self._armed[event_fd] = 0
+
+			# Waits that were unbound after the kernel reported the event are skipped.
+			fired = []
+			if event_flags & (epoll.EPOLLIN | error_flags) and event_fd in self._readers:
+				fired.append(self._readers.pop(event_fd))
+			if event_flags & (epoll.EPOLLOUT | error_flags) and event_fd in self._writers:
+				fired.append(self._writers.pop(event_fd))
+
+			# A waiter in the other direction needs the fd armed again.
+			leftover = self._readers.get(event_fd) or self._writers.get(event_fd)
+			if leftover is not None:
+				self._arm(leftover.sock_ref(), event_fd)
+
+			for condition in fired:
+				coro = condition.bound_coro
+				condition.bound_coro = None
+
+				# Yes, we really do want to catch /all/ Exceptions
+				# pylint: disable-msg=W0703
+				try:
+					coro.resume(None)
+				except Exception:
+					print "Unhandled exception in TCP event %s:" % (coro, )
+					traceback.print_exc() 
+
+
+class IoUringReactor(Reactor):
+	"""
+	Reactor using io_uring (experimental)
+
+	Each wait is a one-shot ``IORING_OP_POLL_ADD`` request, identified by a token in its
+	user_data. Binding and unbinding waits only queue requests in the submission ring; they
+	are all submitted by the same ``io_uring_enter()`` that waits for completions, so a loop
+	iteration costs one system call however many waits were armed or cancelled in it. Unbound
+	waits are cancelled with ``IORING_OP_POLL_REMOVE``, and completions for them are ignored.
+	Reads and writes are still made directly on the socket once its poll completes.
+
+	This is never the default reactor. It is used instead of `EpollReactor` if the environment
+	variable ``CHIRAL_REACTOR`` is set to ``IoUringReactor`` and `available` returns True.
+	"""
+
+	def __init__(self, entries = 256):
+		Reactor.__init__(self)
+
+		# Imported here, since loading the bindings probes for the C library.
+		from chiral.os import io_uring
+		self._io_uring = io_uring
+
+		self.entries = entries
+		self.ring = io_uring.IoUring(entries)
+
+		# Bound WaitForEvents, by token.
+		self._pending = {}
+		self._next_token = 1
+
+	@staticmethod
+	def available():
+		"""Return True if the kernel supports io_uring, with the features needed here."""
+		try:
+			from chiral.os import io_uring
+		except ImportError:
 			return False
+		return io_uring.available()
 
-		for _event_flags, event_fd in events:
-			if event_fd not in self._sockets:
-				continue
+	class WaitForEvent(coroutine.WaitCondition):
+		"""Wait for an event."""
+
+		__slots__ = ("fd", "reactor", "event", "token", "bound_coro")
+
+		def __init__(self, sock, reactor_instance, event):
+			"""
+			Constructor.
+
+			reactor must be an IoUringReactor.
+			"""
+
+			self.fd = sock.fileno()
+			self.reactor = reactor_instance
+			self.event = event
+			self.token = None
+			self.bound_coro = None
+
+		def bind(self, coro):
+			"""Bind to coro, queueing a poll request for the socket."""
+			assert self.bound_coro is None
+			self.bound_coro = coro
+			self.reactor._poll(self)
+
+		def unbind(self, coro):
+			"""Unbind from coro, queueing the cancellation of its poll request."""
+			assert self.bound_coro is coro
+			self.reactor._cancel(self)
+			self.bound_coro = None
+
+		def __repr__(self):
+			return "<IoUringReactor.WaitForEvent: fd %r>" % (self.fd, )
+
+	def _poll(self, condition):
+		"""Queue a poll request for ``condition``."""
+
+		token = self._next_token
+		self._next_token += 1
+
+		condition.token = token
+		self._pending[token] = condition
+		self.ring.poll_add(condition.fd, condition.event, token)
+
+	def _cancel(self, condition):
+		"""Queue the removal of ``condition``'s poll request."""
+
+		del self._pending[condition.token]
+		self.ring.poll_remove(condition.token)
+		condition.token = None
+
+	def after_fork(self):
+		"""Set up a new ring, since the child shares its parent's, and re-queue every pending poll."""
+
+		self.ring.close()
+		self.ring = self._io_uring.IoUring(self.entries)
+
+		for token, condition in self._pending.items():
+			self.ring.poll_add(condition.fd, condition.event, token)
+
+		Reactor.after_fork(self)
+
+	def wait_for_readable(self, sock):
+		"""Return a WaitCondition for readability on ``sock``."""
+		return self.WaitForEvent(sock, self, select.POLLIN)
+
+	def wait_for_writeable(self, sock):
+		"""Return a WaitCondition for writeability on ``sock``."""
+		return self.WaitForEvent(sock, self, select.POLLOUT)
 
-			sock, coro, _interested = self._sockets[event_fd]
-			del self._sockets[event_fd]
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets."""
+		return bool(self._pending)
 
-			self.epoll.ctl(epoll.EPOLL_CTL_DEL, sock.fileno(), 0)
+	def _wait_for_events(self, delay):
+		"""Submit queued requests and wait for completions, returning (token, res) tuples."""
+		return self.ring.submit_and_wait(delay)
+
+	def _handle_events(self, events):
+		"""Resume the coroutine waiting on each completed poll."""
+
+		for token, _res in events:
+			condition = self._pending.pop(token, None)
+			if condition is None:
+				continue
+
+			coro = condition.bound_coro
+			condition.bound_coro = None
+			condition.token = None
 
 			# Yes, we really do want to catch /all/ Exceptions
 			# pylint: disable-msg=W0703
-
 			try:
 				coro.resume(None)
 			except Exception:
 				print "Unhandled exception in TCP event %s:" % (coro, )
 				traceback.print_exc() 
 
-		self._handle_scheduled_events()
-
-		return True
 
 class KqueueReactor(Reactor):
 	"""
 	Reactor using kqueue()/kevent()
+
+	kqueue tracks each (ident, filter) pair separately, so pending waits are keyed the same
+	way, and a socket may have a reader and a writer at once.
 	"""
 
 	def __init__(self):
 		Reactor.__init__(self)
 
 		self.queue = kqueue.Kqueue()
+
+		# (sock, coro) for each pending wait, by (fd, filter).
 		self._sockets = {}
 
 	class WaitForEvent(coroutine.WaitCondition):
 		"""Wait for an event."""
 
+		__slots__ = ("sock", "reactor", "event", "bound_coro")
+
 		def __init__(self, sock, reactor_instance, event):
 			"""
 			Constructor.
@@ -413,23 +1480,18 @@ class KqueueReactor(Reactor):
 		def bind(self, coro):
 			"""Bind to coro, adding the socket to the epoll list."""
 			assert self.bound_coro is None
-			assert self.sock.fileno() not in self.reactor._sockets
-			self.reactor._sockets[self.sock.fileno()] = self.sock, coro
-			self.reactor.queue.change_events((
-				self.sock.fileno(),
-				self.event,
-				kqueue.EV_ADD | kqueue.EV_ONESHOT,
-				0,
-				None,
-				None
-			))
+			key = self.sock.fileno(), self.event
+			assert key not in self.reactor._sockets
+			self.reactor._sockets[key] = self.sock, coro
+			self.reactor._add_event(self.sock.fileno(), self.event)
 			self.bound_coro = coro
 
 		def unbind(self, coro):
 			"""Unbind from coro and remove the socket from the select list."""
 			assert self.bound_coro is coro
-			assert self.sock.fileno() in self.reactor._sockets
-			del self.reactor._sockets[self.sock.fileno()]
+			key = self.sock.fileno(), self.event
+			assert key in self.reactor._sockets
+			del self.reactor._sockets[key]
 			try:
 				self.reactor.queue.change_events((
 					self.sock.fileno(),
@@ -451,6 +1513,25 @@ class KqueueReactor(Reactor):
 		def __repr__(self):
 			return "<KqueueReactor.WaitForEvent: fd %r>" % (self.sock.fileno(), )
 
+	def _add_event(self, fd, event):
+		"""Add a one-shot kevent for ``event`` on ``fd``."""
+		self.queue.change_events((
+			fd,
+			event,
+			kqueue.EV_ADD | kqueue.EV_ONESHOT,
+			0,
+			None,
+			None
+		))
+
+	def after_fork(self):
+		"""Create a new kqueue, which fork() does not inherit, and re-add all pending events."""
+		self.queue = kqueue.Kqueue()
+		for fd, event in self._sockets.keys():
+			self._add_event(fd, event)
+
+		Reactor.after_fork(self)
+
 	def wait_for_readable(self, sock):
 		"""Return a WaitCondition for readability on ``sock``."""
 		return self.WaitForEvent(sock, self, kqueue.EVFILT_READ)
@@ -459,26 +1540,30 @@ class KqueueReactor(Reactor):
 		"""Return a WaitCondition for writeability on ``sock``."""
 		return self.WaitForEvent(sock, self, kqueue.EVFILT_WRITE)
 
-	def _run_once(self):
-		"""Run one iteration of the event handler."""
-
-		delay = self.time_to_next_event()
+	def _has_waiters(self):
+		"""Return True if any coroutines are waiting on sockets."""
+		return bool(self._sockets)
 
-		if delay is None and len(self._sockets) == 0:
-			return False
+	def _wait_for_events(self, delay):
+		"""Call kevent(), returning a list of event tuples."""
 
 		try:
-			events = self.queue.kevent(None, return_count = 10, timeout = delay)
-		except KeyboardInterrupt:
-			# Just return.
-			return False
-
-		for ident, _filter, _flags, _fflags, _data, _udata in events:
-			if ident not in self._sockets:
+			return self.queue.kevent(None, return_count = 10, timeout = delay)
+		except OSError, exc:
+			# Interrupted by a signal; its handler may have queued work.
+			if exc.errno != errno.EINTR:
+				raise
+			return ()
+
+	def _handle_events(self, events):
+		"""Resume the coroutine waiting on each ready socket."""
+
+		for ident, event_filter, _flags, _fflags, _data, _udata in events:
+			key = ident, event_filter
+			if key not in self._sockets:
 				continue
 
-			sock, coro = self._sockets[ident]
-			del self._sockets[ident]
+			sock, coro = self._sockets.pop(key)
 
 			# Yes, we really do want to catch /all/ Exceptions
 			# pylint: disable-msg=W0703
@@ -488,15 +1573,17 @@ class KqueueReactor(Reactor):
 				print "Unhandled exception in TCP event %s:" % (coro, )
 				traceback.print_exc() 
 
-		self._handle_scheduled_events()
-
-		return True
 
-# Attempt to import epoll. If it's not available, forget about EpollReactor.
-# "DefaultReactor" is still a class, not a constant.
+# Attempt to find epoll, preferring the standard library's. If it's not available, forget
+# about EpollReactor. "DefaultReactor" is still a class, not a constant.
 #pylint: disable-msg=C0103
 try:
-	from chiral.os import epoll
+	if hasattr(select, "epoll"):
+		# The select module also provides the EPOLL* constants.
+		epoll, _Epoll = select, select.epoll
+	else:
+		from chiral.os import epoll
+		_Epoll = epoll.Epoll
 	DefaultReactor = EpollReactor
 	del KqueueReactor
 except ImportError:
@@ -506,11 +1593,22 @@ except ImportError:
 		DefaultReactor = KqueueReactor
 	except ImportError:
 		del KqueueReactor
-		DefaultReactor = SelectReactor
+		if hasattr(select, "poll"):
+			DefaultReactor = PollReactor
+		else:
+			del PollReactor
+			DefaultReactor = SelectReactor
+
+# IoUringReactor is experimental, so it's only used if asked for by name.
+if os.environ.get("CHIRAL_REACTOR") == "IoUringReactor" and IoUringReactor.available():
+	DefaultReactor = IoUringReactor
 
 reactor = DefaultReactor()
 
 __all__ = [
+	"WaitForTimer",
+	"WaitForReady",
+	"WaitForFuture",
 	"ConnectionException",
 	"ConnectionClosedException",
 ]
@@ -12,7 +12,7 @@ details and examples.
 # it under the terms of the GNU General Public License as published by
 # the Free Software Foundation, version 2.
 
-from chiral.core import coroutine
+from chiral.core import coroutine, stats
 from chiral.net import reactor
 from chiral.net.netcore import ConnectionException, ConnectionClosedException
 
@@ -40,9 +40,22 @@ elif errno.EAGAIN != errno.EWOULDBLOCK:
 else:
 	_AGAIN = (errno.EAGAIN, )
 
+# Older Pythons lack socket.SO_REUSEPORT; this is its value on Linux.
+_SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", 15)
+_SO_BUSY_POLL = getattr(socket, "SO_BUSY_POLL", 46)
+
 class ConnectionOverflowException(ConnectionException):
 	"""Indicates that an excessive amount of data was received by read_line()."""
 
+# All TCPServers in this process, so that `chiral.net.cluster` can find them after forking.
+# The __reload_update__ magic prevents xreload.xreload() from wiping out the list.
+_SERVERS = weakref.WeakValueDictionary()
+setattr(_SERVERS, "__reload_update__", lambda oldobj: oldobj)
+
+def listening_servers():
+	"""Return a list of the `TCPServer` instances in this process."""
+	return _SERVERS.values()
+
 class TCPConnection(coroutine.Coroutine):
 	"""
 	Provides basic interface for TCP connections.
@@ -78,16 +91,28 @@ class TCPConnection(coroutine.Coroutine):
 		It may be overridden in a derived class.
 		"""
 
-		if exception:
-			if isinstance(exception[0], ConnectionClosedException):
-				return (None, None)
-
 		if self.remote_sock is not None:
 			self.close()
 
+		if exception:
+			if issubclass(exception[0], ConnectionClosedException):
+				return (None, None)
+
 	def close(self):
-		"""Perform a clean shutdown."""
+		"""
+		Perform a clean shutdown.
+
+		If the connection handler has not finished (or, for a client connection, was never
+		started), it is killed, so that it neither waits on the closed socket forever nor
+		keeps the connection alive.
+		"""
+
+		if self.state in (self.STATE_STOPPED, self.STATE_SUSPENDED):
+			self.add_completion_callback(coroutine.swallow_kill)
+			self.kill()
+
 		if self.remote_sock is not None:
+			reactor.unregister(self.remote_sock)
 			self.remote_sock.close()
 			self.remote_sock = None
 
@@ -250,14 +275,17 @@ class TCPConnection(coroutine.Coroutine):
 		"""Helper coroutine created by `sendall` if not all data could be sent."""
 		while data:
 
-			yield reactor.wait_for_readable(self.remote_sock)
+			yield reactor.wait_for_writeable(self.remote_sock)
 
 			try:
 				res = self.remote_sock.send(data)
 			except socket.error, exc:
 				# If the write would block, just loop around and try later.
-				if exc[0] not in _AGAIN:
+				if exc[0] in (errno.EPIPE, errno.EBADF):
+					raise ConnectionClosedException()
+				elif exc[0] not in _AGAIN:
 					raise exc
+				continue
 
 			data = data[res:]
 
@@ -363,6 +391,7 @@ class TCPConnection(coroutine.Coroutine):
 		if not self._may_connect:
 			raise RuntimeError("This TCPConnection may not be reconnected.")
 
+		reactor.unregister(self.remote_sock)
 		self.remote_sock.close()
 		self.remote_sock = socket.socket()
 
@@ -431,29 +460,77 @@ class TCPServer(coroutine.Coroutine):
 
 	The ``connection_class`` attribute sets the class that will be created for
 	new connections; it should be derived from `TCPConnection`.
+
+	If ``reuse_port`` is set, the socket is bound with ``SO_REUSEPORT``. When the process
+	is forked by `chiral.net.cluster`, each worker then listens on its own socket, and
+	the kernel balances incoming connections between them (Linux 3.9+). Otherwise,
+	workers share the inherited listening socket.
 	"""
 
 	connection_class = TCPConnection
 
-	def __init__(self, bind_addr = ('', 80)):
+	def __init__(self, bind_addr = ('', 80), reuse_port = False):
 		"""
 		Constructor.
 
 		:param bind_addr: The address ``(host, port)`` to bind to, as in ``socket.bind``.
+		:param reuse_port: Bind with ``SO_REUSEPORT``; see above.
 		"""
 		self.bind_addr = bind_addr
+		self.reuse_port = reuse_port
 		self.connections = weakref.WeakValueDictionary()
 
-		self.master_socket = socket.socket()
-		self.master_socket.setblocking(0)
-		self.master_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-		self.master_socket.bind(self.bind_addr)
-		self.master_socket.listen(5)
+		self.master_socket = self._listen()
 
 		coroutine.Coroutine.__init__(self, self.acceptor())
 
 		self.add_completion_callback(self.close_callback)
 
+		_SERVERS[id(self)] = self
+
+	def _listen(self):
+		"""Create, bind, and return a new nonblocking listening socket."""
+
+		sock = socket.socket()
+		sock.setblocking(0)
+		sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		if self.reuse_port:
+			sock.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
+		sock.bind(self.bind_addr)
+		sock.listen(128)
+		return sock
+
+	def after_fork(self):
+		"""
+		Prepare the server to run in a newly forked worker process.
+
+		With ``reuse_port``, the inherited listening socket is replaced by a fresh one, bound
+		to the same address, which this process alone accepts from. The new socket takes
+		over the old file descriptor number, so the acceptor can keep waiting on it. This
+		should be called before `Reactor.after_fork`.
+		"""
+
+		if not self.reuse_port:
+			return
+
+		new_socket = self._listen()
+		os.dup2(new_socket.fileno(), self.master_socket.fileno())
+		new_socket.close()
+
+	def stop_listening(self):
+		"""
+		Stop the kernel from queueing new connections on the listening socket.
+
+		The socket stays open, so that worker processes forked later still inherit it. This
+		is used by the `chiral.net.cluster` supervisor with ``reuse_port``, since the workers
+		accept on their own sockets. Listening sockets that do not support this are left as is.
+		"""
+
+		try:
+			self.master_socket.shutdown(socket.SHUT_RD)
+		except socket.error:
+			pass
+
 	def close_callback(self, res, exc):
 		"""Close self.master_socket.
 
@@ -461,6 +538,7 @@ class TCPServer(coroutine.Coroutine):
 		master socket is closed if acceptor() terminates or is killed.
 		"""
 
+		reactor.unregister(self.master_socket)
 		self.master_socket.close()
 
 	def acceptor(self):
@@ -483,12 +561,21 @@ class TCPServer(coroutine.Coroutine):
 				else:
 					break
 
+			if reactor.socket_busy_poll:
+				try:
+					client_socket.setsockopt(socket.SOL_SOCKET, _SO_BUSY_POLL,
+					                         reactor.socket_busy_poll)
+				except socket.error:
+					# Not supported, or not permitted; this is only an optimization.
+					stats.increment("chiral.net.tcp.busy_poll_failed")
+
 			# Create a new TCPConnection for the socket 
 			new_conn = self.connection_class(client_addr, client_socket, self)
 			self.connections[id(new_conn)] = new_conn
 			new_conn.start()
 
 __all__ = [
+	"listening_servers",
 	"TCPServer",
 	"TCPConnection",
 	"ConnectionException",
@@ -8,10 +8,16 @@
 from __future__ import with_statement
 import unittest
 from decorator import decorator
+import errno
 import gc
+import os
+import signal
+import socket
+import thread
+import time
 
-from chiral.core import coroutine
-from chiral.net import tcp, reactor
+from chiral.core import coroutine, threadpool
+from chiral.net import tcp, reactor, monitor, netcore, cluster
 
 from chiral.web.httpd import HTTPServer
 from chiral.web.introspector import Introspector
@@ -28,6 +34,44 @@ class EchoServer(tcp.TCPServer):
 	"""Echo server."""
         connection_class = EchoConnection
 
+class PidConnection(tcp.TCPConnection):
+	"""Reply with the ID of the process that accepted the connection."""
+
+	def connection_handler(self):
+		"""Send the pid"""
+		yield self.sendall("%d\r\n" % (os.getpid(), ))
+
+class PidServer(tcp.TCPServer):
+	"""Server for PidConnection."""
+	connection_class = PidConnection
+
+class SimpleFuture(object):
+	"""Minimal implementation of the Future protocol."""
+
+	def __init__(self):
+		self.callbacks = []
+		self.outcome = None
+
+	def done(self):
+		return self.outcome is not None
+
+	def result(self):
+		value, exc = self.outcome
+		if exc is not None:
+			raise exc
+		return value
+
+	def add_done_callback(self, func):
+		if self.done():
+			func(self)
+		else:
+			self.callbacks.append(func)
+
+	def set_result(self, value, exc=None):
+		self.outcome = value, exc
+		for func in self.callbacks:
+			func(self)
+
 @decorator
 def reactor_test(coro, self):
 	cr = coro(self)
@@ -64,6 +108,536 @@ class TCPTests(unittest.TestCase):
 
 			client.close()
 
+	@reactor_test
+	@coroutine.as_coro
+	def test_no_cyclic_garbage(self):
+		"""Closed connections are freed without the cyclic garbage collector"""
+
+		with EchoServer(bind_addr = ('', 12122)):
+			yield reactor.schedule()
+
+			gc.collect()
+			gc.disable()
+			try:
+				for index in xrange(10000):
+					client = tcp.TCPConnection(remote_addr = ('localhost', 12122))
+					yield client.connect()
+
+					# Every other client hangs up without sending a line, so that the
+					# server's handler fails with ConnectionClosedException.
+					if index % 2:
+						yield client.sendall("hello world\r\n")
+						resp = yield client.read_line()
+						self.assertEqual(resp, "hello world")
+
+					client.close()
+
+				# Let the server notice the last disconnection.
+				yield reactor.schedule(0.01)
+
+				self.assertEqual(gc.collect(), 0)
+			finally:
+				gc.enable()
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_repeated_waits(self):
+		"""Repeated readability waits on one connection"""
+
+		left, right = socket.socketpair()
+		reader = tcp.TCPConnection(None, left)
+		writer = tcp.TCPConnection(None, right)
+
+		@coroutine.as_coro
+		def write_lines():
+			for index in xrange(3):
+				yield reactor.schedule(0.01)
+				yield writer.sendall("line %d\r\n" % index)
+
+		write_lines().start()
+
+		for index in xrange(3):
+			line = yield reader.read_line()
+			self.assertEqual(line, "line %d" % index)
+
+		reader.close()
+		writer.close()
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_duplex(self):
+		"""One coroutine reads while another writes the same connection"""
+
+		left, right = socket.socketpair()
+		local = tcp.TCPConnection(None, left)
+		peer = tcp.TCPConnection(None, right)
+
+		# Large enough that sendall has to wait for the peer to drain the buffer.
+		data = "x" * (4 * 1024 * 1024)
+
+		@coroutine.as_coro
+		def peer_side():
+			received = yield peer.read_exactly(len(data))
+			yield peer.sendall("done\r\n")
+			raise StopIteration(len(received))
+
+		results = yield coroutine.WaitForAll([
+			local.read_line(),
+			local.sendall(data),
+			peer_side()
+		])
+
+		self.assertEqual(results[0], "done")
+		self.assertEqual(results[2], len(data))
+
+		local.close()
+		peer.close()
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_schedule_order(self):
+		"""Scheduled events fire in time order"""
+
+		fired = []
+
+		@coroutine.as_coro
+		def sleeper(delay):
+			yield reactor.schedule(delay)
+			fired.append(delay)
+
+		sleepers = [ sleeper(delay) for delay in (0.03, 0.01, 0.02) ]
+		for coro in sleepers:
+			coro.start()
+
+		for coro in sleepers:
+			yield coro
+
+		self.assertEqual(fired, [ 0.01, 0.02, 0.03 ])
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_schedule_cancel(self):
+		"""Killing a coroutine cancels its scheduled event"""
+
+		fired = []
+
+		@coroutine.as_coro
+		def sleeper():
+			yield reactor.schedule(0.01)
+			fired.append(True)
+
+		victim = sleeper()
+		victim.start()
+		victim.add_completion_callback(coroutine.swallow_kill)
+		victim.kill()
+
+		yield reactor.schedule(0.02)
+		self.assertEqual(fired, [])
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_ready_cancel(self):
+		"""Killing coroutines waiting on ready() leaves the rest of the queue to run"""
+
+		resumed = []
+
+		@coroutine.as_coro
+		def waiter(index):
+			yield reactor.ready()
+			resumed.append(index)
+
+		@coroutine.as_coro
+		def killer():
+			yield reactor.ready()
+			for victim in victims:
+				victim.add_completion_callback(coroutine.swallow_kill)
+				victim.kill()
+
+		killer().start()
+		victims = [ waiter(index) for index in xrange(3) ]
+		for victim in victims:
+			victim.start()
+		waiter(3).start()
+
+		yield reactor.schedule(0.01)
+		self.assertEqual(resumed, [ 3 ])
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_schedule_cancel_from_timer(self):
+		"""A timer callback that cancels most of the heap leaves it compacted and counted"""
+
+		fired = []
+		due = time.time()
+
+		@coroutine.as_coro
+		def sleeper():
+			yield reactor.schedule(callbacktime = due)
+			fired.append(True)
+
+		@coroutine.as_coro
+		def killer():
+			yield reactor.schedule(callbacktime = due)
+			for victim in victims:
+				victim.add_completion_callback(coroutine.swallow_kill)
+				victim.kill()
+
+		killer().start()
+		victims = [ sleeper() for _index in xrange(200) ]
+		for victim in victims:
+			victim.start()
+
+		yield reactor.schedule(0.01)
+
+		self.assertEqual(fired, [])
+		cancelled = len([ entry for entry in reactor._events if entry[2].cancelled ])
+		self.assertEqual(reactor._cancelled_timers, cancelled)
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_call_soon(self):
+		"""call_soon runs calls in order during the next loop"""
+
+		calls = []
+		reactor.call_soon(calls.append, 1)
+		reactor.call_soon(calls.append, 2)
+		self.assertEqual(calls, [])
+
+		yield reactor.ready()
+		self.assertEqual(calls, [ 1, 2 ])
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_call_from_thread(self):
+		"""call_from_thread runs calls made by another thread in the reactor's thread"""
+
+		calls = []
+		done = coroutine.WaitForCallback()
+
+		def record(index):
+			calls.append((index, thread.get_ident()))
+			if index == 99:
+				reactor.remove_thread_waiter()
+				done()
+
+		def worker():
+			for index in xrange(100):
+				reactor.call_from_thread(record, index)
+
+		reactor.add_thread_waiter()
+		thread.start_new_thread(worker, ())
+		yield done
+
+		self.assertEqual([ index for index, _ident in calls ], range(100))
+		self.assertEqual(set(ident for _index, ident in calls), set([ thread.get_ident() ]))
+
+	def test_call_from_thread_unregistered(self):
+		"""call_from_thread without a thread waiter raises, rather than never running"""
+
+		calls = []
+		errors = []
+		lock = thread.allocate_lock()
+		lock.acquire()
+
+		def worker():
+			try:
+				reactor.call_from_thread(calls.append, 1)
+			except RuntimeError, exc:
+				errors.append(exc)
+			lock.release()
+
+		thread.start_new_thread(worker, ())
+		lock.acquire()
+
+		reactor.run()
+		self.assertEqual(calls, [])
+		self.assertEqual(len(errors), 1)
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_run_in_thread(self):
+		"""run_in_thread returns results and exceptions from worker threads"""
+
+		results = yield coroutine.WaitForAll(
+			[ threadpool.run_in_thread(pow, 2, index) for index in xrange(20) ]
+		)
+		self.assertEqual(results, [ 2 ** index for index in xrange(20) ])
+
+		try:
+			yield threadpool.run_in_thread(int, "not a number")
+		except ValueError:
+			pass
+		else:
+			self.fail("exception not raised")
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_wait_for_future(self):
+		"""Futures completed in other threads can be waited on"""
+
+		future = SimpleFuture()
+		thread.start_new_thread(future.set_result, (42, ))
+		result = yield reactor.wait_for_future(future)
+		self.assertEqual(result, 42)
+
+		# Already completed
+		result = yield reactor.wait_for_future(future)
+		self.assertEqual(result, 42)
+
+		future = SimpleFuture()
+		thread.start_new_thread(future.set_result, (None, KeyError("missing")))
+		try:
+			yield reactor.wait_for_future(future)
+		except KeyError:
+			pass
+		else:
+			self.fail("exception not raised")
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_busy_poll(self):
+		"""Busy polling picks up events that arrive while spinning"""
+
+		left, right = socket.socketpair()
+		reader = tcp.TCPConnection(None, left)
+
+		def send_later():
+			time.sleep(0.01)
+			right.send("hello\r\n")
+
+		reactor.set_busy_poll(500000)
+		try:
+			thread.start_new_thread(send_later, ())
+			line = yield reader.read_line()
+		finally:
+			reactor.set_busy_poll(0)
+
+		self.assertEqual(line, "hello")
+		self.assert_(reactor.busy_poll_hits >= 1)
+
+		reader.close()
+		right.close()
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_resume_budget(self):
+		"""A coroutine that never blocks is requeued once it uses up its budget"""
+
+		# The budget only applies inside the reactor loop.
+		yield reactor.ready()
+
+		calls = []
+		reactor.call_soon(calls.append, 1)
+
+		steps = coroutine.Coroutine.RESUME_BUDGET * 3
+		for index in xrange(steps):
+			value = yield coroutine.WaitForNothing(index)
+			self.assertEqual(value, index)
+
+		# The loop must have been allowed to run in the meantime.
+		self.assertEqual(calls, [ 1 ])
+
+		# Exceptions are carried across the requeue too.
+		for _index in xrange(steps):
+			try:
+				yield coroutine.WaitForNothing(exc=(ValueError, ValueError(), None))
+			except ValueError:
+				pass
+			else:
+				self.fail("exception not raised")
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_read_timeout(self):
+		"""with_timeout gives up on a read that never completes"""
+
+		left, right = socket.socketpair()
+		reader = tcp.TCPConnection(None, left)
+
+		try:
+			yield coroutine.with_timeout(reader.read_line(), 0.01)
+		except coroutine.WaitTimeoutException:
+			pass
+		else:
+			self.fail("read_line did not time out")
+
+		reader.close()
+		right.close()
+
+	@reactor_test
+	@coroutine.as_coro
+	def test_after_fork(self):
+		"""Pending waits survive Reactor.after_fork"""
+
+		with EchoServer(bind_addr = ('', 12122)):
+			reactor.after_fork()
+
+			client = tcp.TCPConnection(remote_addr = ('localhost', 12122))
+			yield client.connect()
+			yield client.sendall("hello world\r\n")
+
+			resp = yield client.read_line()
+			self.assertEqual(resp, "hello world")
+
+			client.close()
+
+	def test_cluster(self):
+		"""Cluster workers each accept on a reuse_port listener, and stop on SIGTERM"""
+
+		supervisor = os.fork()
+		if not supervisor:
+			# The supervisor process: never return into the test runner.
+			status = 1
+			try:
+				PidServer(bind_addr = ('', 12123), reuse_port = True).start()
+				cluster.Cluster(workers = 2, shutdown_timeout = 5).run()
+				status = 0
+			finally:
+				os._exit(status)
+
+		def fetch_pid():
+			"""Connect to the cluster and return the pid of the worker that answered."""
+			client = socket.create_connection(('localhost', 12123), 5)
+			try:
+				return int(client.makefile().readline())
+			finally:
+				client.close()
+
+		try:
+			pids = set()
+			deadline = time.time() + 10
+			while len(pids) < 2 and time.time() < deadline:
+				try:
+					pids.add(fetch_pid())
+				except socket.error, exc:
+					# The workers may not be listening yet, or the connection may have
+					# reached the supervisor's socket before it stopped listening.
+					if exc.errno not in (errno.ECONNREFUSED, errno.ECONNRESET):
+						raise
+					time.sleep(0.05)
+
+			self.assertEqual(len(pids), 2)
+			self.failIf(supervisor in pids)
+		finally:
+			os.kill(supervisor, signal.SIGTERM)
+
+			deadline = time.time() + 10
+			while True:
+				pid, status = os.waitpid(supervisor, os.WNOHANG)
+				if pid or time.time() > deadline:
+					break
+				time.sleep(0.05)
+
+		self.assertEqual(pid, supervisor)
+		self.assertEqual(status, 0)
+		self.assertRaises(socket.error, fetch_pid)
+
+	def check_reactor(self, reactor_instance, during_wait=None):
+		"""
+		Run a readable/writeable/timer round trip on reactor_instance, with one fd waiting for
+		both directions at once. during_wait, if given, is called while both waits are bound.
+		"""
+
+		left, right = socket.socketpair()
+		log = []
+
+		@coroutine.as_coro
+		def reader():
+			yield reactor_instance.wait_for_readable(left)
+			log.append(("read", left.recv(16)))
+
+		@coroutine.as_coro
+		def writer():
+			yield reactor_instance.wait_for_writeable(left)
+			log.append("writeable")
+			yield reactor_instance.schedule(0.01)
+			log.append("timer")
+			right.send("hello")
+
+		reader().start()
+		writer().start()
+		if during_wait is not None:
+			during_wait(left.fileno())
+
+		reactor_instance.run()
+
+		self.assertEqual(log, [ "writeable", "timer", ("read", "hello") ])
+		left.close()
+		right.close()
+
+	def test_select_reactor(self):
+		"""SelectReactor round trip"""
+		self.check_reactor(netcore.SelectReactor())
+
+	def test_poll_reactor(self):
+		"""PollReactor round trip, polling one fd for both directions"""
+
+		if not hasattr(netcore, "PollReactor"):
+			self.skipTest("poll() is not available")
+
+		poll_reactor = netcore.PollReactor()
+
+		def both_registered(fd):
+			self.assert_(fd in poll_reactor._readers)
+			self.assert_(fd in poll_reactor._writers)
+
+		self.check_reactor(poll_reactor, both_registered)
+		self.assertEqual((poll_reactor._readers, poll_reactor._writers), ({}, {}))
+
+	def test_epoll_reactor(self):
+		"""EpollReactor round trip"""
+
+		if not hasattr(netcore, "EpollReactor"):
+			self.skipTest("epoll is not available")
+
+		self.check_reactor(netcore.EpollReactor())
+
+	def test_io_uring_reactor(self):
+		"""IoUringReactor resumes waits when their polls complete, and ignores cancelled ones"""
+
+		if not netcore.IoUringReactor.available():
+			self.skipTest("io_uring is not available")
+
+		uring = netcore.IoUringReactor()
+		left, right = socket.socketpair()
+		received = []
+
+		@coroutine.as_coro
+		def reader():
+			yield uring.wait_for_readable(left)
+			received.append(left.recv(16))
+
+		victim = reader()
+		victim.start()
+		victim.add_completion_callback(coroutine.swallow_kill)
+		victim.kill()
+
+		reader().start()
+		right.send("hello")
+		uring.run()
+
+		self.assertEqual(received, [ "hello" ])
+		uring.ring.close()
+
+	def test_monitor_watchdog(self):
+		"""Loop monitor records iterations and reports a blocked loop"""
+
+		@coroutine.as_coro
+		def blocking_sleeper():
+			yield reactor.ready()
+			time.sleep(0.2)
+
+		loop_monitor = monitor.enable(watchdog_threshold = 0.05)
+		try:
+			blocking_sleeper().start()
+			reactor.run()
+		finally:
+			monitor.disable()
+
+		self.assert_(loop_monitor.iterations > 0)
+		self.assertEqual(len(loop_monitor.reports), 1)
+		self.assert_("blocking_sleeper" in loop_monitor.reports[0])
+
 #HTTPServer(bind_addr = ('', 8081), application = Introspector()).start()
 
 if __name__ == "__main__":
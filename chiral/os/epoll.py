@@ -1,5 +1,9 @@
 """
 epoll() wrapper using ctypes
+
+This is only needed on Pythons older than 2.6, whose ``select`` module lacks ``epoll``. Besides
+the low-level `Epoll.ctl` and `Epoll.wait`, `Epoll` provides the ``register``, ``modify``,
+``unregister`` and ``poll`` methods of ``select.epoll``, so the two may be used interchangeably.
 """
 
 # Chiral, copyright (c) 2007 Jacob Potter
@@ -10,29 +14,70 @@ epoll() wrapper using ctypes
 import ctypes
 from ctypes.util import find_library
 import os
+import platform
+
+try:
+	libc = ctypes.CDLL(find_library("c"), use_errno=True)
+	_get_errno = ctypes.get_errno
+except TypeError:
+	# Python 2.5's ctypes has no use_errno. Fall back to the global errno, which
+	# is only correct when a single thread makes system calls through libc.
+	try:
+		libc = ctypes.CDLL(find_library("c"))
+	except TypeError:
+		raise ImportError("epoll not available on this system")
+	_get_errno = lambda: ctypes.c_int.in_dll(libc, "errno").value
 
 try:
-	libc = ctypes.CDLL(find_library("c"))
 	getattr(libc, "epoll_create")
-except (AttributeError, TypeError):
+except AttributeError:
 	raise ImportError("epoll not available on this system")
 
 class _epoll_data(ctypes.Union):
 	"""union epoll_data"""
 	_fields_ = [
 		("ptr", ctypes.c_void_p),
-		("fd", ctypes.c_ulong),
+		("fd", ctypes.c_int),
 		("u32", ctypes.c_uint32),
 		("u64", ctypes.c_uint64)
 	]
 
 class _epoll_event(ctypes.Structure):
 	"""struct epoll_event"""
+
+	# sys/epoll.h declares the struct packed on x86-64, so that its layout
+	# matches 32-bit userspace.
+	if platform.machine() in ("x86_64", "amd64"):
+		_pack_ = 1
+
 	_fields_ = [
-		("events", ctypes.c_ulong),
+		("events", ctypes.c_uint32),
 		("data", _epoll_data)
 	]
 
+# From sys/epoll.h
+EPOLLIN = 0x001
+EPOLLPRI = 0x002
+EPOLLOUT = 0x004
+EPOLLRDNORM = 0x040
+EPOLLRDBAND = 0x080
+EPOLLWRNORM = 0x100
+EPOLLWRBAND = 0x200
+EPOLLMSG = 0x400
+EPOLLERR = 0x008
+EPOLLHUP = 0x010
+EPOLLONESHOT = (1 << 30)
+EPOLLET = (1 << 31)
+
+EPOLL_CTL_ADD = 1
+EPOLL_CTL_DEL = 2
+EPOLL_CTL_MOD = 3
+
+def _raise_errno():
+	"""Raise an OSError for the current value of errno."""
+	err = _get_errno()
+	raise OSError(err, os.strerror(err))
+
 class Epoll(object):
 	"""Wrapper around Linux's epoll() system calls."""
 
@@ -40,12 +85,30 @@ class Epoll(object):
 		"""Constructor."""
 
 		self.epoll_fd = libc.epoll_create(size)
+		if self.epoll_fd < 0:
+			_raise_errno()
+
+		# The event buffer is kept between calls to wait(), and only reallocated
+		# when a larger return_count is requested.
+		self._event_buffer = (_epoll_event * 0)()
+
+	def fileno(self):
+		"""Return the epoll file descriptor."""
+		return self.epoll_fd
+
+	def close(self):
+		"""Close the epoll file descriptor."""
+		if self.epoll_fd >= 0:
+			os.close(self.epoll_fd)
+			self.epoll_fd = -1
 
 	def ctl(self, op, fd, events):
 		"""Modify the given event.
 
 		op, fd, and events are as per the epoll_ctl(2) man page. The epoll_data union
 		stores the file descriptor number; it is not available for user data.
+
+		Raises OSError if the system call fails.
 		"""
 
 		event = _epoll_event(
@@ -53,8 +116,10 @@ class Epoll(object):
 			_epoll_data(fd = int(fd))
 		)
 
-		libc.epoll_ctl(self.epoll_fd, int(op), int(fd), ctypes.byref(event))
+		ret = libc.epoll_ctl(self.epoll_fd, int(op), int(fd), ctypes.byref(event))
 
+		if ret < 0:
+			_raise_errno()
 
 	def wait(self, return_count = 10, timeout = None):
 		"""
@@ -72,7 +137,9 @@ class Epoll(object):
 				timeout = 0
 			timeout = int(timeout * 1000)
 
-		event_buffer = (_epoll_event * return_count)()
+		event_buffer = self._event_buffer
+		if len(event_buffer) < return_count:
+			event_buffer = self._event_buffer = (_epoll_event * return_count)()
 
 		ret = libc.epoll_wait(
 			self.epoll_fd,
@@ -82,8 +149,7 @@ class Epoll(object):
 		)
 
 		if ret < 0:
-			err = ctypes.c_int.in_dll(libc, "errno").value
-			raise OSError(err, os.strerror(err))
+			_raise_errno()
 
 		output = []
 
@@ -96,27 +162,38 @@ class Epoll(object):
 
 		return output
 
+	# select.epoll-compatible interface
 
-# From sys/epoll.h
-EPOLLIN = 0x001
-EPOLLPRI = 0x002
-EPOLLOUT = 0x004
-EPOLLRDNORM = 0x040
-EPOLLRDBAND = 0x080
-EPOLLWRNORM = 0x100
-EPOLLWRBAND = 0x200
-EPOLLMSG = 0x400
-EPOLLERR = 0x008
-EPOLLHUP = 0x010
-EPOLLONESHOT = (1 << 30)
-EPOLLET = (1 << 31)
+	def register(self, fd, eventmask = EPOLLIN | EPOLLPRI | EPOLLOUT):
+		"""Add fd to the epoll set, as ``select.epoll.register``."""
+		self.ctl(EPOLL_CTL_ADD, fd, eventmask)
+
+	def modify(self, fd, eventmask):
+		"""Change the events registered for fd, as ``select.epoll.modify``."""
+		self.ctl(EPOLL_CTL_MOD, fd, eventmask)
+
+	def unregister(self, fd):
+		"""Remove fd from the epoll set, as ``select.epoll.unregister``."""
+		self.ctl(EPOLL_CTL_DEL, fd, 0)
+
+	def poll(self, timeout = -1, maxevents = -1):
+		"""
+		Wait for events, as ``select.epoll.poll``.
+
+		Returns a list of (fd, events) tuples. A negative timeout waits indefinitely.
+		"""
+
+		if maxevents < 0:
+			maxevents = max(len(self._event_buffer), 64)
+
+		if timeout is not None and timeout < 0:
+			timeout = None
+
+		return [ (fd, events) for events, fd in self.wait(maxevents, timeout) ]
 
-EPOLL_CTL_ADD = 1
-EPOLL_CTL_DEL = 2
-EPOLL_CTL_MOD = 3
 
 __all__ = [
-	"Epoll"
+	"Epoll",
 	"EPOLLIN", "EPOLLPRI", "EPOLLOUT", "EPOLLRDNORM", "EPOLLRDBAND",
 	"EPOLLWRNORM", "EPOLLWRBAND", "EPOLLMSG", "EPOLLERR", "EPOLLHUP",
 	"EPOLLONESHOT", "EPOLLET",
@@ -0,0 +1,87 @@
+"""
+eventfd() wrapper using ctypes
+
+An eventfd is a counter kept by the kernel, with a file descriptor that is readable whenever
+the counter is nonzero. Writing to it adds to the counter, and reading returns the counter and
+resets it to zero, so any number of writes made before the descriptor is read are consumed
+by a single ``read()``. `chiral.net.netcore` uses it to wake the reactor from other threads.
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+import ctypes
+import errno
+import fcntl
+import os
+import struct
+
+# This is imported from inside the reactor loop, the first time another thread needs to wake
+# it, so don't use ctypes.util.find_library: it runs ldconfig or the C compiler in a
+# subprocess. The C library is already loaded into the interpreter, so look symbols up there.
+try:
+	libc = ctypes.CDLL(None, use_errno=True)
+	_get_errno = ctypes.get_errno
+except TypeError:
+	# Python 2.5's ctypes has no use_errno; see chiral.os.epoll.
+	libc = ctypes.CDLL(None)
+	_get_errno = lambda: ctypes.c_int.in_dll(libc, "errno").value
+
+try:
+	getattr(libc, "eventfd")
+except AttributeError:
+	raise ImportError("eventfd not available on this system")
+
+# From sys/eventfd.h
+EFD_CLOEXEC = 02000000
+EFD_NONBLOCK = 04000
+
+_COUNTER = struct.Struct("=Q")
+
+class EventFD(object):
+	"""A nonblocking eventfd."""
+
+	def __init__(self, initval = 0):
+		"""Constructor."""
+
+		self.fd = libc.eventfd(initval, EFD_NONBLOCK | EFD_CLOEXEC)
+		if self.fd < 0 and _get_errno() == errno.EINVAL:
+			# Kernels before 2.6.27 accept no flags; set them with fcntl() instead.
+			self.fd = libc.eventfd(initval, 0)
+			if self.fd >= 0:
+				fcntl.fcntl(self.fd, fcntl.F_SETFL, os.O_NONBLOCK)
+				fcntl.fcntl(self.fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+
+		if self.fd < 0:
+			err = _get_errno()
+			raise OSError(err, os.strerror(err))
+
+	def fileno(self):
+		"""Return the file descriptor."""
+		return self.fd
+
+	def write(self, value = 1):
+		"""Add ``value`` to the counter."""
+		try:
+			os.write(self.fd, _COUNTER.pack(value))
+		except OSError, exc:
+			# The counter is about to overflow, so the fd is readable anyway.
+			if exc.errno != errno.EAGAIN:
+				raise
+
+	def read(self):
+		"""Return the counter and reset it to zero. Returns 0 if it was already zero."""
+		try:
+			return _COUNTER.unpack(os.read(self.fd, _COUNTER.size))[0]
+		except OSError, exc:
+			if exc.errno != errno.EAGAIN:
+				raise
+			return 0
+
+	def close(self):
+		"""Close the file descriptor."""
+		if self.fd >= 0:
+			os.close(self.fd)
+			self.fd = -1
@@ -0,0 +1,349 @@
+"""
+io_uring wrapper using ctypes
+
+This is the minimal subset of io_uring needed by `chiral.net.netcore.IoUringReactor`: one-shot
+poll requests and their removal. Requests are written straight into the submission ring shared
+with the kernel, so queueing one costs no system call; `IoUring.submit_and_wait` then submits
+the whole batch and waits for completions in a single ``io_uring_enter()``.
+
+Ring updates rely on the store ordering of x86, and this module should be considered
+experimental. `available` returns False if the kernel lacks io_uring, or does not support
+waiting with a timeout (Linux 5.11 and later).
+"""
+
+# Chiral, copyright (c) 2007 Jacob Potter
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 2.
+
+import ctypes
+from ctypes.util import find_library
+import errno
+import mmap
+import os
+import platform
+import struct
+
+try:
+	libc = ctypes.CDLL(find_library("c"), use_errno=True)
+	_get_errno = ctypes.get_errno
+	_syscall = libc.syscall
+except (TypeError, AttributeError):
+	raise ImportError("io_uring not available on this system")
+
+_syscall.restype = ctypes.c_long
+
+if platform.system() != "Linux" or platform.machine() not in ("x86_64", "amd64"):
+	raise ImportError("io_uring not available on this system")
+
+# From asm/unistd_64.h
+_SYS_IO_URING_SETUP = 425
+_SYS_IO_URING_ENTER = 426
+
+class _io_sqring_offsets(ctypes.Structure):
+	"""struct io_sqring_offsets"""
+	_fields_ = [
+		("head", ctypes.c_uint32),
+		("tail", ctypes.c_uint32),
+		("ring_mask", ctypes.c_uint32),
+		("ring_entries", ctypes.c_uint32),
+		("flags", ctypes.c_uint32),
+		("dropped", ctypes.c_uint32),
+		("array", ctypes.c_uint32),
+		("resv1", ctypes.c_uint32),
+		("user_addr", ctypes.c_uint64)
+	]
+
+class _io_cqring_offsets(ctypes.Structure):
+	"""struct io_cqring_offsets"""
+	_fields_ = [
+		("head", ctypes.c_uint32),
+		("tail", ctypes.c_uint32),
+		("ring_mask", ctypes.c_uint32),
+		("ring_entries", ctypes.c_uint32),
+		("overflow", ctypes.c_uint32),
+		("cqes", ctypes.c_uint32),
+		("flags", ctypes.c_uint32),
+		("resv1", ctypes.c_uint32),
+		("user_addr", ctypes.c_uint64)
+	]
+
+class _io_uring_params(ctypes.Structure):
+	"""struct io_uring_params"""
+	_fields_ = [
+		("sq_entries", ctypes.c_uint32),
+		("cq_entries", ctypes.c_uint32),
+		("flags", ctypes.c_uint32),
+		("sq_thread_cpu", ctypes.c_uint32),
+		("sq_thread_idle", ctypes.c_uint32),
+		("features", ctypes.c_uint32),
+		("wq_fd", ctypes.c_uint32),
+		("resv", ctypes.c_uint32 * 3),
+		("sq_off", _io_sqring_offsets),
+		("cq_off", _io_cqring_offsets)
+	]
+
+class _io_uring_sqe(ctypes.Structure):
+	"""struct io_uring_sqe, with the unions flattened to the members used here"""
+	_fields_ = [
+		("opcode", ctypes.c_uint8),
+		("flags", ctypes.c_uint8),
+		("ioprio", ctypes.c_uint16),
+		("fd", ctypes.c_int32),
+		("off", ctypes.c_uint64),
+		("addr", ctypes.c_uint64),
+		("len", ctypes.c_uint32),
+		("op_flags", ctypes.c_uint32),
+		("user_data", ctypes.c_uint64),
+		("pad", ctypes.c_uint64 * 3)
+	]
+
+class _io_uring_cqe(ctypes.Structure):
+	"""struct io_uring_cqe"""
+	_fields_ = [
+		("user_data", ctypes.c_uint64),
+		("res", ctypes.c_int32),
+		("flags", ctypes.c_uint32)
+	]
+
+# Submission and completion queue entries are packed and unpacked with struct, which is much
+# faster than filling in ctypes structures field by field.
+_SQE = struct.Struct("=BBHiQQIIQ24x")
+_CQE = struct.Struct("=QiI")
+assert _SQE.size == ctypes.sizeof(_io_uring_sqe) and _CQE.size == ctypes.sizeof(_io_uring_cqe)
+
+class _kernel_timespec(ctypes.Structure):
+	"""struct __kernel_timespec"""
+	_fields_ = [
+		("tv_sec", ctypes.c_int64),
+		("tv_nsec", ctypes.c_int64)
+	]
+
+class _io_uring_getevents_arg(ctypes.Structure):
+	"""struct io_uring_getevents_arg"""
+	_fields_ = [
+		("sigmask", ctypes.c_uint64),
+		("sigmask_sz", ctypes.c_uint32),
+		("pad", ctypes.c_uint32),
+		("ts", ctypes.c_uint64)
+	]
+
+# From linux/io_uring.h
+IORING_OP_NOP = 0
+IORING_OP_POLL_ADD = 6
+IORING_OP_POLL_REMOVE = 7
+
+IORING_ENTER_GETEVENTS = 1 << 0
+IORING_ENTER_EXT_ARG = 1 << 3
+
+IORING_SQ_CQ_OVERFLOW = 1 << 1
+
+IORING_FEAT_NODROP = 1 << 1
+IORING_FEAT_EXT_ARG = 1 << 8
+
+IORING_OFF_SQ_RING = 0
+IORING_OFF_CQ_RING = 0x8000000
+IORING_OFF_SQES = 0x10000000
+
+# Poll event masks, from poll.h
+POLLIN = 0x001
+POLLOUT = 0x004
+POLLERR = 0x008
+POLLHUP = 0x010
+
+def _raise_errno():
+	"""Raise an OSError for the current value of errno."""
+	err = _get_errno()
+	raise OSError(err, os.strerror(err))
+
+
+class IoUring(object):
+	"""An io_uring instance, with its submission and completion rings mapped."""
+
+	def __init__(self, entries = 256):
+		"""Constructor. Raises OSError if the ring cannot be set up."""
+
+		params = _io_uring_params()
+		self.ring_fd = _syscall(ctypes.c_long(_SYS_IO_URING_SETUP), ctypes.c_long(entries),
+		                        ctypes.byref(params))
+		if self.ring_fd < 0:
+			_raise_errno()
+
+		self.features = params.features
+		self._maps = []
+
+		try:
+			if not self.features & IORING_FEAT_EXT_ARG:
+				raise OSError(errno.ENOSYS, "io_uring_enter() does not support timeouts")
+
+			sq_off, cq_off = params.sq_off, params.cq_off
+
+			sq_ring = self._map(sq_off.array + params.sq_entries * 4, IORING_OFF_SQ_RING)
+			cq_ring = self._map(cq_off.cqes + params.cq_entries * _CQE.size, IORING_OFF_CQ_RING)
+			self._sqe_map = self._map(params.sq_entries * _SQE.size, IORING_OFF_SQES)
+		except:
+			self.close()
+			raise
+
+		sq_base = ctypes.addressof(ctypes.c_char.from_buffer(sq_ring))
+		cq_base = ctypes.addressof(ctypes.c_char.from_buffer(cq_ring))
+
+		self.sq_entries = params.sq_entries
+		self._sq_head = ctypes.c_uint32.from_address(sq_base + sq_off.head)
+		self._sq_tail = ctypes.c_uint32.from_address(sq_base + sq_off.tail)
+		self._sq_mask = ctypes.c_uint32.from_address(sq_base + sq_off.ring_mask).value
+		self._sq_flags = ctypes.c_uint32.from_address(sq_base + sq_off.flags)
+
+		# Submission slot i always holds SQE i, so the index array is only filled in once.
+		sq_array = (ctypes.c_uint32 * params.sq_entries).from_address(sq_base + sq_off.array)
+		for index in xrange(params.sq_entries):
+			sq_array[index] = index
+
+		self._cq_head = ctypes.c_uint32.from_address(cq_base + cq_off.head)
+		self._cq_tail = ctypes.c_uint32.from_address(cq_base + cq_off.tail)
+		self._cq_mask = ctypes.c_uint32.from_address(cq_base + cq_off.ring_mask).value
+		self._cq_map = cq_ring
+		self._cqes_offset = cq_off.cqes
+
+		# Our copy of the submission tail; it's published to the kernel on submission.
+		self._tail = self._sq_tail.value
+
+		self._timespec = _kernel_timespec()
+		self._getevents_arg = _io_uring_getevents_arg()
+
+	def _map(self, length, offset):
+		"""Map part of the ring into memory."""
+		mapping = mmap.mmap(self.ring_fd, length, mmap.MAP_SHARED,
+		                    mmap.PROT_READ | mmap.PROT_WRITE, offset = offset)
+		self._maps.append(mapping)
+		return mapping
+
+	def fileno(self):
+		"""Return the io_uring file descriptor."""
+		return self.ring_fd
+
+	def close(self):
+		"""Unmap the rings and close the file descriptor."""
+
+		# Drop the ctypes views into the mappings before unmapping them.
+		self._sq_head = self._sq_tail = self._sq_flags = self._cq_head = self._cq_tail = None
+		for mapping in self._maps:
+			mapping.close()
+		self._maps = []
+
+		if self.ring_fd >= 0:
+			os.close(self.ring_fd)
+			self.ring_fd = -1
+
+	@property
+	def pending_submissions(self):
+		"""The number of queued requests that have not been submitted yet."""
+		return (self._tail - self._sq_head.value) & 0xffffffff
+
+	def _queue(self, opcode, fd, addr, op_flags, user_data):
+		"""Write a submission queue entry, submitting the queue first if it's full."""
+
+		if self.pending_submissions >= self.sq_entries:
+			self.submit()
+
+		_SQE.pack_into(self._sqe_map, (self._tail & self._sq_mask) * _SQE.size,
+		               opcode, 0, 0, fd, 0, addr, 0, op_flags, user_data)
+		self._tail = (self._tail + 1) & 0xffffffff
+
+	def poll_add(self, fd, events, user_data):
+		"""Queue a one-shot poll for ``events`` on ``fd``."""
+		self._queue(IORING_OP_POLL_ADD, fd, 0, events, user_data)
+
+	def poll_remove(self, target, user_data = 0):
+		"""Queue the cancellation of the poll request whose user_data is ``target``."""
+		self._queue(IORING_OP_POLL_REMOVE, -1, target, 0, user_data)
+
+	def submit(self):
+		"""Submit all queued requests without waiting for completions."""
+		self._enter(0)
+
+	def submit_and_wait(self, timeout = None):
+		"""
+		Submit all queued requests, and wait for at least one completion.
+
+		A timeout of None waits indefinitely, and a timeout of 0 doesn't wait at all.
+		Returns a list of (user_data, res) tuples, which may be empty if the timeout expired
+		or a signal was received.
+		"""
+
+		self._enter(timeout)
+		return self.reap()
+
+	def _enter(self, timeout):
+		"""Publish the submission tail, and call io_uring_enter() if there's anything to do."""
+
+		self._sq_tail.value = self._tail
+		to_submit = self.pending_submissions
+
+		arg = self._getevents_arg
+		if timeout is None:
+			arg.ts = 0
+		else:
+			timeout = max(timeout, 0)
+			self._timespec.tv_sec = int(timeout)
+			self._timespec.tv_nsec = int((timeout - int(timeout)) * 1e9)
+			arg.ts = ctypes.addressof(self._timespec)
+
+		# Don't block if there are completions to return already.
+		if timeout == 0 or self._cq_head.value != self._cq_tail.value:
+			min_complete = 0
+		else:
+			min_complete = 1
+
+		# Completions that didn't fit in the ring are only moved into it by io_uring_enter().
+		if to_submit or min_complete or self._sq_flags.value & IORING_SQ_CQ_OVERFLOW:
+			ret = _syscall(ctypes.c_long(_SYS_IO_URING_ENTER), ctypes.c_long(self.ring_fd),
+			               ctypes.c_long(to_submit), ctypes.c_long(min_complete),
+			               ctypes.c_long(IORING_ENTER_GETEVENTS | IORING_ENTER_EXT_ARG),
+			               ctypes.byref(arg), ctypes.c_long(ctypes.sizeof(arg)))
+			if ret < 0 and _get_errno() not in (errno.ETIME, errno.EINTR):
+				_raise_errno()
+
+	def reap(self):
+		"""Return and consume all available completions, as (user_data, res) tuples."""
+
+		head = self._cq_head.value
+		tail = self._cq_tail.value
+		if head == tail:
+			return []
+
+		cq_map, mask, offset = self._cq_map, self._cq_mask, self._cqes_offset
+		unpack_from, size = _CQE.unpack_from, _CQE.size
+		output = []
+		while head != tail:
+			user_data, res, _flags = unpack_from(cq_map, offset + (head & mask) * size)
+			output.append((user_data, res))
+			head = (head + 1) & 0xffffffff
+
+		self._cq_head.value = head
+		return output
+
+
+_AVAILABLE = None
+
+def available():
+	"""Return True if the running kernel supports the io_uring features used here."""
+
+	global _AVAILABLE #pylint: disable-msg=W0603
+
+	if _AVAILABLE is None:
+		try:
+			IoUring(2).close()
+			_AVAILABLE = True
+		except (OSError, EnvironmentError, ValueError, TypeError):
+			_AVAILABLE = False
+
+	return _AVAILABLE
+
+
+__all__ = [
+	"IoUring",
+	"available",
+	"IORING_OP_NOP", "IORING_OP_POLL_ADD", "IORING_OP_POLL_REMOVE",
+	"POLLIN", "POLLOUT", "POLLERR", "POLLHUP"
+]
@@ -193,14 +193,14 @@ class HTTPConnection(tcp.TCPConnection):
 		This swallows all ConnectionClosedException and socket.error exceptions.
 		"""
 
+		if self.remote_sock is not None:
+			self.close()
+
 		if exception:
 			exc_type = exception[0]
 			if exc_type in (tcp.ConnectionClosedException, socket.error):
 				return (None, None)
 
-		if self.remote_sock is not None:
-			self.close()
-
 
 	def connection_handler(self):
 		"""The main request processing loop."""
@@ -446,13 +446,14 @@ class HTTPConnection(tcp.TCPConnection):
 class HTTPServer(tcp.TCPServer):
 	"""An HTTP server, based on chiral.net.tcp.TCPServer."""
 	connection_class = HTTPConnection
-	def __init__(self, bind_addr, application):
+	def __init__(self, bind_addr, application, reuse_port = False):
 		"""
 		Constructor.
 
 		:param bind_addr: The address ``(host, port)`` to bind to, as in ``socket.bind``.
 		:param application: A WSGI-compliant application callable.
+		:param reuse_port: Bind with ``SO_REUSEPORT``; see `tcp.TCPServer`.
 		"""
 
 		self.application = application
-		tcp.TCPServer.__init__(self, bind_addr)
+		tcp.TCPServer.__init__(self, bind_addr, reuse_port)
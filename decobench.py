@@ -0,0 +1,72 @@
+#!/usr/bin/env python2.5
+
+"""
+Measure the per-call overhead of the `as_coro` and `returns_waitcondition` decorators.
+
+Each figure is the time for one call of a decorated trivial function, and the difference from
+calling the undecorated function; for `as_coro`, that includes constructing the Coroutine.
+If the ``decorator`` package is installed, wrappers built with it, as these decorators once
+were, are measured for comparison.
+
+	python decobench.py [calls]
+"""
+
+import sys
+import timeit
+
+from chiral.core import coroutine
+
+CALL_COUNT = 500000
+if len(sys.argv) > 1:
+	CALL_COUNT = int(sys.argv[1])
+
+def gen_function(value):
+	"""Trivial generator function."""
+	yield value
+
+WAIT = coroutine.WaitForNothing()
+
+def wc_function(value):
+	"""Trivial function returning a WaitCondition."""
+	return WAIT
+
+functions = [
+	("plain generator function", gen_function, None),
+	("Coroutine(gen_function(...))", lambda value: coroutine.Coroutine(gen_function(value)), None),
+	("as_coro", coroutine.as_coro(gen_function), gen_function),
+	("returns_waitcondition", coroutine.returns_waitcondition(wc_function), wc_function),
+	("  with checking enabled", coroutine._check_waitcondition(wc_function), wc_function),
+]
+
+try:
+	from decorator import decorator
+except ImportError:
+	pass
+else:
+	@decorator
+	def old_as_coro(gen, *args, **kwargs):
+		return coroutine.Coroutine(gen(*args, **kwargs))
+
+	@decorator
+	def old_check_waitcondition(func, *args, **kwargs):
+		ret = func(*args, **kwargs)
+		if ret is not None and not isinstance(ret, coroutine.WaitCondition):
+			raise TypeError("%s should return a WaitCondition instance; got %s" % (func, ret))
+		return ret
+
+	functions.extend([
+		("as_coro (decorator package)", old_as_coro(gen_function), gen_function),
+		("returns_waitcondition (decorator package)", old_check_waitcondition(wc_function), wc_function),
+	])
+
+def per_call(func):
+	"""Return the time, in microseconds, of one call to func."""
+	return min(timeit.Timer(lambda: func(1)).repeat(3, CALL_COUNT)) * 1e6 / CALL_COUNT
+
+for name, func, undecorated in functions:
+	elapsed = per_call(func)
+	if undecorated is None:
+		print "%-42s %6.3f us/call" % (name, elapsed)
+	else:
+		print "%-42s %6.3f us/call, %6.3f us overhead" % (
+			name, elapsed, elapsed - per_call(undecorated))
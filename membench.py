@@ -0,0 +1,84 @@
+#!/usr/bin/env python2.5
+
+"""
+Measure the memory used by each idle TCP connection.
+
+Each connection is a TCPConnection on one end of a socketpair, suspended in ``read_line()``
+waiting for data, as a keep-alive HTTP connection would be. The reported figure is the growth
+in resident memory divided by the number of connections, and so includes the socket objects
+and kernel-independent buffers as well as the coroutine and wait condition objects.
+
+	python membench.py [connections]
+"""
+
+import gc
+import os
+import resource
+import socket
+import sys
+
+from chiral.net import tcp
+
+CONNECTION_COUNT = 20000
+if len(sys.argv) > 1:
+	CONNECTION_COUNT = int(sys.argv[1])
+
+class IdleConnection(tcp.TCPConnection):
+	"""Connection that waits for a line which never arrives."""
+
+	def connection_handler(self):
+		"""Wait for one line."""
+		yield self.read_line()
+
+def resident_bytes():
+	"""Return the resident set size of this process."""
+	statm = open("/proc/self/statm").read().split()
+	return int(statm[1]) * resource.getpagesize()
+
+WARMUP_COUNT = 100
+
+# Each connection needs two descriptors.
+soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+needed = (WARMUP_COUNT + CONNECTION_COUNT) * 2 + 64
+if soft < needed:
+	if hard != resource.RLIM_INFINITY and hard < needed:
+		CONNECTION_COUNT = (hard - 64) // 2 - WARMUP_COUNT
+		needed = hard
+	resource.setrlimit(resource.RLIMIT_NOFILE, (needed, hard))
+
+def open_connections(count):
+	"""Open ``count`` idle connections, returning them and their peer sockets."""
+	peers = []
+	connections = []
+	for _index in xrange(count):
+		left, right = socket.socketpair()
+		conn = IdleConnection(None, left)
+		conn.start()
+		connections.append(conn)
+		peers.append(right)
+	return connections, peers
+
+# Warm up allocator pools and caches before measuring.
+warmup = open_connections(WARMUP_COUNT)
+
+gc.collect()
+before = resident_bytes()
+
+connections, peers = open_connections(CONNECTION_COUNT)
+
+gc.collect()
+after = resident_bytes()
+
+print "%d idle connections: %.0f bytes per connection" % (
+	CONNECTION_COUNT, float(after - before) / CONNECTION_COUNT)
+
+if hasattr(sys, "getsizeof"):
+	conn = connections[0]
+	objects = [ ("connection", conn), ("wait condition", conn.wait_condition) ]
+	if hasattr(conn.wait_condition, "wait_condition"):
+		objects.append(("nested wait condition", conn.wait_condition.wait_condition))
+	for label, obj in objects:
+		size = sys.getsizeof(obj)
+		if hasattr(obj, "__dict__"):
+			size += sys.getsizeof(obj.__dict__)
+		print "  %-24s %-28s %5d bytes" % (label, obj.__class__.__name__, size)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python2.5
+
+"""
+Measure the overhead of calling a coroutine helper from another coroutine.
+
+Each helper returns immediately without waiting, so the figures are the cost of the call
+itself: yielding a generator or an unstarted ``@as_coro`` Coroutine (both run inline in the
+caller), compared with yielding a Coroutine that was already started separately.
+
+	python nestbench.py [calls]
+"""
+
+import sys
+import time
+
+from chiral.core import coroutine
+
+CALL_COUNT = 200000
+if len(sys.argv) > 1:
+	CALL_COUNT = int(sys.argv[1])
+
+# Nothing here ever waits, so there is no reactor to requeue to.
+coroutine.Coroutine.RESUME_BUDGET = None
+
+def helper(value):
+	"""Return value immediately."""
+	yield
+	raise StopIteration(value)
+
+as_coro_helper = coroutine.as_coro(helper)
+
+def call_generator():
+	for index in xrange(CALL_COUNT):
+		yield helper(index)
+
+def call_as_coro():
+	for index in xrange(CALL_COUNT):
+		yield as_coro_helper(index)
+
+def call_started():
+	for index in xrange(CALL_COUNT):
+		yield coroutine.Coroutine(helper(index), autostart=True)
+
+def call_nested(depth):
+	def nested(level):
+		if level:
+			result = yield nested(level - 1)
+			raise StopIteration(result)
+		yield
+	def caller():
+		for _index in xrange(CALL_COUNT // depth):
+			yield nested(depth)
+	return caller()
+
+def bench(name, gen, calls = CALL_COUNT):
+	coro = coroutine.Coroutine(gen)
+	start = time.time()
+	coro.start()
+	elapsed = time.time() - start
+	assert coro.state == coro.STATE_COMPLETED
+	print "%-28s %8d calls  %7.3f s  %6.2f us/call" % (name, calls, elapsed, elapsed * 1e6 / calls)
+
+bench("yield generator", call_generator())
+bench("yield @as_coro helper", call_as_coro())
+bench("yield started Coroutine", call_started())
+bench("generators nested 20 deep", call_nested(20), (CALL_COUNT // 20) * 20)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2.5
+
+"""
+Compare the available reactor backends on many concurrent socket round trips.
+
+Each of PAIR_COUNT socketpairs bounces a byte back and forth ROUNDS times, so every loop
+iteration has many waits to arm and many events to dispatch.
+
+	python reactorbench.py [pairs] [rounds]
+"""
+
+import socket
+import sys
+import time
+
+from chiral.core import coroutine
+from chiral.net import netcore
+
+PAIR_COUNT = 500
+ROUNDS = 200
+if len(sys.argv) > 1:
+	PAIR_COUNT = int(sys.argv[1])
+if len(sys.argv) > 2:
+	ROUNDS = int(sys.argv[2])
+
+def pinger(reactor, sock):
+	for _index in xrange(ROUNDS):
+		sock.send("x")
+		yield reactor.wait_for_readable(sock)
+		sock.recv(1)
+
+def ponger(reactor, sock):
+	for _index in xrange(ROUNDS):
+		yield reactor.wait_for_readable(sock)
+		sock.recv(1)
+		sock.send("x")
+
+def bench(reactor_class):
+	reactor = reactor_class()
+
+	pairs = [ socket.socketpair() for _index in xrange(PAIR_COUNT) ]
+	for left, right in pairs:
+		left.setblocking(0)
+		right.setblocking(0)
+		coroutine.Coroutine(ponger(reactor, right), autostart=True)
+		coroutine.Coroutine(pinger(reactor, left), autostart=True)
+
+	loops = [ 0 ]
+	run_once = reactor._run_once
+	def counting_run_once():
+		loops[0] += 1
+		return run_once()
+	reactor._run_once = counting_run_once
+
+	start = time.time()
+	reactor.run()
+	elapsed = time.time() - start
+
+	for left, right in pairs:
+		left.close()
+		right.close()
+
+	trips = PAIR_COUNT * ROUNDS
+	print "%-16s %8d round trips  %8.3f s  %6.2f us/trip  %6d loops" % (
+		reactor_class.__name__, trips, elapsed, elapsed * 1e6 / trips, loops[0])
+
+print "%d socketpairs, %d rounds each" % (PAIR_COUNT, ROUNDS)
+
+for name in "EpollReactor", "IoUringReactor", "KqueueReactor", "PollReactor":
+	cls = getattr(netcore, name, None)
+	if cls is None:
+		continue
+	if name == "IoUringReactor" and not cls.available():
+		print "%-16s not supported by this kernel" % (name, )
+		continue
+	bench(cls)
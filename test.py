@@ -52,6 +52,10 @@ ChiralShellServer(
 
 print "Running..."
 
+if "-coroprof" in sys.argv:
+	from chiral.core import profiler
+	coroutine_profiler = profiler.enable()
+
 if "-prof" in sys.argv:
 	import cProfile
 	def run():
@@ -61,3 +65,6 @@ else:
 	reactor.run()
 
 stats.dump()
+
+if "-coroprof" in sys.argv:
+	print "\n".join(coroutine_profiler.summary())
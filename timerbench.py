@@ -0,0 +1,51 @@
+#!/usr/bin/env python2.5
+
+"""
+Measure the per-timer cost of reactor.schedule with many pending timers.
+
+Times are process CPU time, so the reactor's sleeps between timers are not counted.
+"""
+
+import random
+import sys
+import time
+
+from chiral.core import coroutine
+from chiral.net import reactor
+
+TIMER_COUNT = 100000
+if len(sys.argv) > 1:
+	TIMER_COUNT = int(sys.argv[1])
+
+def sleeper(timer):
+	yield timer
+
+def report(label, count, elapsed):
+	print "%-28s %8d timers  %8.3f s  %6.2f us/timer" % (label, count, elapsed, elapsed * 1e6 / count)
+
+print "Scheduling %d timers..." % (TIMER_COUNT, )
+
+start = time.clock()
+timers = [ reactor.schedule(random.random()) for _index in xrange(TIMER_COUNT) ]
+report("schedule()", TIMER_COUNT, time.clock() - start)
+
+start = time.clock()
+coros = [ coroutine.Coroutine(sleeper(timer), autostart=True) for timer in timers ]
+report("bind (yield timer)", TIMER_COUNT, time.clock() - start)
+
+del timers
+
+victims = coros[::2]
+for coro in victims:
+	coro.add_completion_callback(coroutine.swallow_kill)
+
+start = time.clock()
+for coro in victims:
+	coro.kill()
+report("cancel (kill)", len(victims), time.clock() - start)
+
+del victims, coro
+
+start = time.clock()
+reactor.run()
+report("dispatch (reactor.run)", TIMER_COUNT - TIMER_COUNT // 2, time.clock() - start)